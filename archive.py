@@ -0,0 +1,401 @@
+# -*- encoding=utf-8 -*-
+# Pack old result/<run> folders into one zip per run and serve reports straight from the archives
+import os
+import json
+import time
+import shutil
+import zipfile
+import argparse
+import posixpath
+import threading
+import traceback
+import webbrowser
+from functools import partial
+from urllib.parse import unquote, urlsplit
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+from history import index_history
+from atomic_io import atomic_write, atomic_path
+from dashboard import update_dashboard, run_summary_file, dashboard_html_file, archive_ext
+
+result_root = os.path.join('.', 'result')
+archive_index_file = 'archives.json'
+run_name_format = '%Y_%m_%d_%H_%M_%S'
+
+# 已经压缩过的文件直接存储，不再浪费 CPU 压缩
+STORED_EXTS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.mp4', '.webm', '.zip', '.gz', '.apk')
+
+
+def run_time(run_dir):
+    """
+    :param run_dir: 运行目录，目录名为 create_time_folder 生成的时间。
+    :return: 运行开始的时间戳，目录名不是时间格式时使用目录的修改时间。
+    """
+    try:
+        return time.mktime(time.strptime(os.path.basename(os.path.normpath(run_dir)), run_name_format))
+    except ValueError:
+        return os.path.getmtime(run_dir)
+
+
+def is_completed(run_dir):
+    """
+    :param run_dir: 运行目录。
+    :return: 运行已经生成汇总报告时返回 True。
+    """
+    return any(os.path.isfile(os.path.join(run_dir, name)) for name in (run_summary_file, 'results.json'))
+
+
+def current_run_dir(json_path='data.json'):
+    """
+    :param json_path: 测试进度文件路径。
+    :return: data.json 中记录的运行目录（绝对路径），可以通过 --resume 继续，不能归档；没有时返回 None。
+    """
+    if not os.path.isfile(json_path):
+        return None
+    try:
+        with open(json_path, 'r', encoding='utf-8') as file:
+            log_dir_path = json.load(file).get('log_dir_path')
+        return os.path.normcase(os.path.abspath(log_dir_path)) if log_dir_path else None
+    except Exception:
+        traceback.print_exc()
+        return None
+
+
+def find_old_runs(root=None, days=30):
+    """
+    找出可以归档的运行：已经生成汇总报告、开始时间早于 days 天前，并且不是 data.json 正在使用的运行。
+
+    :param root: 结果根目录，默认为 ./result。
+    :param days: 保留多少天内的运行目录不归档。
+    :return: 运行目录列表，按时间从早到晚排序。
+    """
+    root = root or result_root
+    if not os.path.isdir(root):
+        return []
+    deadline = time.time() - days * 86400
+    current = current_run_dir()
+    runs = []
+    for name in sorted(os.listdir(root)):
+        run_dir = os.path.join(root, name)
+        if not os.path.isdir(run_dir) or os.path.normcase(os.path.abspath(run_dir)) == current:
+            continue
+        if is_completed(run_dir) and run_time(run_dir) < deadline:
+            runs.append(run_dir)
+    return runs
+
+
+def load_archive_index(root=None):
+    """
+    :param root: 结果根目录，默认为 ./result。
+    :return: {运行目录名: 归档信息} 字典。
+    """
+    path = os.path.join(root or result_root, archive_index_file)
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except Exception:
+        traceback.print_exc()
+        return {}
+
+
+def save_archive_index(index, root=None):
+    """
+    :param index: {运行目录名: 归档信息} 字典。
+    :param root: 结果根目录，默认为 ./result。
+    """
+    with atomic_write(os.path.join(root or result_root, archive_index_file)) as file:
+        json.dump(index, file, ensure_ascii=False, indent=1)
+
+
+def pack_run(run_dir, compresslevel=6):
+    """
+    把一个运行目录打包为同级的 <运行目录名>.zip，校验通过后删除原目录。
+
+    zip 的中央目录就是成员索引，查看报告时只需要读取索引和被请求的文件。
+
+    :param run_dir: 运行目录。
+    :param compresslevel: deflate 压缩级别。
+    :return: 归档信息字典：文件数、原始大小、归档大小。
+    """
+    run_dir = os.path.normpath(run_dir)
+    zip_path = run_dir + archive_ext
+    files, size = 0, 0
+    with atomic_path(zip_path) as tmp_path:
+        with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as archive:
+            for root, dirs, names in os.walk(run_dir):
+                dirs.sort()
+                for name in sorted(names):
+                    path = os.path.join(root, name)
+                    member = os.path.relpath(path, run_dir).replace(os.sep, '/')
+                    compress_type = zipfile.ZIP_STORED if name.lower().endswith(STORED_EXTS) else zipfile.ZIP_DEFLATED
+                    archive.write(path, member, compress_type=compress_type)
+                    files += 1
+                    size += os.path.getsize(path)
+
+        # 先确认归档完整可读，校验失败时不替换，原目录保持不变
+        with zipfile.ZipFile(tmp_path) as archive:
+            bad = archive.testzip()
+        if bad is not None:
+            raise zipfile.BadZipFile(f"{zip_path} 中的 {bad} 校验失败")
+    shutil.rmtree(run_dir)
+    return {'files': files, 'size': size, 'packed': os.path.getsize(zip_path), 'time': time.time()}
+
+
+def archive_runs(root=None, days=30, dry_run=False):
+    """
+    归档早于 days 天前的运行目录，每个运行一个 zip。
+
+    归档前先把步骤耗时写入历史记录，归档后更新跨运行的汇总页面，归档的运行仍然可以通过 serve 查看。
+
+    :param root: 结果根目录，默认为 ./result。
+    :param days: 保留多少天内的运行目录不归档。
+    :param dry_run: 只列出要归档的运行，不做修改。
+    :return: 归档的运行目录名列表。
+    """
+    root = root or result_root
+    runs = find_old_runs(root, days)
+    if dry_run:
+        for run_dir in runs:
+            print(f"将归档 {run_dir}")
+        return [os.path.basename(run_dir) for run_dir in runs]
+    if not runs:
+        return []
+
+    index_history(root)
+    index = load_archive_index(root)
+    archived = []
+    for run_dir in runs:
+        name = os.path.basename(run_dir)
+        try:
+            info = pack_run(run_dir)
+        except Exception:
+            traceback.print_exc()
+            continue
+        index[name] = info
+        archived.append(name)
+        print(f"已归档 {name}：{info['files']}个文件，{info['size'] / 1024 / 1024:.1f}MB -> "
+              f"{info['packed'] / 1024 / 1024:.1f}MB")
+        # 每归档一个运行就保存索引，中途中断时索引和 zip 保持一致
+        save_archive_index(index, root)
+
+    try:
+        update_dashboard(root)
+    except Exception:
+        traceback.print_exc()
+    return archived
+
+
+class OpenArchive:
+    """
+    ArchiveReader 中缓存的一个 zip：记录正在读取它的请求数，被淘汰时等最后一个请求读完再关闭。
+    """
+
+    def __init__(self, path, mtime):
+        self.zip = zipfile.ZipFile(path)
+        self.mtime = mtime
+        self.users = 0
+        self.evicted = False
+
+
+class ArchiveMember:
+    """
+    归档中一个成员的只读文件对象，关闭时释放对 zip 的引用。
+    """
+
+    def __init__(self, reader, archive, info):
+        self.reader = reader
+        self.archive = archive
+        self.info = info
+        self.file = archive.zip.open(info)
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def close(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        self.reader.release(self.archive)
+
+
+class ArchiveReader:
+    """
+    按需读取归档中的文件：每个 zip 只读取一次中央目录，之后只解压被请求的成员。
+    """
+
+    def __init__(self, root=None, max_open=32):
+        """
+        :param root: 结果根目录，默认为 ./result。
+        :param max_open: 同时保持打开的 zip 数量。
+        """
+        self.root = root or result_root
+        self.max_open = max_open
+        self.archives = {}
+        self.lock = threading.Lock()
+
+    def _evict(self, run):
+        """
+        从缓存中移除一个 zip，没有请求在读取时立即关闭。调用时需要持有 self.lock。
+
+        :param run: 运行目录名。
+        """
+        archive = self.archives.pop(run)
+        archive.evicted = True
+        if archive.users == 0:
+            archive.zip.close()
+
+    def acquire(self, run):
+        """
+        :param run: 运行目录名。
+        :return: 增加了引用计数的 OpenArchive，用完后调用 release()；归档不存在时返回 None。
+        """
+        zip_path = os.path.join(self.root, run + archive_ext)
+        try:
+            mtime = os.path.getmtime(zip_path)
+        except OSError:
+            return None
+        with self.lock:
+            archive = self.archives.get(run)
+            if archive is None or archive.mtime != mtime:
+                if archive is not None:
+                    self._evict(run)
+                if len(self.archives) >= self.max_open:
+                    # 淘汰最早打开的归档
+                    self._evict(next(iter(self.archives)))
+                archive = self.archives[run] = OpenArchive(zip_path, mtime)
+            archive.users += 1
+            return archive
+
+    def release(self, archive):
+        """
+        :param archive: acquire() 返回的 OpenArchive。
+        """
+        with self.lock:
+            archive.users -= 1
+            if archive.evicted and archive.users == 0:
+                archive.zip.close()
+
+    def open(self, path):
+        """
+        :param path: 相对结果根目录的路径，例如 2024_11_27_18_33_44/report.html。
+        :return: ArchiveMember，不在归档中时返回 None。
+        """
+        run, _, member = path.partition('/')
+        if not run or not member:
+            return None
+        archive = self.acquire(run)
+        if archive is None:
+            return None
+        try:
+            info = archive.zip.getinfo(member)
+        except KeyError:
+            self.release(archive)
+            return None
+        try:
+            return ArchiveMember(self, archive, info)
+        except Exception:
+            self.release(archive)
+            raise
+
+    def exists(self, path):
+        """
+        :param path: 相对结果根目录的路径。
+        :return: 文件在归档中时返回 True。
+        """
+        run, _, member = path.partition('/')
+        archive = self.acquire(run) if run and member else None
+        if archive is None:
+            return False
+        try:
+            return member in archive.zip.NameToInfo
+        finally:
+            self.release(archive)
+
+    def close(self):
+        with self.lock:
+            for run in list(self.archives):
+                self._evict(run)
+
+
+class ArchiveRequestHandler(SimpleHTTPRequestHandler):
+    """
+    提供结果根目录的静态文件服务：磁盘上存在的文件直接返回，已归档的运行从 zip 中解压被请求的文件。
+    """
+
+    reader = None
+
+    def send_head(self):
+        path = posixpath.normpath(unquote(urlsplit(self.path).path)).lstrip('/')
+        if path in ('', '.') and os.path.isfile(os.path.join(self.directory, dashboard_html_file)):
+            self.send_response(302)
+            self.send_header('Location', '/' + dashboard_html_file)
+            self.end_headers()
+            return None
+        if path.startswith('..') or os.path.exists(os.path.join(self.directory, path)):
+            return super().send_head()
+
+        member = self.reader.open(path)
+        if member is None:
+            # 运行目录本身跳转到汇总报告，报告中的相对路径才能正确解析
+            if self.reader.exists(path + '/report.html'):
+                self.send_response(301)
+                self.send_header('Location', '/' + path + '/report.html')
+                self.end_headers()
+            else:
+                self.send_error(404, "File not found")
+            return None
+        try:
+            self.send_response(200)
+            self.send_header('Content-type', self.guess_type(member.info.filename))
+            self.send_header('Content-Length', str(member.info.file_size))
+            self.end_headers()
+        except Exception:
+            member.close()
+            raise
+        # do_GET 复制完内容后关闭，释放对 zip 的引用
+        return member
+
+
+def serve(root=None, port=8000, open_browser=False):
+    """
+    启动本地报告服务，已归档的运行和未归档的运行使用同样的地址：http://localhost:<port>/<运行目录名>/report.html。
+
+    :param root: 结果根目录，默认为 ./result。
+    :param port: 端口。
+    :param open_browser: 是否在浏览器中打开汇总页面。
+    """
+    root = root or result_root
+    reader = ArchiveReader(root)
+    handler = type('Handler', (ArchiveRequestHandler,), {'reader': reader})
+    server = ThreadingHTTPServer(('127.0.0.1', port), partial(handler, directory=root))
+    url = f"http://localhost:{server.server_address[1]}/"
+    print(f"报告服务：{url}，按 Ctrl+C 停止")
+    if open_browser:
+        webbrowser.open(url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        reader.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='归档旧的运行目录，并从归档中查看报告')
+    parser.add_argument('command', choices=['pack', 'serve'],
+                        help='pack：把旧的运行目录打包为 zip；serve：启动本地报告服务，直接从 zip 中读取报告')
+    parser.add_argument('--root', default=None, help='结果根目录，默认为 ./result')
+    parser.add_argument('--days', type=float, default=30, help='pack：保留多少天内的运行目录不归档')
+    parser.add_argument('--dry-run', action='store_true', help='pack：只列出要归档的运行目录')
+    parser.add_argument('--port', type=int, default=8000, help='serve：端口')
+    parser.add_argument('--open', action='store_true', help='serve：在浏览器中打开汇总页面')
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        print(f"归档了{len(archive_runs(args.root, args.days, args.dry_run))}个运行目录")
+    else:
+        serve(args.root, args.port, args.open)
@@ -0,0 +1,57 @@
+# -*- encoding=utf-8 -*-
+# Write-to-temp-then-replace helpers shared by every module that rewrites files in place
+import os
+import threading
+from contextlib import contextmanager
+
+
+def temp_path_for(path, keep_ext=False):
+    """
+    :param path: 目标文件路径。
+    :param keep_ext: 临时文件是否保留目标文件的扩展名，例如 pandas 按扩展名选择 Excel 引擎。
+    :return: 同一目录下的临时文件路径，不同进程和线程同时写同一个文件时互不影响。
+    """
+    tag = f"{os.getpid()}.{threading.get_ident()}.tmp"
+    if keep_ext:
+        root, ext = os.path.splitext(path)
+        return f"{root}.{tag}{ext}"
+    return f"{path}.{tag}"
+
+
+@contextmanager
+def atomic_path(path, keep_ext=False):
+    """
+    原子地替换文件：调用方写入 yield 出的临时文件，正常退出时用 os.replace 替换目标文件；
+    出错时删除临时文件，目标文件保持原样。
+
+    :param path: 目标文件路径。
+    :param keep_ext: 临时文件是否保留目标文件的扩展名。
+    """
+    tmp_path = temp_path_for(path, keep_ext)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+@contextmanager
+def atomic_write(path, mode='w', encoding='utf-8', fsync=False):
+    """
+    以 atomic_path 的方式打开文件写入，读者只会看到完整的旧文件或新文件。
+
+    :param path: 目标文件路径。
+    :param mode: 打开模式，'w' 或 'wb'。
+    :param encoding: 文本模式的编码。
+    :param fsync: 替换前是否把内容刷到磁盘，用于进程被强制结束后也不能丢失的文件。
+    """
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, mode, encoding=None if 'b' in mode else encoding) as file:
+            yield file
+            if fsync:
+                file.flush()
+                os.fsync(file.fileno())
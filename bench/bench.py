@@ -0,0 +1,319 @@
+# -*- encoding=utf-8 -*-
+# Orchestrator scaling benchmark on a simulated device rack (fake adb + fake airtest)
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import traceback
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(bench_dir)
+fakes_dir = os.path.join(bench_dir, 'fakes')
+baseline_path = os.path.join(bench_dir, 'baseline.json')
+
+# 运行设置不同的结果不能比较：CPU 核数和实际使用的并发数
+SETTINGS = ('cpu_count', 'max_jobs', 'report_workers')
+
+# 与基线比较的指标，以及各指标允许的绝对误差（数值很小时相对误差没有意义）
+COMPARED_METRICS = {
+    'makespan_s': 1.0,
+    'time_to_summary_s': 0.5,
+    'cpu_s': 0.5,
+    'peak_rss_mb': 10,
+    'peak_processes': 2,
+}
+
+
+def write_wrapper(path, command):
+    """
+    写入一个可执行的包装脚本，run.py 通过 PATH 找到它。
+
+    :param path: 脚本路径。
+    :param command: 要执行的命令。
+    """
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(f'#!/bin/sh\nexec {command} "$@"\n')
+    os.chmod(path, 0o755)
+
+
+def prepare_workspace(workspace, config):
+    """
+    准备一次模拟运行的工作目录：配置文件、假的 adb 和 airtest、模拟脚本、设备信息表和汇总报告模板。
+
+    :param workspace: 工作目录。
+    :param config: 模拟配置。
+    :return: (配置文件路径, 包装脚本目录, 脚本路径列表)。
+    """
+    sys.path[:0] = [fakes_dir, repo_dir]
+    import fake_sim
+    import pandas as pd
+    from devices.DeviceRegistry import DEVICE_INFO_COLUMNS
+
+    config_path = os.path.join(workspace, 'bench_config.json')
+    with open(config_path, 'w', encoding='utf-8') as file:
+        json.dump(config, file, indent=4)
+
+    bin_dir = os.path.join(workspace, 'bin')
+    os.makedirs(bin_dir)
+    write_wrapper(os.path.join(bin_dir, 'adb'), f'"{sys.executable}" "{os.path.join(fakes_dir, "fake_adb.py")}"')
+    write_wrapper(os.path.join(bin_dir, 'airtest'), f'"{sys.executable}" -m airtest')
+
+    scripts = []
+    for index in range(config['scripts']):
+        air = os.path.join(workspace, f"bench_{index}.air")
+        os.makedirs(air)
+        with open(os.path.join(air, f"bench_{index}.py"), 'w', encoding='utf-8') as file:
+            file.write("# simulated script\n")
+        scripts.append(air)
+
+    # 设备信息表中已经登记了所有模拟设备，与长期使用的设备机架相同
+    os.makedirs(os.path.join(workspace, 'devices'))
+    records = [fake_sim.device_record(serial) for serial in fake_sim.serials(fake_sim.load_config(config_path))]
+    pd.DataFrame(records, columns=DEVICE_INFO_COLUMNS).to_excel(
+        os.path.join(workspace, 'devices', 'device_info.xlsx'), sheet_name='base_info', index=False)
+    shutil.copy(os.path.join(repo_dir, 'report_tpl.html'), workspace)
+    return config_path, bin_dir, scripts
+
+
+def count_processes(root_pid):
+    """
+    :param root_pid: 进程号。
+    :return: 这个进程及其所有子孙进程的数量，没有 /proc 时返回 None。
+    """
+    if not os.path.isdir('/proc'):
+        return None
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as file:
+                stat = file.read()
+        except OSError:
+            continue
+        # 进程名中可能有空格，从最后一个右括号之后开始按位置读取
+        ppid = int(stat[stat.rfind(')') + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    count, pending = 0, [root_pid]
+    while pending:
+        pid = pending.pop()
+        count += 1
+        pending.extend(children.get(pid, []))
+    return count
+
+
+def run_scenario(name, config, max_jobs=None, report_workers=None, keep=False, verbose=False):
+    """
+    在独立的进程中运行一次模拟测试，父进程采样进程数量。
+
+    :param name: 场景名称。
+    :param config: 模拟配置。
+    :param max_jobs: 同时运行的最大任务数，默认与 run.py 相同。
+    :param report_workers: 同时生成报告的最大数量，默认与 run.py 相同。
+    :param keep: 是否保留工作目录。
+    :param verbose: 是否显示 run.py 的输出。
+    :return: 指标字典。
+    """
+    workspace = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    try:
+        config_path, bin_dir, scripts = prepare_workspace(workspace, config)
+        env = dict(os.environ)
+        env['PATH'] = bin_dir + os.pathsep + env.get('PATH', '')
+        env['PYTHONPATH'] = os.pathsep.join([fakes_dir, repo_dir] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+        env['BENCH_CONFIG'] = config_path
+        # 不在模拟运行结束时打开浏览器
+        env['BROWSER'] = 'true'
+        metrics_path = os.path.join(workspace, 'metrics.json')
+        command = [sys.executable, os.path.abspath(__file__), '--worker', metrics_path,
+                   '--max-jobs', str(max_jobs or 0), '--report-workers', str(report_workers or 0)] + scripts
+        output = None if verbose else subprocess.DEVNULL
+        process = subprocess.Popen(command, cwd=workspace, env=env, stdout=output, stderr=output)
+        peak = 0
+        while process.poll() is None:
+            peak = max(peak, count_processes(process.pid) or 0)
+            time.sleep(0.1)
+        if process.returncode != 0 or not os.path.isfile(metrics_path):
+            raise RuntimeError(f"scenario {name} failed with exit code {process.returncode}")
+        with open(metrics_path, 'r', encoding='utf-8') as file:
+            metrics = json.load(file)
+        metrics['peak_processes'] = peak if os.path.isdir('/proc') else None
+        return metrics
+    finally:
+        if keep:
+            print(f"workspace: {workspace}")
+        else:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+
+def worker_main(metrics_path, scripts, max_jobs=None, report_workers=None):
+    """
+    在模拟的工作目录中运行 run.py，并把指标写入 metrics_path。
+
+    :param metrics_path: 指标文件路径。
+    :param scripts: 模拟脚本路径列表。
+    :param max_jobs: 同时运行的最大任务数。
+    :param report_workers: 同时生成报告的最大数量。
+    """
+    import resource
+    sys.path[:0] = [fakes_dir, repo_dir]
+    import run
+    from devices.Device import probe_devices
+
+    start = time.time()
+    devices = list(probe_devices())
+    probed = time.time()
+    run.run(devices, scripts, run_all=True, max_jobs=max_jobs, report_workers=report_workers)
+    end = time.time()
+
+    with open('data.json', 'r', encoding='utf-8') as file:
+        run_dir = json.load(file)['log_dir_path']
+    log_mtimes = [os.path.getmtime(os.path.join(root, 'log.txt')) for root, dirs, files in os.walk(run_dir)
+                  if 'log.txt' in files]
+    report_html = os.path.join(run_dir, 'report.html')
+    with open(os.path.join(run_dir, 'results.json'), 'r', encoding='utf-8') as file:
+        tests = json.load(file)['tests']
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    metrics = {
+        'devices': len(devices),
+        'jobs': len(tests),
+        'failed': sum(1 for item in tests.values() if item.get('status') != 0),
+        'probe_s': round(probed - start, 3),
+        'makespan_s': round(end - start, 3),
+        # 最后一个任务结束到汇总报告写完的时间
+        'time_to_summary_s': round(os.path.getmtime(report_html) - max(log_mtimes), 3) if log_mtimes else None,
+        'cpu_s': round(usage.ru_utime + usage.ru_stime, 3),
+        'children_cpu_s': round(children.ru_utime + children.ru_stime, 3),
+        # Linux 上 ru_maxrss 的单位是 KB
+        'peak_rss_mb': round(usage.ru_maxrss / 1024, 1),
+    }
+    with open(metrics_path, 'w', encoding='utf-8') as file:
+        json.dump(metrics, file, indent=4)
+
+
+def setting_mismatches(results, baseline):
+    """
+    :param results: {场景: 指标} 字典，指标中的 config 包含模拟配置和运行设置。
+    :param baseline: 基线的 {场景: 指标} 字典。
+    :return: [(场景, 配置项, 基线值, 当前值)] 列表，模拟配置或运行设置与基线不同时不能比较。
+    """
+    mismatches = []
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        config, base_config = metrics.get('config', {}), base.get('config', {})
+        for key in sorted(set(config) | set(base_config)):
+            if config.get(key) != base_config.get(key):
+                mismatches.append((name, key, base_config.get(key), config.get(key)))
+    return mismatches
+
+
+def compare(results, baseline, tolerance):
+    """
+    与基线比较，找出变差的指标。
+
+    :param results: {场景: 指标} 字典。
+    :param baseline: 基线的 {场景: 指标} 字典。
+    :param tolerance: 允许的相对变化，例如 0.2 表示 20%。
+    :return: [(场景, 指标, 基线值, 当前值)] 列表。
+    """
+    regressions = []
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric, slack in COMPARED_METRICS.items():
+            if metrics.get(metric) is None or base.get(metric) is None:
+                continue
+            if metrics[metric] > base[metric] * (1 + tolerance) + slack:
+                regressions.append((name, metric, base[metric], metrics[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='在模拟的设备机架上测量 run.py 的调度、报告和设备信息处理的开销')
+    parser.add_argument('--devices', default='10,100', help='模拟的设备数量，多个场景用逗号分隔，例如 10,100,500')
+    parser.add_argument('--scripts', type=int, default=1, help='每台设备运行的脚本数量')
+    parser.add_argument('--duration', type=float, default=1.0, help='每个脚本的平均运行时长（秒）')
+    parser.add_argument('--jitter', type=float, default=0.3, help='运行时长的随机浮动比例')
+    parser.add_argument('--failure-rate', type=float, default=0.1, help='脚本失败的概率')
+    parser.add_argument('--log-size', type=int, default=64 * 1024, help='每个 log.txt 的大小（字节）')
+    parser.add_argument('--report-cost', type=float, default=0.1, help='生成一份报告的 CPU 时间（秒）')
+    parser.add_argument('--adb-latency', type=float, default=0.005, help='每条 adb 命令的延迟（秒）')
+    parser.add_argument('-j', '--max-jobs', type=int, default=None, help='同时运行的最大任务数，默认为 CPU 核数')
+    parser.add_argument('--report-workers', type=int, default=None, help='同时生成报告的最大数量，默认为 CPU 核数')
+    parser.add_argument('--save-baseline', action='store_true', help='把结果保存为基线')
+    parser.add_argument('--compare', action='store_true', help='与基线比较，有指标变差时返回非零退出码')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='与基线比较时允许的相对变化')
+    parser.add_argument('--baseline', default=baseline_path, help='基线文件路径')
+    parser.add_argument('--keep', action='store_true', help='保留模拟运行的工作目录')
+    parser.add_argument('-v', '--verbose', action='store_true', help='显示 run.py 的输出')
+    parser.add_argument('--worker', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('worker_scripts', nargs='*', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker_main(args.worker, args.worker_scripts, args.max_jobs or None, args.report_workers or None)
+        return 0
+
+    # 与 run.py 相同，没有指定并发数时使用 CPU 核数
+    settings = {'cpu_count': os.cpu_count(), 'max_jobs': args.max_jobs or os.cpu_count() or 1,
+                'report_workers': args.report_workers or os.cpu_count() or 1}
+    baseline = None
+    if args.compare:
+        if not os.path.isfile(args.baseline):
+            print(f"未找到基线文件：{args.baseline}")
+            return 1
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file).get('results', {})
+
+    results = {}
+    for devices in [int(value) for value in args.devices.split(',') if value.strip()]:
+        name = f"{devices}dev"
+        config = {'devices': devices, 'scripts': args.scripts, 'duration': args.duration, 'jitter': args.jitter,
+                  'failure_rate': args.failure_rate, 'log_size': args.log_size, 'report_cost': args.report_cost,
+                  'adb_latency': args.adb_latency}
+        if baseline is not None:
+            # 运行前检查，设置不同时不浪费时间运行
+            mismatches = setting_mismatches({name: {'config': {**config, **settings}}}, baseline)
+            for _, key, base, value in mismatches:
+                print(f"{name} 的 {key} 与基线不同（基线 {base}，当前 {value}），不能比较")
+            if mismatches:
+                return 1
+        try:
+            results[name] = {'config': {**config, **settings},
+                             **run_scenario(name, config, settings['max_jobs'], settings['report_workers'],
+                                            args.keep, args.verbose)}
+        except Exception:
+            traceback.print_exc()
+            return 1
+        metrics = results[name]
+        print(f"{name}: jobs={metrics['jobs']} failed={metrics['failed']} makespan={metrics['makespan_s']}s "
+              f"probe={metrics['probe_s']}s time_to_summary={metrics['time_to_summary_s']}s cpu={metrics['cpu_s']}s "
+              f"children_cpu={metrics['children_cpu_s']}s rss={metrics['peak_rss_mb']}MB "
+              f"processes={metrics['peak_processes']}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for name, metric, base, value in regressions:
+            print(f"REGRESSION {name} {metric}: {base} -> {value}")
+        if regressions:
+            return 1
+        print("与基线相比没有变差的指标")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump({'python': sys.version.split()[0], 'cpu_count': os.cpu_count(), 'results': results}, file,
+                      indent=4)
+        print(f"基线已保存到 {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
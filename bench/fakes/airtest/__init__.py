@@ -0,0 +1,2 @@
+# -*- encoding=utf-8 -*-
+# Fake airtest package for the benchmark: only the entry points the runner uses
@@ -0,0 +1,60 @@
+# -*- encoding=utf-8 -*-
+# Stand-in for `airtest run`: writes a log.txt of the configured size over the configured duration
+import os
+import sys
+import json
+import time
+import argparse
+
+import fake_sim
+
+
+def run(air, device, log_dir):
+    """
+    模拟运行一个脚本：按配置的时长逐步写入 log.txt，按失败率返回退出码。
+
+    :param air: 脚本路径。
+    :param device: 设备连接字符串，例如 Android:///fake0001。
+    :param log_dir: 日志目录。
+    :return: 退出码。
+    """
+    config = fake_sim.load_config()
+    serial = device.rsplit('/', 1)[-1]
+    rng = fake_sim.rng_for(config, serial, os.path.basename(os.path.normpath(air)),
+                          os.path.basename(os.path.normpath(log_dir)))
+    duration = max(0.0, config['duration'] * (1 + rng.uniform(-config['jitter'], config['jitter'])))
+    failed = rng.random() < config['failure_rate']
+    steps = max(1, config['steps'])
+    padding = 'x' * max(0, config['log_size'] // steps - 200)
+
+    os.makedirs(log_dir, exist_ok=True)
+    with open(os.path.join(log_dir, 'log.txt'), 'w', encoding='utf-8') as file:
+        for step in range(steps):
+            start = time.time()
+            time.sleep(duration / steps)
+            data = {'name': 'touch', 'call_args': {'v': padding}, 'start_time': start, 'end_time': time.time(),
+                    'ret': [step, step]}
+            if failed and step == steps - 1:
+                data['traceback'] = 'AssertionError: simulated failure'
+            file.write(json.dumps({'tag': 'function', 'depth': 1, 'time': time.time(), 'data': data}) + '\n')
+            file.flush()
+    return 1 if failed else 0
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='airtest')
+    subparsers = parser.add_subparsers(dest='command')
+    run_parser = subparsers.add_parser('run')
+    run_parser.add_argument('script')
+    run_parser.add_argument('--device', default='Android:///')
+    run_parser.add_argument('--log', default='log')
+    run_parser.add_argument('--recording', action='store_true')
+    args = parser.parse_args(argv)
+    if args.command != 'run':
+        parser.print_help()
+        return 2
+    return run(args.script, args.device, args.log)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,14 @@
+# -*- encoding=utf-8 -*-
+# Fake airtest ADB: lists the simulated devices
+import fake_sim
+
+
+class ADB:
+
+    def devices(self, state=None):
+        """
+        :param state: 只返回这个状态的设备。
+        :return: [(序列号, 状态)] 列表。
+        """
+        return [(serial, 'device') for serial in fake_sim.serials(fake_sim.load_config())
+                if state in (None, 'device')]
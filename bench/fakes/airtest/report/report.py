@@ -0,0 +1,31 @@
+# -*- encoding=utf-8 -*-
+# Fake airtest report: burns the configured CPU time and writes a small log.html
+import os
+
+import fake_sim
+
+HTML_TPL = 'log_template.html'
+STATIC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class LogToHtml:
+
+    def __init__(self, script_root, log_root='', static_root='', script_name='', lang='en', **kwargs):
+        self.script_root = script_root
+        self.log_root = log_root
+        self.script_name = script_name
+        self.lang = lang
+
+    def report(self, template_name=HTML_TPL, output_file=None, **kwargs):
+        """
+        模拟生成报告：CPU 时间为 report_cost + 日志大小 × report_cost_per_mb。
+
+        :param template_name: 模板名称，不使用。
+        :param output_file: 报告文件路径。
+        """
+        config = fake_sim.load_config()
+        log_txt = os.path.join(self.log_root, 'log.txt')
+        size = os.path.getsize(log_txt) if os.path.isfile(log_txt) else 0
+        fake_sim.burn_cpu(config['report_cost'] + size / (1024 * 1024) * config['report_cost_per_mb'])
+        with open(output_file or os.path.join(self.log_root, 'log.html'), 'w', encoding='utf-8') as file:
+            file.write(f"<html><body>{self.script_name} {size} bytes</body></html>")
@@ -0,0 +1,63 @@
+# -*- encoding=utf-8 -*-
+# Stand-in for the adb executable, answering the commands the runner sends to devices
+import sys
+import time
+
+import fake_sim
+
+SNAPSHOT_SEPARATOR = '----device-snapshot----'
+
+
+def shell(serial, command):
+    """
+    按分号拆分 shell 命令，逐条模拟执行。
+
+    :param serial: 设备序列号。
+    :param command: shell 命令。
+    :return: 输出文本。
+    """
+    props = fake_sim.device_props(serial)
+    ram_kb = fake_sim.device_record(serial)['RAM'] * 1024 * 1024 - 300000
+    output = []
+    for part in command.split(';'):
+        part = part.strip()
+        if part.startswith('echo '):
+            output.append(part[len('echo '):].strip())
+        elif part == 'getprop':
+            output.extend(f"[{name}]: [{value}]" for name, value in props.items())
+        elif part.startswith('getprop '):
+            output.append(props.get(part.split()[1], ''))
+        elif part == 'cat /proc/cpuinfo':
+            output.append(f"processor\t: 0\nHardware\t: {fake_sim.device_record(serial)['SoC']}")
+        elif part == 'cat /proc/meminfo':
+            output.append(f"MemTotal:       {ram_kb} kB\nMemFree:         1000000 kB")
+        elif part.startswith('dumpsys package ') and 'versionCode' in part:
+            output.append("    versionCode=100 minSdk=21 targetSdk=33")
+        elif part.startswith('pm list packages'):
+            output.append(f"package:{part.split()[-1]}")
+    return '\n'.join(output)
+
+
+def main(argv):
+    config = fake_sim.load_config()
+    serial = None
+    if len(argv) >= 2 and argv[0] == '-s':
+        serial, argv = argv[1], argv[2:]
+    if not argv:
+        return 1
+    time.sleep(config['adb_latency'])
+
+    command = argv[0]
+    if command == 'devices':
+        print("List of devices attached")
+        for item in fake_sim.serials(config):
+            print(f"{item}\tdevice")
+    elif command == 'shell':
+        print(shell(serial, ' '.join(argv[1:])))
+    elif command in ('install', 'uninstall'):
+        print("Success")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,120 @@
+# -*- encoding=utf-8 -*-
+# Shared configuration of the simulated device rack used by the fake adb and airtest
+import os
+import json
+import time
+import random
+
+# 模拟配置文件的路径通过环境变量传给 fake adb、fake airtest 和报告进程
+config_env = 'BENCH_CONFIG'
+
+DEFAULTS = {
+    'devices': 10,              # 模拟的设备数量
+    'scripts': 1,               # 每台设备运行的脚本数量
+    'duration': 1.0,            # 每个脚本的平均运行时长（秒）
+    'jitter': 0.3,              # 运行时长的随机浮动比例
+    'failure_rate': 0.1,        # 脚本失败的概率
+    'steps': 10,                # log.txt 中的顶层步骤数
+    'log_size': 64 * 1024,      # 每个 log.txt 的大小（字节）
+    'report_cost': 0.1,         # 生成一份报告的 CPU 时间（秒）
+    'report_cost_per_mb': 0.5,  # 每 MB 日志额外的 CPU 时间（秒）
+    'adb_latency': 0.005,       # 每条 adb 命令的延迟（秒）
+    'seed': 1,
+}
+
+BRANDS = ['Xiaomi', 'HUAWEI', 'samsung', 'OPPO', 'vivo', 'OnePlus']
+ANDROID_VERSIONS = ['9', '10', '11', '12', '13', '14']
+SOCS = ['Qualcomm Technologies, Inc SM8550', 'MT6893', 'Hisilicon Kirin 9000', 'Samsung Exynos 2100']
+RAM_GB = [4, 6, 8, 12]
+
+
+def load_config(path=None):
+    """
+    :param path: 模拟配置文件路径，默认读取环境变量 BENCH_CONFIG。
+    :return: 合并了默认值的配置字典。
+    """
+    config = dict(DEFAULTS)
+    path = path or os.environ.get(config_env)
+    if path and os.path.isfile(path):
+        with open(path, 'r', encoding='utf-8') as file:
+            config.update(json.load(file))
+    return config
+
+
+def serials(config):
+    """
+    :param config: 模拟配置。
+    :return: 模拟设备的序列号列表。
+    """
+    return [f"fake{index:04d}" for index in range(config['devices'])]
+
+
+def device_index(serial):
+    """
+    :param serial: 模拟设备的序列号。
+    :return: 设备编号。
+    """
+    return int(serial[4:]) if serial.startswith('fake') and serial[4:].isdigit() else 0
+
+
+def device_props(serial):
+    """
+    :param serial: 模拟设备的序列号。
+    :return: 设备的 getprop 属性字典，按设备编号循环分配品牌、系统版本等属性。
+    """
+    index = device_index(serial)
+    brand = BRANDS[index % len(BRANDS)]
+    release = ANDROID_VERSIONS[index // len(BRANDS) % len(ANDROID_VERSIONS)]
+    return {
+        'ro.product.brand': brand,
+        'ro.product.model': f"{brand}-M{index % 7}",
+        'ro.product.name': f"{brand.lower()}_{index % 7}",
+        'ro.product.marketname': f"{brand} {index % 7}",
+        'ro.config.marketing_name': f"{brand} {index % 7}",
+        'ro.product.cert': f"{brand[:2].upper()}{index:04d}",
+        'ro.build.version.release': release,
+        'ro.build.version.sdk': str(28 + ANDROID_VERSIONS.index(release)),
+        'ro.build.fingerprint': f"{brand}/{brand.lower()}_{index % 7}/{release}:user/release-keys",
+    }
+
+
+def device_record(serial):
+    """
+    :param serial: 模拟设备的序列号。
+    :return: device_info.xlsx 中这台设备的一行，列与 DEVICE_INFO_COLUMNS 相同。
+    """
+    index = device_index(serial)
+    props = device_props(serial)
+    return {
+        '序号': index,
+        '序列号': serial,
+        '品牌': props['ro.product.brand'],
+        '名称': props['ro.product.name'],
+        '型号': props['ro.product.model'],
+        '安卓版本': props['ro.build.version.release'],
+        'SoC': SOCS[index % len(SOCS)],
+        'RAM': RAM_GB[index // 3 % len(RAM_GB)],
+    }
+
+
+def rng_for(config, *parts):
+    """
+    :param config: 模拟配置。
+    :param parts: 区分随机序列的值，例如设备序列号和日志目录。
+    :return: 确定性的随机数生成器，同样的配置每次模拟的结果相同。
+    """
+    return random.Random('|'.join([str(config['seed'])] + [str(part) for part in parts]))
+
+
+def burn_cpu(seconds):
+    """
+    占用 CPU 一段时间，模拟生成报告等计算密集的工作。
+
+    :param seconds: CPU 时间（秒）。
+    """
+    deadline = time.process_time() + seconds
+    value = 0
+    while time.process_time() < deadline:
+        for number in range(1000):
+            value += number * number
+    return value
@@ -0,0 +1,178 @@
+# -*- encoding=utf-8 -*-
+# Cross-run dashboard built incrementally from each run's summary.json
+import os
+import json
+import time
+import zipfile
+import webbrowser
+import traceback
+
+from jinja2 import Environment, FileSystemLoader
+
+from atomic_io import atomic_write
+
+result_root = os.path.join('.', 'result')
+run_summary_file = 'summary.json'
+dashboard_cache_file = 'dashboard.json'
+dashboard_data_file = 'dashboard.js'
+dashboard_html_file = 'dashboard.html'
+# archive.py 归档后的运行是结果根目录下的 <运行目录名>.zip
+archive_ext = '.zip'
+# 计为成功的任务状态，cached 是复用结果缓存的成功结果
+SUCCESS_STATES = ('success', 'cached')
+
+
+def row_state(item):
+    """
+    :param item: data['tests'] 中的一项。
+    :return: 任务状态：success / failed / timeout / disconnected / quarantined。
+    """
+    if item.get('state') in ('timeout', 'disconnected', 'quarantined'):
+        return item['state']
+    return 'success' if item.get('status') == 0 else 'failed'
+
+
+def summarize_run(data, rows):
+    """
+    生成一次运行的摘要，用于跨运行的汇总页面。
+
+    :param data: 包含所有测试数据的字典。
+    :param rows: 汇总报告的结果索引。
+    :return: 摘要字典。
+    """
+    states, brands = {}, {}
+    for row in rows:
+        states[row['state']] = states.get(row['state'], 0) + 1
+        brand = brands.setdefault(row.get('brand') or 'NULL', [0, 0])
+        brand[0] += row['state'] in SUCCESS_STATES
+        brand[1] += 1
+    return {
+        'script': data.get('script'),
+        'start': data.get('start'),
+        'time': round(time.time() - data['start'], 3) if data.get('start') else None,
+        'success': sum(states.get(state, 0) for state in SUCCESS_STATES),
+        'count': len(rows),
+        'states': states,
+        'brands': brands,
+    }
+
+
+def write_jsonp(path, callback, payload):
+    """
+    写入通过 <script> 标签加载的数据文件，本地打开 HTML（file://）时浏览器不允许读取 JSON 文件。
+
+    :param path: 文件路径。
+    :param callback: 回调函数名。
+    :param payload: 数据。
+    """
+    with atomic_write(path) as file:
+        file.write(f"{callback}(")
+        json.dump(payload, file, ensure_ascii=False, separators=(',', ':'))
+        file.write(");\n")
+
+
+def read_run_json(run_path, name):
+    """
+    :param run_path: 运行目录，或归档后的 <运行目录名>.zip。
+    :param name: 运行目录中的 JSON 文件名。
+    :return: 解析后的数据，文件不存在时返回 None。
+    """
+    if run_path.endswith(archive_ext):
+        with zipfile.ZipFile(run_path) as archive:
+            try:
+                return json.loads(archive.read(name).decode('utf-8'))
+            except KeyError:
+                return None
+    path = os.path.join(run_path, name)
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def load_run_summary(run_dir):
+    """
+    读取运行目录中的摘要；没有 summary.json 的旧运行从 results.json 生成。
+
+    :param run_dir: 运行目录，或归档后的 <运行目录名>.zip。
+    :return: 摘要字典，都没有时返回 None。
+    """
+    summary = read_run_json(run_dir, run_summary_file)
+    if summary is not None:
+        return summary
+    data = read_run_json(run_dir, 'results.json')
+    if data is not None:
+        rows = [{'state': row_state(item)} for item in data.get('tests', {}).values()]
+        summary = summarize_run(data, rows)
+        summary['time'] = None
+        return summary
+    return None
+
+
+def update_dashboard(root=None, open_browser=False):
+    """
+    增量更新跨运行的汇总页面：只读取新增或有变化的运行摘要。
+
+    :param root: 结果根目录，默认为 ./result。
+    :param open_browser: 是否在浏览器中打开汇总页面。
+    :return: dashboard.html 路径，结果根目录不存在时返回 None。
+    """
+    root = root or result_root
+    if not os.path.isdir(root):
+        return None
+
+    cache_path = os.path.join(root, dashboard_cache_file)
+    cache = {}
+    if os.path.isfile(cache_path):
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as file:
+                cache = json.load(file)
+        except Exception:
+            traceback.print_exc()
+
+    runs = {}
+    for name in sorted(os.listdir(root)):
+        run_dir = os.path.join(root, name)
+        if os.path.isdir(run_dir):
+            run = name
+            mtimes = [os.path.getmtime(os.path.join(run_dir, file)) for file in (run_summary_file, 'results.json')
+                      if os.path.isfile(os.path.join(run_dir, file))]
+            if not mtimes:
+                continue
+            mtime = max(mtimes)
+        elif name.endswith(archive_ext) and not os.path.isdir(run_dir[:-len(archive_ext)]):
+            # 已归档的运行：报告通过 archive.py serve 从 zip 中读取，地址不变
+            run = name[:-len(archive_ext)]
+            mtime = os.path.getmtime(run_dir)
+        else:
+            continue
+        if run in cache and cache[run]['mtime'] == mtime:
+            runs[run] = cache[run]
+            continue
+        try:
+            summary = load_run_summary(run_dir)
+        except Exception:
+            traceback.print_exc()
+            continue
+        if summary is not None:
+            runs[run] = {'mtime': mtime, 'summary': summary}
+
+    with atomic_write(cache_path) as file:
+        json.dump(runs, file, ensure_ascii=False)
+
+    write_jsonp(os.path.join(root, dashboard_data_file), 'loadDashboard', [
+        {'run': run, 'report': f"{run}/report.html", **item['summary']} for run, item in runs.items()
+    ])
+    env = Environment(loader=FileSystemLoader(os.path.dirname(os.path.abspath(__file__))), trim_blocks=True)
+    html_path = os.path.join(root, dashboard_html_file)
+    with open(html_path, 'w', encoding='utf-8') as file:
+        env.get_template('dashboard_tpl.html').stream(data_file=dashboard_data_file).dump(file)
+    if open_browser:
+        webbrowser.open(html_path)
+    return html_path
+
+
+if __name__ == '__main__':
+    path = update_dashboard(open_browser=True)
+    if path is None:
+        print("未找到结果目录")
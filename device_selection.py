@@ -0,0 +1,219 @@
+# -*- encoding=utf-8 -*-
+# Coverage-driven device subset selection from device_info attributes and run history
+import os
+import re
+import math
+import argparse
+import traceback
+
+from devices.DeviceRegistry import get_registry
+from history import load_history, history_path, TOTAL_STEP
+
+# 维度的英文别名，对应 device_info.xlsx 的列名
+DIMENSION_ALIASES = {
+    'brand': '品牌',
+    'name': '名称',
+    'model': '型号',
+    'android': '安卓版本',
+    'soc': 'SoC',
+    'ram': 'RAM',
+}
+
+# SoC 厂商，按顺序匹配 device_info.xlsx 中的 SoC 名称
+SOC_VENDORS = [
+    ('Qualcomm', re.compile(r'qualcomm|snapdragon|骁龙|高通|\bsdm?\d{3}|\bmsm\d{4}', re.I)),
+    ('MediaTek', re.compile(r'mediatek|联发科|天玑|dimensity|helio|\bmt\d{4}', re.I)),
+    ('HiSilicon', re.compile(r'hisilicon|kirin|麒麟|海思', re.I)),
+    ('Samsung', re.compile(r'exynos|三星', re.I)),
+    ('Google', re.compile(r'tensor', re.I)),
+    ('Unisoc', re.compile(r'unisoc|紫光|展锐|spreadtrum', re.I)),
+]
+
+# 内存档位的上限（GB）
+RAM_TIERS = [3, 4, 6, 8, 12]
+
+# 没有历史记录时，设备通过率的先验权重（相当于几次运行）
+PRIOR_RUNS = 2
+
+
+def is_missing(value):
+    """
+    :param value: 设备信息中的值。
+    :return: 值为空时返回 True。
+    """
+    return value is None or (isinstance(value, float) and math.isnan(value)) or str(value).strip() == ''
+
+
+def soc_vendor(soc):
+    """
+    :param soc: SoC 名称，例如 "高通骁龙8gen2"、"Helio G90T"。
+    :return: SoC 厂商，无法识别时返回 other。
+    """
+    for vendor, pattern in SOC_VENDORS:
+        if pattern.search(str(soc)):
+            return vendor
+    return 'other'
+
+
+def ram_tier(ram):
+    """
+    :param ram: 内存大小（GB）。
+    :return: 内存档位，例如 "≤4GB"。
+    """
+    try:
+        value = float(ram)
+    except (TypeError, ValueError):
+        return str(ram)
+    for limit in RAM_TIERS:
+        if value <= limit:
+            return f"≤{limit}GB"
+    return f">{RAM_TIERS[-1]}GB"
+
+
+def android_major(version):
+    """
+    :param version: 安卓版本，例如 11、"13.0"、"8.1.0"。
+    :return: 主版本号。
+    """
+    if isinstance(version, float) and version.is_integer():
+        version = int(version)
+    return str(version).strip().split('.')[0]
+
+
+def dimension_value(record, dimension):
+    """
+    计算设备在一个维度上的取值：安卓版本取主版本号，内存按档位，SoC 按厂商，其他列取原值。
+
+    :param record: 设备信息字典，找不到设备信息时为 None。
+    :param dimension: 维度，device_info.xlsx 的列名或英文别名。
+    :return: 取值，没有设备信息时为 NULL。
+    """
+    column = DIMENSION_ALIASES.get(dimension.lower(), dimension)
+    value = record.get(column) if record is not None else None
+    if is_missing(value):
+        return 'NULL'
+    if column == '安卓版本':
+        return android_major(value)
+    if column == 'RAM':
+        return ram_tier(value)
+    if column == 'SoC':
+        return soc_vendor(value)
+    return str(value).strip().upper()
+
+
+def coverage_items(values, mode='all'):
+    """
+    :param values: 设备在各个维度上的取值。
+    :param mode: all：覆盖所有维度取值的组合；pairwise：覆盖任意两个维度的取值组合；each：覆盖每个维度的每个取值。
+    :return: 设备覆盖的项目集合。
+    """
+    if mode == 'each' or (mode == 'pairwise' and len(values) < 2):
+        return {(index, value) for index, value in enumerate(values)}
+    if mode == 'pairwise':
+        return {(i, values[i], j, values[j]) for i in range(len(values)) for j in range(i + 1, len(values))}
+    return {tuple(values)}
+
+
+def load_device_stats(path=None, scripts=None):
+    """
+    从历史记录中统计每台设备的通过次数和脚本耗时。
+
+    :param path: 历史记录 CSV 路径。
+    :param scripts: 只统计这些脚本的记录，为 None 时统计所有脚本。
+    :return: {序列号: (运行次数, 通过次数, 耗时中位数)} 字典，没有历史记录时返回空字典。
+    """
+    path = path or history_path
+    if not os.path.isfile(path):
+        return {}
+    try:
+        df = load_history(path)
+    except Exception:
+        traceback.print_exc()
+        return {}
+    totals = df[df['step'] == TOTAL_STEP]
+    if scripts:
+        names = {os.path.basename(os.path.normpath(script)) for script in scripts}
+        if totals['script'].isin(names).any():
+            totals = totals[totals['script'].isin(names)]
+    stats = {}
+    for dev, group in totals.groupby('dev'):
+        failed = group['failed'].astype(str).str.lower() == 'true'
+        stats[str(dev)] = (len(group), int((~failed).sum()), float(group['duration'].median()))
+    return stats
+
+
+def device_costs(devices, stats):
+    """
+    计算每台设备的代价：预计耗时 / 预计通过率。
+
+    通过率用所有设备的平均通过率作为先验，运行次数少的设备更接近平均值；没有历史的设备使用平均耗时。
+
+    :param devices: 设备序列号列表。
+    :param stats: load_device_stats 的结果。
+    :return: {序列号: 代价} 字典。
+    """
+    runs = sum(item[0] for item in stats.values())
+    prior = sum(item[1] for item in stats.values()) / runs if runs else 1.0
+    durations = sorted(item[2] for item in stats.values())
+    default_duration = durations[len(durations) // 2] if durations else 1.0
+    costs = {}
+    for dev in devices:
+        count, passed, duration = stats.get(dev, (0, 0, default_duration))
+        pass_rate = (passed + PRIOR_RUNS * prior) / (count + PRIOR_RUNS)
+        costs[dev] = max(duration, 1e-3) / max(pass_rate, 0.05)
+    return costs
+
+
+def select_devices(devices, dimensions, mode='all', scripts=None, device_info_path=None, history_file=None):
+    """
+    选出覆盖所有维度取值的最少设备（贪心集合覆盖）：每次选择 代价 / 新覆盖项目数 最小的设备，
+    同样覆盖的设备中优先选择历史通过率高、运行快的设备。
+
+    :param devices: 已连接的设备序列号列表。
+    :param dimensions: 维度列表，例如 ['android', 'ram', 'soc']。
+    :param mode: 覆盖方式，all / pairwise / each，见 coverage_items。
+    :param scripts: 要运行的脚本，历史中有这些脚本的记录时只按这些记录计算通过率和耗时。
+    :param device_info_path: device_info.xlsx 路径。
+    :param history_file: 历史记录 CSV 路径。
+    :return: 选中的设备序列号列表，保持原来的顺序。
+    """
+    devices = list(devices)
+    dimensions = [dimension.strip() for dimension in dimensions if dimension.strip()]
+    if not devices or not dimensions:
+        return devices
+
+    registry = get_registry(device_info_path or os.path.join('.', 'devices', 'device_info.xlsx'))
+    values, items = {}, {}
+    for dev in devices:
+        try:
+            record = registry.get(dev)
+        except OSError:
+            record = None
+        values[dev] = tuple(dimension_value(record, dimension) for dimension in dimensions)
+        items[dev] = coverage_items(values[dev], mode)
+
+    costs = device_costs(devices, load_device_stats(history_file, scripts))
+    uncovered = set().union(*items.values())
+    selected = []
+    while uncovered:
+        candidates = [dev for dev in devices if dev not in selected and items[dev] & uncovered]
+        best = min(candidates, key=lambda dev: (costs[dev] / len(items[dev] & uncovered), dev))
+        selected.append(best)
+        uncovered -= items[best]
+
+    print(f"按 {', '.join(dimensions)} 覆盖（{mode}）选择了 {len(selected)}/{len(devices)} 台设备：")
+    for dev in devices:
+        if dev in selected:
+            print(f"  {dev}: {' / '.join(values[dev])}")
+    return [dev for dev in devices if dev in selected]
+
+
+if __name__ == '__main__':
+    from devices.Device import list_online_devices
+
+    parser = argparse.ArgumentParser(description='按设备属性选出覆盖所有取值的最少设备')
+    parser.add_argument('dimensions', help='维度，用逗号分隔，例如 android,ram,soc')
+    parser.add_argument('--mode', choices=['all', 'pairwise', 'each'], default='all',
+                        help='all：覆盖所有取值组合；pairwise：覆盖任意两个维度的取值组合；each：覆盖每个维度的每个取值')
+    args = parser.parse_args()
+    select_devices(list_online_devices(), args.dimensions.split(','), args.mode)
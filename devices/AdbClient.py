@@ -0,0 +1,147 @@
+import time
+import socket
+import threading
+
+
+class AdbError(Exception):
+    """adb 服务返回 FAIL 或协议错误"""
+
+
+class AdbClient:
+    """
+    直接通过 TCP 与本机 adb 服务（默认 127.0.0.1:5037）通信的客户端，不需要启动 adb 进程。
+
+    adb 服务在每个服务请求结束后都会关闭连接，无法复用同一个套接字，
+    因此用信号量限制同时打开的连接数，避免大量并发请求压垮 adb 服务。
+    """
+
+    def __init__(self, host='127.0.0.1', port=5037, timeout=30, max_connections=8):
+        """
+        :param host: adb 服务地址。
+        :param port: adb 服务端口。
+        :param timeout: 套接字超时时间（秒），为 None 时不超时。
+        :param max_connections: 同时打开的最大连接数。
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.connections = threading.BoundedSemaphore(max_connections)
+
+    def _connect(self):
+        """建立一个到 adb 服务的连接"""
+        return socket.create_connection((self.host, self.port), timeout=self.timeout)
+
+    @staticmethod
+    def _read_exact(sock, size):
+        """从套接字读取指定长度的数据"""
+        data = b''
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise AdbError("adb server closed the connection")
+            data += chunk
+        return data
+
+    def _read_message(self, sock):
+        """读取 4 位十六进制长度前缀的消息"""
+        size = int(self._read_exact(sock, 4), 16)
+        return self._read_exact(sock, size).decode('utf-8', errors='replace')
+
+    def _request(self, sock, service):
+        """发送服务请求并检查 OKAY/FAIL 状态"""
+        payload = service.encode('utf-8')
+        sock.sendall(b'%04x' % len(payload) + payload)
+        status = self._read_exact(sock, 4)
+        if status == b'OKAY':
+            return
+        if status == b'FAIL':
+            raise AdbError(self._read_message(sock))
+        raise AdbError(f"unexpected adb response {status!r}")
+
+    def query(self, service):
+        """
+        执行 host 服务，例如 host:version、host:devices，返回服务的应答。
+
+        :param service: 服务名称。
+        :return: 应答内容。
+        """
+        with self.connections:
+            with self._connect() as sock:
+                self._request(sock, service)
+                return self._read_message(sock)
+
+    def devices(self):
+        """
+        :return: [(序列号, 状态)] 列表。
+        """
+        return parse_devices(self.query('host:devices'))
+
+    def track_devices(self):
+        """
+        订阅 adb 服务的设备变化（host:track-devices），每次设备列表变化时返回完整的设备列表。
+
+        这个连接会一直保持，不占用连接数限制。
+
+        :return: [(序列号, 状态)] 列表的生成器。
+        """
+        sock = self._connect()
+        sock.settimeout(None)
+        try:
+            self._request(sock, 'host:track-devices')
+            while True:
+                yield parse_devices(self._read_message(sock))
+        finally:
+            sock.close()
+
+    def shell_stream(self, serial, command, chunk_size=65536, timeout=None):
+        """
+        在设备上执行 shell 命令，边执行边返回输出。
+
+        :param serial: 设备序列号。
+        :param command: shell 命令。
+        :param chunk_size: 每次读取的字节数。
+        :param timeout: 命令的最长执行时间（秒），超时抛出 TimeoutError，为 None 时只受套接字超时限制。
+        :return: 输出数据块（bytes）的生成器。
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        with self.connections:
+            with self._connect() as sock:
+                self._request(sock, f'host:transport:{serial}')
+                self._request(sock, f'shell:{command}')
+                while True:
+                    if deadline is not None:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            raise TimeoutError(f"adb shell {command} timed out")
+                        sock.settimeout(min(remaining, self.timeout) if self.timeout is not None else remaining)
+                    chunk = sock.recv(chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+
+    def shell(self, serial, command, timeout=None):
+        """
+        在设备上执行 shell 命令并返回全部输出。
+
+        :param serial: 设备序列号。
+        :param command: shell 命令。
+        :param timeout: 命令的最长执行时间（秒），超时抛出 TimeoutError。
+        :return: 命令输出。
+        """
+        return b''.join(self.shell_stream(serial, command, timeout=timeout)).decode('utf-8', errors='replace')
+
+
+def parse_devices(output):
+    """
+    解析 host:devices / host:track-devices 的应答。
+
+    :param output: 应答内容，每行为 "序列号\\t状态"。
+    :return: [(序列号, 状态)] 列表。
+    """
+    devices = []
+    for line in output.splitlines():
+        if '\t' in line:
+            serial, state = line.split('\t', 1)
+            devices.append((serial, state.strip()))
+    return devices
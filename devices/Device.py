@@ -1,15 +1,82 @@
+import re
 import math
 import subprocess
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 
+from devices.DeviceRegistry import get_registry
+from devices.ExcelStore import get_store
+from tracing import tracer
+
+# 合并多个 shell 命令输出时使用的分隔行
+SNAPSHOT_SEPARATOR = '----device-snapshot----'
+
+GETPROP_PATTERN = re.compile(r'^\[(.+?)\]: \[(.*)\]$')
+
+
+def parse_getprop(output):
+    """解析 getprop 的输出，返回 {属性名: 值} 字典"""
+    props = {}
+    for line in output.splitlines():
+        match = GETPROP_PATTERN.match(line.strip())
+        if match:
+            props[match.group(1)] = match.group(2)
+    return props
+
+
+def unquote_shell(command):
+    """去掉整条 shell 命令外层的双引号，通过套接字执行时没有本地 shell 来处理引号"""
+    if len(command) >= 2 and command[0] == command[-1] == '"':
+        return command[1:-1]
+    return command
+
+
+def list_online_devices(adb_path=r'adb'):
+    """返回所有在线设备的序列号"""
+    output = subprocess.run(f'{adb_path} devices', shell=True, capture_output=True, text=True).stdout
+    return [line.split('\t')[0] for line in output.splitlines()[1:] if line.endswith('\tdevice')]
+
+
+# 不使用 AdbClient 时同时探测的最大设备数量
+PROBE_WORKERS = 32
+
+
+def probe_devices(serials=None, adb_path=r'adb', max_workers=None, adb_client=None):
+    """
+    并行获取所有设备的信息，新设备只需要一次 adb 调用，并且所有新设备只写一次 Excel。
+
+    :param serials: 设备序列号列表，默认为所有在线设备。
+    :param adb_path: adb 路径。
+    :param max_workers: 同时探测的设备数量。默认使用 adb_client 的最大连接数，没有 adb_client 时最多 PROBE_WORKERS 个。
+    :param adb_client: AdbClient，设置后通过 adb 服务的套接字执行命令。
+    :return: {序列号: Device} 字典。
+    """
+    if serials is None:
+        if adb_client is not None:
+            serials = [serial for serial, state in adb_client.devices() if state == 'device']
+        else:
+            serials = list_online_devices(adb_path)
+    if not serials:
+        return {}
+
+    # 每台设备要执行多条 adb 命令，几百台设备时每台一个线程会压垮 adb 服务
+    if max_workers is None:
+        max_workers = adb_client.max_connections if adb_client is not None else PROBE_WORKERS
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(serials))) as pool:
+        devices = dict(zip(serials, pool.map(lambda serial: Device(adb_path, serial, adb_client), serials)))
+
+    # 把新设备的信息一次性写回 Excel
+    get_store().flush()
+    return devices
+
 
 class Device:
     device_info_path = './devices/device_info.xlsx'
 
-    def __init__(self,  adb_path=r'adb'):
-        self.device_serial_number = None
+    def __init__(self,  adb_path=r'adb', device_serial_number=None, adb_client=None):
+        self.device_serial_number = device_serial_number
         self.device_order = None
         self.device_brand = None
         self.device_name = None
@@ -18,24 +85,25 @@ class Device:
         self.device_soc = None
         self.device_ram = None
         self.adb_path = adb_path
+        # 设置 AdbClient 后，shell 命令直接通过 adb 服务的套接字执行，不再启动 adb 进程
+        self.adb_client = adb_client
 
         # 在实例初始化时自动更新信息
         self.update_info_from_excel()
 
     def update_info_from_excel(self):
 
-        df = pd.read_excel(Device.device_info_path)
-        device_info = df[df.iloc[:, 1] == self.device_serial_number]  # 假设第二列包含序列号
-
-        if not device_info.empty:
-            row = device_info.iloc[0]  # 获取匹配的第一行数据
-            self.device_order = row[0]
-            self.device_brand = row[2]
-            self.device_name = row[3]
-            self.device_model = row[4]
-            self.device_android_version = row[5]
-            self.device_soc = row[6]
-            self.device_ram = row[7]
+        # 从设备信息索引中查询，不再每次实例化都解析 Excel
+        row = get_registry(Device.device_info_path).get(self.device_serial_number)
+
+        if row is not None:
+            self.device_order = row['序号']
+            self.device_brand = row['品牌']
+            self.device_name = row['名称']
+            self.device_model = row['型号']
+            self.device_android_version = row['安卓版本']
+            self.device_soc = row['SoC']
+            self.device_ram = row['RAM']
         else:
             print(f"*****{self.device_serial_number}是新设备*****")
             print(f"*****获取设备{self.device_serial_number}信息*****")
@@ -47,55 +115,105 @@ class Device:
         print(
             f"Device(serial_number={self.device_serial_number}, order={self.device_order}, brand={self.device_brand}, name={self.device_name}, model={self.device_model}, android_version={self.device_android_version}, soc={self.device_soc}, ram={self.device_ram})")
 
-    def adb_command(self, command):
-        """执行ADB命令并返回输出"""
+    def adb_command(self, command, timeout=None):
+        """执行ADB命令并返回输出，超过 timeout 秒没有结束时返回 None"""
+        with tracer.span('adb', 'adb', serial=self.device_serial_number, command=command[:80]):
+            return self._adb_command(command, timeout)
+
+    def _adb_command(self, command, timeout=None):
+        if self.adb_client is not None and command.startswith('shell '):
+            try:
+                return self.adb_client.shell(self.device_serial_number, unquote_shell(command[len('shell '):]),
+                                             timeout).strip()
+            except TimeoutError:
+                # 命令本身超时，换用 adb 进程重新执行同样会超时
+                print(f"ADB command timed out after {timeout}s: {command}")
+                return None
+            except Exception as e:
+                print(f"Error executing ADB command through adb server: {e}")
         try:
-            completed_process = subprocess.run(f'{self.adb_path} -s {self.device_serial_number} {command}', shell=True, capture_output=True, text=True)
+            completed_process = subprocess.run(f'{self.adb_path} -s {self.device_serial_number} {command}', shell=True,
+                                               capture_output=True, text=True, timeout=timeout)
             return completed_process.stdout.strip()
+        except subprocess.TimeoutExpired:
+            print(f"ADB command timed out after {timeout}s: {command}")
+            return None
         except Exception as e:
             print(f"Error executing ADB command: {e}")
             return None
 
     def get_device_info(self):
-        """获取设备信息"""
-        self.device_brand = self.adb_command('shell getprop ro.product.brand')
-        self.device_android_version = self.adb_command('shell getprop ro.build.version.release')
-        self.device_soc = self.adb_command('shell cat /proc/cpuinfo').splitlines()[-1].split(":")[-1]
-        self.device_ram = self.get_total_memory()
-        self.device_name, self.device_model = self.get_device_name_and_model()
-
-    def get_total_memory(self):
+        """获取设备信息，只需要一次 adb 调用"""
+        props, cpuinfo, meminfo = self.get_device_snapshot()
+        self.device_brand = props.get('ro.product.brand', '')
+        self.device_android_version = props.get('ro.build.version.release', '')
+        cpu_lines = [line for line in cpuinfo.splitlines() if line.strip()]
+        self.device_soc = cpu_lines[-1].split(":")[-1].strip() if cpu_lines else ''
+        self.device_ram = self.get_total_memory(meminfo)
+        self.device_name, self.device_model = self.get_device_name_and_model(props)
+
+    def get_device_snapshot(self):
+        """一次性读取 getprop、/proc/cpuinfo 和 /proc/meminfo，返回 (属性字典, cpuinfo, meminfo)"""
+        output = self.adb_command(
+            f'shell "getprop; echo {SNAPSHOT_SEPARATOR}; cat /proc/cpuinfo; echo {SNAPSHOT_SEPARATOR}; cat /proc/meminfo"') or ''
+        parts = output.split(SNAPSHOT_SEPARATOR)
+        parts += [''] * (3 - len(parts))
+        return parse_getprop(parts[0]), parts[1], parts[2]
+
+    def get_total_memory(self, meminfo=None):
         """获取手机RAM大小"""
-        meminfo = self.adb_command('shell cat /proc/meminfo').splitlines()
-        for line in meminfo:
+        if meminfo is None:
+            meminfo = self.adb_command('shell cat /proc/meminfo')
+        for line in meminfo.splitlines():
             if "MemTotal" in line:
                 mem_total_kb = int(line.split(':')[1].strip().split(' ')[0])
                 return math.ceil(mem_total_kb / (1024 * 1024))
         return 0
 
-    def get_device_name_and_model(self):
+    def get_device_name_and_model(self, props=None):
         """根据品牌获取设备名称和型号"""
+        if props is None:
+            props = self.get_device_snapshot()[0]
         brand = self.device_brand.lower()
         if brand in ["redmi", "xiaomi"]:
-            name = self.adb_command("shell getprop ro.product.model")
-            model = self.adb_command('shell getprop ro.product.cert')
+            name = props.get("ro.product.model", '')
+            model = props.get('ro.product.cert', '')
         elif brand == "poco":
-            name = self.adb_command("shell getprop ro.product.marketname")
-            model = self.adb_command('shell getprop ro.product.cert')
+            name = props.get("ro.product.marketname", '')
+            model = props.get('ro.product.cert', '')
         elif brand == "huawei":
-            name = self.adb_command("shell getprop ro.config.marketing_name")
-            model = self.adb_command('shell getprop ro.product.cert')
+            name = props.get("ro.config.marketing_name", '')
+            model = props.get('ro.product.cert', '')
         elif brand == "samsung":
             name = None
-            model = self.adb_command('shell getprop ro.product.model')
+            model = props.get('ro.product.model', '')
         else:
-            name = self.adb_command('shell getprop ro.product.name')
-            model = self.adb_command('shell getprop ro.product.model')
+            name = props.get('ro.product.name', '')
+            model = props.get('ro.product.model', '')
         return name, model
 
     def save_to_excel(self):
-        # 读取现有的 Excel 文件
-        df = pd.read_excel(Device.device_info_path)
+        """保存新设备信息，运行结束或进程退出时统一写回 Excel 文件"""
+        record = {
+            '序号': None,
+            '序列号': self.device_serial_number,
+            '品牌': self.device_brand,
+            '名称': self.device_name,
+            '型号': self.device_model,
+            '安卓版本': self.device_android_version,
+            'SoC': self.device_soc,
+            'RAM': self.device_ram
+        }
+
+        # 在写回之前，同一台设备再次实例化时也能查到信息
+        get_registry(Device.device_info_path).add(record)
+        get_store().update(Device.device_info_path, self.append_to_excel, sheet_name='base_info')
+
+    def append_to_excel(self, df):
+        """在设备信息表中追加当前设备，由写回缓存在文件锁内调用"""
+        # 其他进程已经写入了这台设备
+        if self.device_serial_number in df.iloc[:, 1].values:
+            return df
 
         # 计算新设备的序号
         new_order = df.shape[0] - 1  # 减去标题行
@@ -114,10 +232,7 @@ class Device:
         }])
 
         # 使用 pd.concat 将新行追加到数据帧中
-        df = pd.concat([df, new_device_info], ignore_index=True)
-
-        # 将更新后的数据帧写回 Excel 文件
-        df.to_excel(Device.device_info_path, sheet_name='base_info', index=False)
+        return pd.concat([df, new_device_info], ignore_index=True)
 
     def install_app(self, app_info):
 
@@ -160,6 +275,32 @@ class Device:
 
                 print(f"App {package_name} is not installed on device {self.device_name}")
 
+    def get_sdk_and_version_code(self, package_name):
+        """一次 adb 调用获取设备的 SDK 版本和应用已安装的 versionCode，未安装时 versionCode 为 None"""
+        output = self.adb_command(
+            f'shell "getprop ro.build.version.sdk; dumpsys package {package_name} | grep versionCode"') or ''
+        lines = output.splitlines()
+        sdk = int(lines[0].strip()) if lines and lines[0].strip().isdigit() else None
+        match = re.search(r'versionCode=(\d+)', output)
+        return sdk, int(match.group(1)) if match else None
+
+    def get_build_fingerprint(self, package_name=None):
+        """一次 adb 调用获取设备的 ro.build.fingerprint 和应用已安装的 versionCode，未安装或未指定包名时 versionCode 为 None"""
+        command = 'getprop ro.build.fingerprint'
+        if package_name:
+            command += f'; dumpsys package {package_name} | grep versionCode'
+        output = self.adb_command(f'shell "{command}"') or ''
+        lines = output.splitlines()
+        build = lines[0].strip() if lines and lines[0].strip() else None
+        match = re.search(r'versionCode=(\d+)', output)
+        return build, int(match.group(1)) if match else None
+
+    def install_apk(self, apk_path, streaming=True):
+        """覆盖安装 APK，返回 (是否成功, adb 输出)"""
+        option = '--streaming' if streaming else '--no-streaming'
+        result = self.adb_command(f'install -r {option} "{apk_path}"') or ''
+        return 'Success' in result, result
+
     def is_app_installed(self, package_name):
 
         if package_name:
@@ -169,28 +310,81 @@ class Device:
 
         return False
 
+    def is_app_ready(self, package_name, wait_for='process'):
+        """检查应用是否已经启动：process 检查进程是否存在，focus 检查应用是否处于前台"""
+        if wait_for == 'focus':
+            output = self.adb_command('shell "dumpsys window | grep mCurrentFocus"') or ''
+            return f' {package_name}/' in output
+        return bool((self.adb_command(f'shell pidof {package_name}') or '').strip())
+
+    def launch_app(self, package_name, activity=None, timeout=30, wait_for='process', initial_interval=0.05,
+                   max_interval=1.0):
+        """
+        先结束应用再启动，返回冷启动耗时（秒），超时返回 None。
+
+        指定 activity 时使用 am start -W 等待启动完成，耗时取系统输出的 TotalTime（没有时取 WaitTime）；
+        否则轮询直到应用真正启动，轮询间隔从 initial_interval 开始按 1.5 倍递增，最长为 max_interval。
+        两种方式的总等待时间都不超过 timeout 秒。
+        """
+        # 应用已经在运行时 pidof 会立即返回，测到的不是冷启动
+        self.adb_command(f'shell am force-stop {package_name}')
+        start = time.time()
+        if activity:
+            output = self.adb_command(f'shell am start -S -W -n {package_name}/{activity}', timeout) or ''
+            match = re.search(r'TotalTime:\s*(\d+)', output) or re.search(r'WaitTime:\s*(\d+)', output)
+            if match:
+                return int(match.group(1)) / 1000
+        else:
+            self.adb_command(f'shell monkey -p {package_name} -c android.intent.category.LAUNCHER 1')
+
+        interval = initial_interval
+        while True:
+            if self.is_app_ready(package_name, wait_for):
+                return time.time() - start
+            if time.time() - start > timeout:
+                return None
+            time.sleep(interval)
+            interval = min(interval * 1.5, max_interval)
+
     def launch_clashmini(self):
 
         if self.is_app_installed("com.supercell.clashmini"):
-            # 启动 Clash Mini
-            self.adb_command('shell am start -n com.supercell.clashmini/.GameApp')
-            # 暂停一段时间后检查是否启动成功
-            time.sleep(5)
-
-            output = self.adb_command('shell ps')
+            # 启动 Clash Mini，应用进程出现后立即返回
+            latency = self.launch_app('com.supercell.clashmini', '.GameApp', timeout=30)
 
-            if 'com.supercell.clashmini' in output:
+            if latency is not None:
 
-                print(f'设备{self.device_name} Clash Mini is running')
+                print(f'设备{self.device_name} Clash Mini is running, launch time {latency:.3f}s')
 
             else:
 
                 print(f'设备{self.device_name} Clash Mini is not running')
 
+            return latency
+
         else:
 
             print(f'设备{self.device_name} 未安装 Clash Mini')
 
 
+def launch_on_devices(devices, package_name, activity=None, timeout=30, wait_for='process'):
+    """
+    在所有设备上同时启动应用。
+
+    :param devices: Device 列表。
+    :param package_name: 包名。
+    :param activity: 启动的 Activity，为 None 时启动应用的默认入口。
+    :param timeout: 每台设备等待启动的超时时间（秒）。
+    :param wait_for: process 表示进程出现即视为启动，focus 表示应用处于前台才视为启动。
+    :return: {序列号: 冷启动耗时}，超时的设备为 None。
+    """
+    if not devices:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(devices)) as pool:
+        latencies = pool.map(lambda device: device.launch_app(package_name, activity, timeout, wait_for), devices)
+        return {device.device_serial_number: latency for device, latency in zip(devices, latencies)}
+
+
 if __name__ == '__main__':
-    device = Device()
+    for device in probe_devices().values():
+        device.__str__()
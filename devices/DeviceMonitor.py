@@ -0,0 +1,83 @@
+import time
+import queue
+import threading
+
+from devices.AdbClient import AdbClient
+
+
+class DeviceMonitor:
+    """
+    通过 adb 服务的 host:track-devices 实时监听设备的连接和断开。
+
+    后台线程把设备变化转换为事件放入队列，调度器在每次循环中调用 poll() 取出：
+        ('add', 序列号)    - 设备上线（状态变为 device）；
+        ('remove', 序列号) - 设备断开或变为 offline/unauthorized。
+    """
+
+    def __init__(self, devices=None, adb_client=None, reconnect_interval=1):
+        """
+        :param devices: 开始监听时已知的设备序列号列表。第一次收到的设备列表中已经连接的设备不会产生 add 事件，
+            其中不包含的已知设备产生 remove 事件。
+        :param adb_client: AdbClient，默认连接本机 adb 服务。
+        :param reconnect_interval: 与 adb 服务的连接断开后重连的间隔（秒）。
+        """
+        self.adb_client = adb_client or AdbClient()
+        self.reconnect_interval = reconnect_interval
+        self.events = queue.Queue()
+        self.devices = set(devices or [])
+        # 收到第一次设备列表之前为 None
+        self.online = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """启动后台监听线程"""
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """停止监听，后台线程会在下一次设备变化或连接断开时退出"""
+        self.stopped.set()
+
+    def _run(self):
+        """后台线程：读取设备列表并与上一次的列表比较"""
+        while not self.stopped.is_set():
+            try:
+                for devices in self.adb_client.track_devices():
+                    if self.stopped.is_set():
+                        return
+                    self._update({serial for serial, state in devices if state == 'device'})
+            except Exception as e:
+                if self.stopped.is_set():
+                    return
+                print(f"Device tracking connection lost: {e}")
+            # 重连后 adb 服务会先发送完整的设备列表，与断开前的列表比较即可得到期间的变化
+            time.sleep(self.reconnect_interval)
+
+    def _update(self, online):
+        """
+        :param online: 当前在线的设备序列号集合。
+        """
+        if self.online is None:
+            # 第一次的设备列表是所有已经连接的设备，不是新上线的设备
+            for serial in sorted(self.devices - online):
+                self.events.put(('remove', serial))
+            self.online = online
+            return
+        for serial in sorted(online - self.online):
+            self.events.put(('add', serial))
+        for serial in sorted(self.online - online):
+            self.events.put(('remove', serial))
+        self.online = online
+
+    def poll(self):
+        """
+        :return: 自上次调用以来的设备事件列表。
+        """
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
@@ -0,0 +1,132 @@
+import os
+import json
+import threading
+import traceback
+
+import pandas as pd
+
+from atomic_io import atomic_write
+
+# device_info.xlsx 的列，按列的位置读取，与 Device.update_info_from_excel 保持一致
+DEVICE_INFO_COLUMNS = ['序号', '序列号', '品牌', '名称', '型号', '安卓版本', 'SoC', 'RAM']
+
+
+class DeviceRegistry:
+    """
+    设备信息索引：把 device_info.xlsx 读取一次，建立 序列号 -> 设备信息 的哈希索引。
+
+    Excel 文件的修改时间变化后自动重新读取；读取结果同时保存到旁路 JSON 缓存中，
+    下一次运行时如果 Excel 没有变化，直接读取 JSON，跳过 Excel 解析。
+    """
+
+    def __init__(self, path, sidecar=True):
+        """
+        :param path: device_info.xlsx 文件路径。
+        :param sidecar: 是否使用旁路 JSON 缓存。
+        """
+        self.path = path
+        self.sidecar_path = os.path.splitext(path)[0] + '.cache.json' if sidecar else None
+        self.lock = threading.Lock()
+        self.records = {}
+        self.pending = {}
+        self.mtime = None
+
+    def _load(self):
+        """
+        Excel 文件有变化时重新建立索引。
+        """
+        mtime = os.path.getmtime(self.path)
+        if mtime == self.mtime:
+            return
+
+        rows = self._load_sidecar(mtime)
+        if rows is None:
+            df = pd.read_excel(self.path)
+            rows = df.astype(object).where(df.notna(), None).values.tolist()
+            self._save_sidecar(mtime, rows)
+
+        records = {}
+        for row in rows:
+            record = dict(zip(DEVICE_INFO_COLUMNS, row))
+            serial = record.get('序列号')
+            # 同一个序列号出现多次时，使用第一行
+            if serial is not None and str(serial) not in records:
+                records[str(serial)] = record
+        self.records = records
+        self.mtime = mtime
+
+    def _load_sidecar(self, mtime):
+        """
+        :param mtime: Excel 文件当前的修改时间。
+        :return: 旁路缓存中的数据行，缓存不存在或已过期时返回 None。
+        """
+        if not self.sidecar_path or not os.path.isfile(self.sidecar_path):
+            return None
+        try:
+            with open(self.sidecar_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get('mtime') == mtime:
+                return data['rows']
+        except Exception:
+            traceback.print_exc()
+        return None
+
+    def _save_sidecar(self, mtime, rows):
+        """
+        :param mtime: Excel 文件当前的修改时间。
+        :param rows: 数据行。
+        """
+        if not self.sidecar_path:
+            return
+        try:
+            with atomic_write(self.sidecar_path) as file:
+                json.dump({'mtime': mtime, 'rows': rows}, file, ensure_ascii=False, default=str)
+        except Exception:
+            traceback.print_exc()
+
+    def get(self, serial):
+        """
+        查询设备信息。
+
+        :param serial: 设备序列号。
+        :return: 设备信息字典，键为 DEVICE_INFO_COLUMNS，找不到时返回 None。
+        """
+        with self.lock:
+            self._load()
+            record = self.records.get(str(serial))
+            return record if record is not None else self.pending.get(str(serial))
+
+    def add(self, record):
+        """
+        添加尚未写入 Excel 的设备信息。
+
+        :param record: 设备信息字典，键为 DEVICE_INFO_COLUMNS。
+        """
+        with self.lock:
+            self.pending[str(record['序列号'])] = record
+
+    def all(self):
+        """
+        :return: {序列号: 设备信息} 字典。
+        """
+        with self.lock:
+            self._load()
+            return {**self.pending, **self.records}
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(path):
+    """
+    获取指定 Excel 文件的设备信息索引，同一个文件只建立一次。
+
+    :param path: device_info.xlsx 文件路径。
+    :return: DeviceRegistry。
+    """
+    key = os.path.normcase(os.path.abspath(path))
+    with _registries_lock:
+        if key not in _registries:
+            _registries[key] = DeviceRegistry(path)
+        return _registries[key]
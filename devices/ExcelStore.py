@@ -0,0 +1,116 @@
+import os
+import time
+import atexit
+import threading
+import traceback
+
+import pandas as pd
+
+from atomic_io import atomic_path
+
+
+class FileLock:
+    """
+    基于锁文件的跨进程文件锁。
+
+    锁文件使用 O_CREAT | O_EXCL 创建，创建成功即获得锁；超过 stale 秒的锁文件视为残留，会被删除。
+    """
+
+    def __init__(self, path, timeout=60, stale=300, interval=0.1):
+        """
+        :param path: 被保护的文件路径，锁文件为 path + '.lock'。
+        :param timeout: 获取锁的超时时间（秒）。
+        :param stale: 锁文件超过多少秒视为残留。
+        :param interval: 重试间隔（秒）。
+        """
+        self.lock_path = path + '.lock'
+        self.timeout = timeout
+        self.stale = stale
+        self.interval = interval
+
+    def __enter__(self):
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.lock_path) > self.stale:
+                        os.remove(self.lock_path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.time() > deadline:
+                    raise TimeoutError(f"获取文件锁超时：{self.lock_path}")
+                time.sleep(self.interval)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            os.remove(self.lock_path)
+        except FileNotFoundError:
+            pass
+
+
+class ExcelStore:
+    """
+    Excel 工作簿的写回缓存。
+
+    修改先以函数的形式保存在内存中，flush() 时在文件锁内读取每个工作簿的最新内容，
+    依次应用所有修改，写入临时文件后原子替换，每个工作簿只写一次，不会丢失并发的修改。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.sheet_names = {}
+
+    def update(self, path, change, sheet_name='Sheet1'):
+        """
+        记录一次对工作簿的修改。
+
+        :param path: 工作簿路径。
+        :param change: 修改函数，接收当前的 DataFrame，返回修改后的 DataFrame。
+        :param sheet_name: 写回时使用的工作表名称。
+        """
+        with self.lock:
+            self.pending.setdefault(path, []).append(change)
+            self.sheet_names[path] = sheet_name
+
+    def flush(self):
+        """
+        把所有缓存的修改写回工作簿。
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            sheet_names = dict(self.sheet_names)
+
+        for path, changes in pending.items():
+            try:
+                with FileLock(path):
+                    df = pd.read_excel(path)
+                    for change in changes:
+                        df = change(df)
+
+                    # 先写入临时文件再替换，避免写到一半时损坏工作簿；pandas 按扩展名选择引擎
+                    with atomic_path(path, keep_ext=True) as tmp_path:
+                        df.to_excel(tmp_path, sheet_name=sheet_names[path], index=False)
+            except FileNotFoundError:
+                print(f"未找到文件：{path}")
+            except Exception as e:
+                print(f"写入文件{path}时出错：{e}")
+                traceback.print_exc()
+
+
+_store = ExcelStore()
+# run() 和 probe_devices 会主动写回，其他调用方在进程退出时写回，不会丢失修改
+atexit.register(_store.flush)
+
+
+def get_store():
+    """
+    :return: 全局的 Excel 写回缓存。
+    """
+    return _store
@@ -0,0 +1,300 @@
+# -*- encoding=utf-8 -*-
+# Historical per-step timing store and regression detector across result/ runs
+import os
+import json
+import argparse
+import traceback
+
+import pandas as pd
+
+from log_tailer import LogTailer
+from atomic_io import atomic_write
+from sharding import read_log_duration
+
+result_root = os.path.join('.', 'result')
+history_path = 'history.csv'
+history_index_path = 'history.index.json'
+
+# 每次运行汇总报告时写入运行目录的测试结果，data.json 只保存最近一次运行
+run_results_file = 'results.json'
+
+HISTORY_COLUMNS = ['run', 'script', 'key', 'dev', 'device_name', 'build', 'app_version',
+                   'seq', 'step', 'duration', 'failed']
+TOTAL_STEP = '(total)'
+
+
+def normalize_path(path):
+    """
+    data.json 中的路径可能是在 Windows 上生成的，统一转换为当前系统的分隔符。
+
+    :param path: 路径。
+    :return: 转换后的路径。
+    """
+    return os.path.normpath(path.replace('\\', '/'))
+
+
+def load_index(path=None):
+    """
+    :param path: 索引文件路径。
+    :return: 索引字典：logs 为 {log.txt 路径: 修改时间}，记录已经写入历史的日志；
+        runs 为 {运行目录: results.json 修改时间}，记录所有日志都已写入历史的运行。
+    """
+    path = path or history_index_path
+    index = {}
+    if os.path.isfile(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                index = json.load(file)
+        except Exception:
+            traceback.print_exc()
+    if 'logs' not in index:
+        # 旧版本的索引只记录了日志
+        index = {'logs': index, 'runs': {}}
+    return index
+
+
+def save_index(index, path=None):
+    """
+    :param index: load_index 返回的索引字典。
+    :param path: 索引文件路径。
+    """
+    path = path or history_index_path
+    with atomic_write(path) as file:
+        json.dump(index, file, indent=4, ensure_ascii=False)
+
+
+def find_run_logs(run_dir):
+    """
+    找出一次运行中的所有任务日志。
+
+    运行目录中有 results.json 时使用其中的任务信息，否则按目录名推断设备序列号。
+
+    :param run_dir: 运行目录，例如 result/2024_11_27_18_33_44。
+    :return: [(log.txt 路径, 任务信息字典)] 列表。
+    """
+    results_path = os.path.join(run_dir, run_results_file)
+    if os.path.isfile(results_path):
+        try:
+            with open(results_path, 'r', encoding='utf-8') as file:
+                results = json.load(file)
+            builds = results.get('builds', {})
+            logs = []
+            for key, item in results.get('tests', {}).items():
+                if not item.get('log_path') or item.get('cached'):
+                    # 缓存复用的结果指向之前的运行，已经在那次运行中写入历史
+                    continue
+                dev = item.get('dev', key)
+                build = builds.get(dev) or {}
+                logs.append((os.path.join(run_dir, normalize_path(item['log_path'])), {
+                    'script': os.path.basename(os.path.normpath(normalize_path(item.get('script') or results.get('script') or ''))),
+                    'key': key,
+                    'dev': dev,
+                    'device_name': item.get('device_name'),
+                    'build': build.get('fingerprint'),
+                    'app_version': str(build['app_version']) if build.get('app_version') is not None else None,
+                }))
+            return logs
+        except Exception:
+            traceback.print_exc()
+
+    logs = []
+    for root, dirs, files in os.walk(run_dir):
+        if 'log.txt' in files:
+            key = os.path.relpath(root, run_dir).replace(os.sep, '/')
+            logs.append((os.path.join(root, 'log.txt'), {
+                'script': None, 'key': key, 'dev': key.split('/')[-1], 'device_name': None,
+                'build': None, 'app_version': None,
+            }))
+    return logs
+
+
+def read_steps(log_txt):
+    """
+    读取 log.txt 中每个顶层步骤的耗时。
+
+    :param log_txt: log.txt 路径。
+    :return: [(序号, 步骤名, 耗时, 是否失败)] 列表，最后一行是整个脚本的耗时。
+    """
+    steps = []
+    for event in LogTailer(log_txt).poll():
+        if event['type'] == 'step' and event['duration'] is not None:
+            steps.append((len(steps), event['name'], event['duration'], event['failed']))
+    total = read_log_duration(log_txt)
+    if total is not None:
+        steps.append((len(steps), TOTAL_STEP, total, any(step[3] for step in steps)))
+    return steps
+
+
+def index_history(root=None, path=None, index_path=None):
+    """
+    增量扫描结果目录，把新的或有变化的 log.txt 中各步骤的耗时追加到历史记录中。
+
+    已经结束的运行按 results.json 的修改时间记录在索引中，之后只检查 results.json 是否变化，
+    不再重新解析结果和检查每个日志，扫描的耗时不随历史运行的数量增长。
+
+    :param root: 结果根目录，默认为 ./result。
+    :param path: 历史记录 CSV 路径。
+    :param index_path: 索引文件路径。
+    :return: 新增的记录行数。
+    """
+    root = root or result_root
+    path = path or history_path
+    if not os.path.isdir(root):
+        return 0
+
+    index = load_index(index_path)
+    rows = []
+    changed = False
+    for entry in sorted(os.scandir(root), key=lambda entry: entry.name):
+        if not entry.is_dir():
+            continue
+        run, run_dir = entry.name, entry.path
+        # 没有 results.json 的运行可能还在进行，每次都检查其中的日志
+        try:
+            finished = os.path.getmtime(os.path.join(run_dir, run_results_file))
+        except OSError:
+            finished = None
+        indexed_run = normalize_path(run_dir)
+        if finished is not None and index['runs'].get(indexed_run) == finished:
+            continue
+        for log_txt, info in find_run_logs(run_dir):
+            try:
+                mtime = os.path.getmtime(log_txt)
+            except OSError:
+                continue
+            indexed = normalize_path(log_txt)
+            if index['logs'].get(indexed) == mtime:
+                continue
+            # 同一个日志有变化（例如重新运行）时，之前写入的记录仍然保留，分析时按最新一次计算
+            for seq, step, duration, failed in read_steps(log_txt):
+                rows.append({'run': run, **info, 'seq': seq, 'step': step, 'duration': round(duration, 3),
+                             'failed': failed})
+            index['logs'][indexed] = mtime
+            changed = True
+        if finished is not None:
+            index['runs'][indexed_run] = finished
+            changed = True
+
+    if rows:
+        pd.DataFrame(rows, columns=HISTORY_COLUMNS).to_csv(
+            path, mode='a', header=not os.path.isfile(path), index=False, encoding='utf-8')
+    if changed:
+        save_index(index, index_path)
+    return len(rows)
+
+
+def load_history(path=None):
+    """
+    :param path: 历史记录 CSV 路径。
+    :return: 历史记录 DataFrame，同一次运行中同一个任务的同一步骤只保留最后写入的一条。
+    """
+    df = pd.read_csv(path or history_path, dtype={'run': str, 'dev': str, 'key': str, 'app_version': str})
+    # 没有 results.json 的旧运行不知道脚本名，用空字符串代替，分组时可以和其他记录匹配
+    df['script'] = df['script'].fillna('')
+    return df.drop_duplicates(subset=['run', 'key', 'seq', 'step'], keep='last')
+
+
+def summarize(df, by=('dev',)):
+    """
+    计算每个步骤的耗时百分位数。
+
+    :param df: 历史记录。
+    :param by: 除脚本和步骤之外的分组列，例如 dev、app_version、build。
+    :return: 包含 runs、p50、p95、max 的 DataFrame。
+    """
+    keys = ['script', 'seq', 'step', *by]
+    grouped = df.groupby(keys, dropna=False)['duration']
+    return pd.DataFrame({
+        'runs': grouped.count(),
+        'p50': grouped.quantile(0.5),
+        'p95': grouped.quantile(0.95),
+        'max': grouped.max(),
+    }).round(3).reset_index()
+
+
+def select_runs(df, value):
+    """
+    :param df: 历史记录。
+    :param value: 运行目录名或 app_version。
+    :return: 属于这些运行或这个版本的记录。
+    """
+    return df[(df['run'] == value) | (df['app_version'].astype(str) == str(value))]
+
+
+def detect_regressions(df, candidate=None, baseline=None, min_runs=5, threshold=3.0, min_ratio=1.2):
+    """
+    找出候选运行中明显变慢的步骤，按设备分别比较。
+
+    对每个 (脚本, 步骤, 设备)，用基线耗时的中位数和 MAD（中位数绝对偏差）计算稳健 z 分数：
+    z = (候选中位数 - 基线中位数) / (1.4826 * MAD)，
+    z 超过 threshold 且耗时至少变为基线的 min_ratio 倍时视为退化。
+
+    :param df: 历史记录。
+    :param candidate: 候选运行目录名或 app_version，默认为最近一次运行。
+    :param baseline: 基线运行目录名或 app_version，默认为候选之前的所有运行。
+    :param min_runs: 基线至少需要多少个样本。
+    :param threshold: 稳健 z 分数阈值。
+    :param min_ratio: 最小变慢倍数。
+    :return: 退化的步骤 DataFrame，按 z 分数从大到小排序。
+    """
+    if df.empty:
+        return pd.DataFrame()
+    candidate = candidate or df['run'].max()
+    current = select_runs(df, candidate)
+    if baseline is not None:
+        reference = select_runs(df, baseline)
+    else:
+        reference = df[df['run'] < current['run'].min()]
+
+    keys = ['script', 'seq', 'step', 'dev']
+    rows = []
+    reference_groups = dict(list(reference.groupby(keys, dropna=False)['duration']))
+    for group, durations in current.groupby(keys, dropna=False)['duration']:
+        base = reference_groups.get(group)
+        if base is None or len(base) < min_runs:
+            continue
+        median = base.median()
+        mad = (base - median).abs().median()
+        value = durations.median()
+        # MAD 为 0（基线耗时完全相同）时用中位数的 1% 作为最小离散度，避免除以 0
+        spread = max(1.4826 * mad, median * 0.01, 1e-3)
+        z = (value - median) / spread
+        if z > threshold and value >= median * min_ratio:
+            rows.append({**dict(zip(keys, group)), 'baseline_p50': round(median, 3),
+                         'baseline_runs': len(base), 'candidate': round(value, 3),
+                         'ratio': round(value / median, 2), 'z': round(z, 1)})
+    if not rows:
+        return pd.DataFrame(columns=keys + ['baseline_p50', 'baseline_runs', 'candidate', 'ratio', 'z'])
+    return pd.DataFrame(rows).sort_values('z', ascending=False).reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='历史运行耗时统计和性能退化检测')
+    parser.add_argument('command', choices=['index', 'report', 'regress'],
+                        help='index：扫描结果目录；report：各步骤耗时百分位数；regress：检测变慢的步骤')
+    parser.add_argument('--root', default=None, help='结果根目录，默认为 ./result')
+    parser.add_argument('--by', default='dev', help='report 的分组列，多个用逗号分隔，例如 dev,app_version')
+    parser.add_argument('--candidate', default=None, help='候选运行目录名或 app_version，默认为最近一次运行')
+    parser.add_argument('--baseline', default=None, help='基线运行目录名或 app_version，默认为候选之前的所有运行')
+    parser.add_argument('--min-runs', type=int, default=5, help='基线至少需要的样本数')
+    parser.add_argument('--threshold', type=float, default=3.0, help='稳健 z 分数阈值')
+    parser.add_argument('--min-ratio', type=float, default=1.2, help='最小变慢倍数')
+    parser.add_argument('--output', default=None, help='把结果保存为 CSV')
+    args = parser.parse_args()
+
+    count = index_history(args.root)
+    print(f"新增{count}条历史记录")
+    if args.command == 'index' or not os.path.isfile(history_path):
+        raise SystemExit(0)
+
+    history = load_history()
+    if args.command == 'report':
+        table = summarize(history, by=[column.strip() for column in args.by.split(',') if column.strip()])
+    else:
+        table = detect_regressions(history, args.candidate, args.baseline, args.min_runs, args.threshold,
+                                   args.min_ratio)
+        print(f"发现{len(table)}个变慢的步骤")
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(table.to_string(index=False))
+    if args.output:
+        table.to_csv(args.output, index=False, encoding='utf-8')
@@ -0,0 +1,132 @@
+# -*- encoding=utf-8 -*-
+# Append-only journal of job state transitions on top of the data.json snapshot
+import os
+import json
+import threading
+import traceback
+
+from atomic_io import atomic_write
+
+
+class RunJournal:
+    """
+    测试进度日志：data.json 是快照，每个任务的状态变化（queued / started / finished / reported）
+    以一行 JSON 追加到日志文件中，每次更新只写一行，不需要重写整个 data.json。
+
+    读取时先加载快照，再按顺序重放日志；compact() 把当前进度原子地写回快照并清空日志。
+    进程被强制结束时最多丢失正在写入的最后一行，重放时会跳过这一行。
+    """
+
+    def __init__(self, snapshot_path='data.json', path=None, fsync=True):
+        """
+        :param snapshot_path: 快照文件路径。
+        :param path: 日志文件路径，默认为快照路径加 l 后缀（data.jsonl）。
+        :param fsync: 每次追加后是否调用 fsync，保证断电后也不丢失已写入的记录。
+        """
+        self.snapshot_path = snapshot_path
+        self.path = path or snapshot_path + 'l'
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.file = None
+
+    def load(self):
+        """
+        读取快照并重放日志。
+
+        :return: 包含测试进度的字典，快照不存在时返回 None。
+        """
+        if not os.path.isfile(self.snapshot_path):
+            return None
+        with open(self.snapshot_path, 'r') as file:
+            data = json.load(file)
+
+        if os.path.isfile(self.path):
+            with open(self.path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    if not line.strip():
+                        continue
+                    try:
+                        self.apply(data, json.loads(line))
+                    except ValueError:
+                        # 进程被强制结束时最后一行可能没有写完
+                        print(f"忽略无法解析的日志行：{line[:200].rstrip()}")
+        return data
+
+    @staticmethod
+    def apply(data, record):
+        """
+        把一条日志记录应用到测试进度上。
+
+        只有 reported 记录会改变测试结果，其他状态只用于排查中断时各任务进行到了哪一步。
+        属于其他测试批次（log_dir_path 不同）的记录会被忽略。
+
+        :param data: 包含测试进度的字典。
+        :param record: 日志记录。
+        """
+        if record.get('run') != data.get('log_dir_path'):
+            return
+        if record.get('event') == 'reported':
+            data['tests'][record['key']] = record['report']
+
+    def append(self, data, event, key, **fields):
+        """
+        追加一条任务状态记录。
+
+        :param data: 包含测试进度的字典，用于标记记录所属的测试批次。
+        :param event: 状态，queued / started / finished / reported。
+        :param key: 任务标识。
+        :param fields: 其他字段，例如 dev、status、report。
+        """
+        record = {'run': data['log_dir_path'], 'event': event, 'key': key, **fields}
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self.lock:
+            try:
+                if self.file is None:
+                    self.file = open(self.path, 'a', encoding='utf-8')
+                    if not self._ends_with_newline():
+                        # 上一次中断时留下的半行单独成行，不影响新追加的记录
+                        self.file.write('\n')
+                self.file.write(line)
+                self.file.flush()
+                if self.fsync:
+                    os.fsync(self.file.fileno())
+            except Exception:
+                traceback.print_exc()
+
+    def _ends_with_newline(self):
+        """
+        :return: 日志文件为空或以换行结尾时返回 True。
+        """
+        with open(self.path, 'rb') as file:
+            file.seek(0, os.SEEK_END)
+            if file.tell() == 0:
+                return True
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) == b'\n'
+
+    def compact(self, data):
+        """
+        把测试进度写入快照并清空日志。
+
+        快照先写入临时文件再原子替换；替换之后、清空日志之前中断也没有关系，
+        重放 reported 记录只会得到相同的结果。
+
+        :param data: 包含测试进度的字典。
+        """
+        with self.lock:
+            with atomic_write(self.snapshot_path, fsync=True) as file:
+                json.dump(data, file, indent=4)
+
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            open(self.path, 'w').close()
+
+    def close(self):
+        """
+        关闭日志文件。
+        """
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
@@ -0,0 +1,221 @@
+# -*- encoding=utf-8 -*-
+# Incremental log.txt tailer and live per-device progress view
+import os
+import json
+import time
+import traceback
+
+from atomic_io import atomic_write
+
+
+class LogTailer:
+    """
+    增量读取正在运行的任务的 log.txt，每次只解析新增的字节。
+    """
+
+    def __init__(self, path):
+        """
+        :param path: log.txt 文件路径。
+        """
+        self.path = path
+        self.offset = 0
+        self.buffer = b''
+        self.last_activity = time.time()
+        self.size = 0
+
+    def poll(self):
+        """
+        读取新增的日志行。
+
+        :return: 事件列表，每个事件是一个字典：
+            step     - 完成了一个顶层步骤，包含 name、duration、failed；
+            bad_line - 无法解析的日志行，包含 line。
+        """
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return []
+        if size < self.offset:
+            # 日志文件被重新创建，从头读取
+            self.offset, self.buffer = 0, b''
+        if size == self.offset:
+            return []
+
+        with open(self.path, 'rb') as file:
+            file.seek(self.offset)
+            data = file.read(size - self.offset)
+        self.offset += len(data)
+        self.size = self.offset
+        self.last_activity = time.time()
+
+        lines = (self.buffer + data).split(b'\n')
+        # 最后一段可能是还没写完的行，留到下一次解析
+        self.buffer = lines.pop()
+
+        events = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                events.append({'type': 'bad_line', 'line': line[:200].decode('utf-8', errors='replace')})
+                continue
+            data = entry.get('data') or {}
+            if entry.get('tag') == 'function' and entry.get('depth') == 1:
+                start, end = data.get('start_time'), data.get('end_time')
+                events.append({
+                    'type': 'step',
+                    'name': data.get('name'),
+                    'duration': end - start if start is not None and end is not None else None,
+                    'failed': 'traceback' in data,
+                })
+        return events
+
+
+class ProgressBoard:
+    """
+    汇总所有运行中任务的实时进度，输出到控制台和 progress.json。
+    """
+
+    def __init__(self, json_path=None, console_interval=10, poll_interval=1):
+        """
+        :param json_path: progress.json 路径，为 None 时不写文件。
+        :param console_interval: 在控制台打印进度的间隔（秒），为 None 时不打印。
+        :param poll_interval: 读取日志的最小间隔（秒）。
+        """
+        self.json_path = json_path
+        self.console_interval = console_interval
+        self.poll_interval = poll_interval
+        self.jobs = {}
+        self.last_poll = 0
+        self.last_print = time.time()
+
+    def watch(self, job):
+        """
+        开始跟踪一个任务的日志。
+
+        :param job: 已启动的测试任务，需要包含 key、dev、path。
+        """
+        self.jobs[job['key']] = {
+            'dev': job['dev'],
+            'state': 'running',
+            'started': time.time(),
+            'step': None,
+            'steps': 0,
+            'failures': 0,
+            'bad_lines': 0,
+            'last_step_duration': None,
+            'last_activity': time.time(),
+            'tailer': LogTailer(os.path.join(job['path'], 'log.txt')),
+        }
+
+    def finish(self, job, status):
+        """
+        任务结束，读取剩余的日志并记录状态。
+
+        :param job: 测试任务。
+        :param status: 退出码。
+        """
+        item = self.jobs.get(job['key'])
+        if item is None:
+            return
+        self._poll_one(job['key'], item)
+        if job.get('disconnected'):
+            item['state'] = 'disconnected'
+        elif job.get('state'):
+            item['state'] = job['state']
+        else:
+            item['state'] = 'success' if status == 0 else 'failed'
+        item['status'] = status
+
+    def last_activity(self, key):
+        """
+        :param key: 任务标识。
+        :return: 任务日志最后一次增长的时间。
+        """
+        item = self.jobs.get(key)
+        return item['last_activity'] if item else None
+
+    def poll(self, force=False):
+        """
+        读取所有运行中任务的新增日志，并按间隔刷新进度输出。
+
+        :param force: 是否忽略读取间隔立即读取。
+        :return: 事件列表，每个事件额外包含 key 和 dev。
+        """
+        now = time.time()
+        if not force and now - self.last_poll < self.poll_interval:
+            return []
+        self.last_poll = now
+
+        events = []
+        for key, item in self.jobs.items():
+            if item['state'] == 'running':
+                events.extend(self._poll_one(key, item))
+
+        if self.json_path:
+            self.write_json()
+        if self.console_interval is not None and now - self.last_print >= self.console_interval:
+            self.last_print = now
+            self.print_console()
+        return events
+
+    def _poll_one(self, key, item):
+        """读取单个任务的新增日志并更新进度"""
+        tailer = item['tailer']
+        events = tailer.poll()
+        item['last_activity'] = tailer.last_activity
+        for event in events:
+            event['key'] = key
+            event['dev'] = item['dev']
+            if event['type'] == 'bad_line':
+                item['bad_lines'] += 1
+                print(f"[{key}] 无法解析的日志行：{event['line']}")
+            elif event['type'] == 'step':
+                item['steps'] += 1
+                item['step'] = event['name']
+                item['last_step_duration'] = event['duration']
+                if event['failed']:
+                    item['failures'] += 1
+        return events
+
+    def snapshot(self):
+        """
+        :return: 可以序列化为 JSON 的进度字典。
+        """
+        now = time.time()
+        return {
+            key: {
+                'dev': item['dev'],
+                'state': item['state'],
+                'step': item['step'],
+                'steps': item['steps'],
+                'failures': item['failures'],
+                'bad_lines': item['bad_lines'],
+                'last_step_duration': item['last_step_duration'],
+                'elapsed': round(now - item['started'], 1),
+                'idle': round(now - item['last_activity'], 1),
+            }
+            for key, item in self.jobs.items()
+        }
+
+    def write_json(self):
+        """把进度写入 progress.json"""
+        try:
+            with atomic_write(self.json_path) as file:
+                json.dump(self.snapshot(), file, indent=4, ensure_ascii=False)
+        except Exception:
+            traceback.print_exc()
+
+    def print_console(self):
+        """在控制台打印运行中任务的进度，最久没有日志的任务排在最前面"""
+        running = [(key, item) for key, item in self.snapshot().items() if item['state'] == 'running']
+        if not running:
+            return
+        print(f"----- {len(running)} running -----")
+        for key, item in sorted(running, key=lambda pair: pair[1]['idle'], reverse=True):
+            duration = item['last_step_duration']
+            print(f"{key:<40} step {item['steps']:>3} {item['step'] or '-':<20} "
+                  f"last {duration if duration is None else round(duration, 1)}s "
+                  f"failures {item['failures']} idle {item['idle']}s elapsed {item['elapsed']}s")
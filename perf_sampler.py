@@ -0,0 +1,282 @@
+# -*- encoding=utf-8 -*-
+# Background per-job device performance sampler (CPU, memory, FPS, temperature)
+import os
+import re
+import csv
+import math
+import time
+import threading
+import traceback
+
+from devices.Device import Device, SNAPSHOT_SEPARATOR
+
+perf_file = 'perf.csv'
+PERF_FIELDS = ['time', 'cpu', 'mem_kb', 'fps', 'jank', 'temp']
+
+SPARK_CHARS = '▁▂▃▄▅▆▇█'
+
+FRAMES_PATTERN = re.compile(r'Total frames rendered:\s*(\d+)')
+JANK_PATTERN = re.compile(r'Janky frames:\s*(\d+)')
+MEM_PATTERN = re.compile(r'TOTAL(?: PSS)?:?\s+(\d+)')
+TEMP_PATTERN = re.compile(r'temperature:\s*(-?\d+)')
+
+
+def parse_cpu_jiffies(stat_line, pid_stat):
+    """
+    :param stat_line: /proc/stat 的第一行。
+    :param pid_stat: /proc/<pid>/stat 的内容。
+    :return: (整机总 jiffies, 进程 utime + stime)，无法解析时对应的值为 None。
+    """
+    total, process = None, None
+    fields = stat_line.split()
+    if fields and fields[0] == 'cpu':
+        total = sum(int(value) for value in fields[1:] if value.isdigit())
+    # 进程名中可能有空格，从最后一个右括号之后开始按位置读取
+    fields = pid_stat[pid_stat.rfind(')') + 1:].split()
+    if len(fields) > 12 and fields[11].isdigit() and fields[12].isdigit():
+        process = int(fields[11]) + int(fields[12])
+    return total, process
+
+
+class PerfSampler:
+    """
+    在测试任务运行期间，按固定间隔采集被测应用的 CPU、内存、帧率和设备温度，写入任务日志目录下的 perf.csv。
+
+    每次采样只执行一条 adb shell 命令，多个命令的输出用分隔行隔开。
+    """
+
+    def __init__(self, device, package_name, path, interval=1):
+        """
+        :param device: Device。
+        :param package_name: 被测应用的包名。
+        :param path: perf.csv 路径。
+        :param interval: 采样间隔（秒）。
+        """
+        self.device = device
+        self.package_name = package_name
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+        self.pid = None
+        self.last = None
+
+    def start(self):
+        """
+        在后台线程中开始采样。
+        """
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, wait=False):
+        """
+        停止采样。
+
+        :param wait: 是否等待采样线程结束。
+        """
+        self.stopped.set()
+        if wait and self.thread is not None:
+            self.thread.join()
+
+    def _run(self):
+        try:
+            with open(self.path, 'w', newline='', encoding='utf-8') as file:
+                writer = csv.writer(file)
+                writer.writerow(PERF_FIELDS)
+                while not self.stopped.is_set():
+                    start = time.time()
+                    row = self.sample()
+                    if row is not None:
+                        writer.writerow(row)
+                        file.flush()
+                    self.stopped.wait(max(0, self.interval - (time.time() - start)))
+        except Exception:
+            traceback.print_exc()
+
+    def sample(self):
+        """
+        采集一次性能数据。
+
+        :return: perf.csv 的一行，第一次采样只用于建立 CPU 和帧数的基准，返回 None。
+        """
+        package = self.package_name
+        commands = [
+            f'pidof {package}',
+            'head -1 /proc/stat',
+            f'cat /proc/{self.pid}/stat' if self.pid else 'true',
+            f"dumpsys gfxinfo {package} | grep -E 'Total frames rendered|Janky frames'",
+            f"dumpsys meminfo {package} | grep -E 'TOTAL'",
+            'dumpsys battery | grep temperature',
+        ]
+        output = self.device.adb_command(
+            'shell "' + f'; echo {SNAPSHOT_SEPARATOR}; '.join(commands) + '"') or ''
+        now = time.time()
+        parts = output.split(SNAPSHOT_SEPARATOR)
+        parts += [''] * (len(commands) - len(parts))
+        pid_output, stat_line, pid_stat, gfxinfo, meminfo, battery = [part.strip() for part in parts[:len(commands)]]
+
+        pid = pid_output.split()[0] if pid_output.split() else None
+        if pid != self.pid:
+            # 应用启动或重启，下一次采样读取新进程的 CPU 时间
+            self.pid, pid_stat = pid, ''
+        total, process = parse_cpu_jiffies(stat_line, pid_stat)
+        frames = FRAMES_PATTERN.search(gfxinfo)
+        jank = JANK_PATTERN.search(gfxinfo)
+        mem = MEM_PATTERN.search(meminfo)
+        temp = TEMP_PATTERN.search(battery)
+        current = {
+            'time': now,
+            'total': total,
+            'process': process,
+            'frames': int(frames.group(1)) if frames else None,
+            'jank': int(jank.group(1)) if jank else None,
+        }
+        last, self.last = self.last, current
+        if last is None:
+            return None
+
+        cpu, fps, janky = None, None, None
+        if None not in (total, process, last['total'], last['process']) and total > last['total']:
+            cpu = round(100.0 * max(0, process - last['process']) / (total - last['total']), 1)
+        if current['frames'] is not None and last['frames'] is not None and current['frames'] >= last['frames']:
+            fps = round((current['frames'] - last['frames']) / (now - last['time']), 1)
+        if current['jank'] is not None and last['jank'] is not None and current['jank'] >= last['jank']:
+            janky = current['jank'] - last['jank']
+        return [
+            round(now, 2),
+            cpu,
+            int(mem.group(1)) if mem else None,
+            fps,
+            janky,
+            int(temp.group(1)) / 10 if temp else None,
+        ]
+
+
+class PerfMonitor:
+    """
+    为每个运行中的测试任务启动一个 PerfSampler，任务结束时停止。
+    """
+
+    def __init__(self, packages, interval=1, adb_path=r'adb', adb_client=None):
+        """
+        :param packages: 被测应用的包名，或 {序列号: 包名} 字典。
+        :param interval: 采样间隔（秒）。
+        :param adb_path: adb 路径。
+        :param adb_client: AdbClient，设置后通过 adb 服务的套接字执行 shell 命令。
+        """
+        self.packages = packages
+        self.interval = interval
+        self.adb_path = adb_path
+        self.adb_client = adb_client
+        self.samplers = {}
+
+    def package_for(self, serial):
+        """
+        :param serial: 设备序列号。
+        :return: 这台设备上被测应用的包名，没有配置时返回 None。
+        """
+        if isinstance(self.packages, dict):
+            return self.packages.get(serial)
+        return self.packages
+
+    def start(self, job):
+        """
+        开始采集任务的性能数据。
+
+        :param job: 已启动的测试任务，需要包含 key、dev、path。
+        """
+        package_name = self.package_for(job['dev'])
+        if not package_name:
+            return
+        try:
+            device = Device(self.adb_path, job['dev'], self.adb_client)
+            self.samplers[job['key']] = PerfSampler(
+                device, package_name, os.path.join(job['path'], perf_file), self.interval).start()
+        except Exception:
+            traceback.print_exc()
+
+    def stop(self, job):
+        """
+        停止采集任务的性能数据，不等待正在进行的采样。
+
+        :param job: 已结束的测试任务。
+        """
+        sampler = self.samplers.pop(job['key'], None)
+        if sampler is not None:
+            sampler.stop()
+
+    def close(self):
+        """
+        停止所有采样并等待采样线程结束。
+        """
+        for sampler in self.samplers.values():
+            sampler.stop(wait=True)
+        self.samplers.clear()
+
+
+def percentile(values, q):
+    """
+    :param values: 已排序的数值列表。
+    :param q: 百分位（0~100）。
+    :return: 最近秩百分位数。
+    """
+    index = max(0, math.ceil(q / 100.0 * len(values)) - 1)
+    return values[index]
+
+
+def sparkline(values, width=30):
+    """
+    :param values: 数值列表。
+    :param width: 最多显示的字符数，数据较多时按区间取平均。
+    :return: 由方块字符组成的迷你折线图。
+    """
+    if not values:
+        return ''
+    if len(values) > width:
+        step = len(values) / width
+        values = [sum(chunk) / len(chunk) for chunk in
+                  (values[int(i * step):int((i + 1) * step)] for i in range(width)) if chunk]
+    low, high = min(values), max(values)
+    if high == low:
+        return SPARK_CHARS[0] * len(values)
+    scale = (len(SPARK_CHARS) - 1) / (high - low)
+    return ''.join(SPARK_CHARS[int((value - low) * scale)] for value in values)
+
+
+def summarize_perf(log_dir):
+    """
+    汇总任务的性能数据。
+
+    :param log_dir: 任务的日志目录。
+    :return: {指标: {p50, p90, max, spark}} 字典，没有 perf.csv 或没有数据时返回 None。
+    """
+    path = os.path.join(log_dir, perf_file)
+    if not os.path.isfile(path):
+        return None
+    series = {field: [] for field in PERF_FIELDS[1:]}
+    try:
+        with open(path, 'r', newline='', encoding='utf-8') as file:
+            for row in csv.DictReader(file):
+                for field in series:
+                    try:
+                        series[field].append(float(row[field]))
+                    except (TypeError, ValueError):
+                        # 空值或采样线程正在写入的不完整行
+                        continue
+    except Exception:
+        traceback.print_exc()
+        return None
+
+    summary = {}
+    for field, values in series.items():
+        if not values:
+            continue
+        ordered = sorted(values)
+        summary[field] = {
+            'p50': round(percentile(ordered, 50), 1),
+            'p90': round(percentile(ordered, 90), 1),
+            'max': round(ordered[-1], 1),
+            'spark': sparkline(values),
+        }
+    return summary or None
@@ -0,0 +1,201 @@
+# -*- encoding=utf-8 -*-
+# Parallel, version-aware APK provisioning driven by apk_info.json
+import os
+import json
+import time
+import struct
+import zipfile
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from devices.Device import Device
+
+apk_info_path = 'apk_info.json'
+
+# AndroidManifest.xml 中 versionCode / versionName 属性的资源 ID，属性名被混淆时使用
+VERSION_CODE_RES_ID = 0x0101021b
+VERSION_NAME_RES_ID = 0x0101021c
+
+RES_STRING_POOL_TYPE = 0x0001
+RES_XML_RESOURCE_MAP_TYPE = 0x0180
+RES_XML_START_ELEMENT_TYPE = 0x0102
+TYPE_STRING = 0x03
+UTF8_FLAG = 0x100
+
+
+def load_apk_info(path=None):
+    """
+    读取 apk_info.json。
+
+    文件的每个顶层键是一组应用，值为 {序列号: {"apk_path": ..., "package_name": ...}}。
+
+    :param path: apk_info.json 路径。
+    :return: {序列号: {"apk_path": ..., "package_name": ...}} 字典。
+    """
+    with open(path or apk_info_path, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+    apps = {}
+    for group in data.values():
+        for serial, info in group.items():
+            apps[serial] = info
+    return apps
+
+
+def load_package_names(path=None):
+    """
+    :param path: apk_info.json 路径。
+    :return: 每台设备的被测应用包名 {序列号: 包名}，文件不存在或无法读取时返回空字典。
+    """
+    if not os.path.isfile(path or apk_info_path):
+        return {}
+    try:
+        return {serial: info.get('package_name') for serial, info in load_apk_info(path).items()}
+    except Exception:
+        traceback.print_exc()
+        return {}
+
+
+def _read_string_pool(data, offset):
+    """解析二进制 XML 的字符串池"""
+    header_size, chunk_size, count, _, flags, strings_start = struct.unpack_from('<HIIIII', data, offset + 2)
+    offsets = struct.unpack_from(f'<{count}I', data, offset + header_size)
+    base = offset + strings_start
+    strings = []
+    for string_offset in offsets:
+        pos = base + string_offset
+        if flags & UTF8_FLAG:
+            # UTF-8：先是字符数，再是字节数，各占 1 或 2 个字节
+            pos += 2 if data[pos] & 0x80 else 1
+            length = data[pos]
+            if length & 0x80:
+                length = ((length & 0x7f) << 8) | data[pos + 1]
+                pos += 1
+            pos += 1
+            strings.append(data[pos:pos + length].decode('utf-8', errors='replace'))
+        else:
+            length = struct.unpack_from('<H', data, pos)[0]
+            if length & 0x8000:
+                length = ((length & 0x7fff) << 16) | struct.unpack_from('<H', data, pos + 2)[0]
+                pos += 2
+            pos += 2
+            strings.append(data[pos:pos + length * 2].decode('utf-16-le', errors='replace'))
+    return strings
+
+
+def parse_manifest_version(data):
+    """
+    从二进制 AndroidManifest.xml 中读取 versionCode 和 versionName。
+
+    :param data: AndroidManifest.xml 的内容。
+    :return: (versionCode, versionName)，读取不到时为 None。
+    """
+    strings, resource_ids = [], []
+    offset = struct.unpack_from('<H', data, 2)[0]
+    while offset + 8 <= len(data):
+        chunk_type, header_size, chunk_size = struct.unpack_from('<HHI', data, offset)
+        if chunk_type == RES_STRING_POOL_TYPE:
+            strings = _read_string_pool(data, offset)
+        elif chunk_type == RES_XML_RESOURCE_MAP_TYPE:
+            count = (chunk_size - header_size) // 4
+            resource_ids = struct.unpack_from(f'<{count}I', data, offset + header_size)
+        elif chunk_type == RES_XML_START_ELEMENT_TYPE:
+            name_index = struct.unpack_from('<I', data, offset + 20)[0]
+            if strings[name_index] == 'manifest':
+                attr_start, attr_size, attr_count = struct.unpack_from('<HHH', data, offset + 24)
+                version_code, version_name = None, None
+                for i in range(attr_count):
+                    pos = offset + header_size + attr_start + i * attr_size
+                    _, attr_name, raw_value, _, _, data_type, value = struct.unpack_from('<IIIHBBI', data, pos)
+                    res_id = resource_ids[attr_name] if attr_name < len(resource_ids) else None
+                    if res_id == VERSION_CODE_RES_ID or strings[attr_name] == 'versionCode':
+                        version_code = value
+                    elif res_id == VERSION_NAME_RES_ID or strings[attr_name] == 'versionName':
+                        index = value if data_type == TYPE_STRING else raw_value
+                        version_name = strings[index] if index < len(strings) else None
+                return version_code, version_name
+        if chunk_size <= 0:
+            break
+        offset += chunk_size
+    return None, None
+
+
+def read_apk_version(apk_path):
+    """
+    读取 APK 文件的 versionCode 和 versionName。
+
+    :param apk_path: APK 文件路径。
+    :return: (versionCode, versionName)。
+    """
+    with zipfile.ZipFile(apk_path) as apk:
+        return parse_manifest_version(apk.read('AndroidManifest.xml'))
+
+
+def provision_device(device, apk_path, package_name, apk_version):
+    """
+    在单台设备上安装 APK，设备上已经是同一个版本时跳过。
+
+    :param device: Device。
+    :param apk_path: APK 文件路径。
+    :param package_name: 包名。
+    :param apk_version: APK 文件的 versionCode。
+    :return: 安装结果字典。
+    """
+    start = time.time()
+    result = {'dev': device.device_serial_number, 'package_name': package_name, 'version': apk_version}
+    sdk, installed_version = device.get_sdk_and_version_code(package_name)
+    result['installed_version'] = installed_version
+
+    if apk_version is not None and installed_version == apk_version:
+        result['status'] = 'current'
+    else:
+        # Android 7.0 (API 24) 及以上支持流式安装，不需要先把 APK 推送到设备上
+        ok, output = device.install_apk(apk_path, streaming=sdk is not None and sdk >= 24)
+        result['status'] = 'installed' if ok else 'failed'
+        if not ok:
+            result['error'] = output
+    result['seconds'] = round(time.time() - start, 3)
+    return result
+
+
+def provision(serials=None, path=None, max_workers=4, adb_path=r'adb', adb_client=None):
+    """
+    在运行测试之前，按 apk_info.json 并行给设备安装 APK。
+
+    :param serials: 要安装的设备序列号列表，默认为 apk_info.json 中的所有设备。
+    :param path: apk_info.json 路径。
+    :param max_workers: 同时安装的设备数量。
+    :param adb_path: adb 路径。
+    :param adb_client: AdbClient，设置后通过 adb 服务的套接字执行 shell 命令。
+    :return: 每台设备的安装结果列表。
+    """
+    apps = load_apk_info(path)
+    serials = [serial for serial in (serials if serials is not None else apps) if serial in apps]
+
+    # 同一个 APK 只读取一次版本号
+    versions = {}
+    for serial in serials:
+        apk_path = apps[serial]['apk_path']
+        if apk_path not in versions:
+            try:
+                versions[apk_path] = read_apk_version(apk_path)[0]
+            except Exception as e:
+                print(f"读取{apk_path}版本号失败：{e}")
+                versions[apk_path] = None
+
+    def install(serial):
+        info = apps[serial]
+        try:
+            device = Device(adb_path, serial, adb_client)
+            return provision_device(device, info['apk_path'], info['package_name'], versions[info['apk_path']])
+        except Exception as e:
+            traceback.print_exc()
+            return {'dev': serial, 'package_name': info.get('package_name'), 'status': 'failed', 'error': str(e),
+                    'seconds': 0}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(install, serials))
+
+    for item in results:
+        print(f"{item['dev']}: {item['status']} {item.get('package_name')} "
+              f"(version {item.get('version')}, installed {item.get('installed_version')}) in {item['seconds']}s")
+    return results
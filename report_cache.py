@@ -0,0 +1,146 @@
+# -*- encoding=utf-8 -*-
+# In-process, content-hash cached generation of per-device Airtest reports
+import os
+import hashlib
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from atomic_io import atomic_write
+
+# 保存在日志目录中的报告摘要文件，记录生成 log.html 时日志内容的哈希值
+digest_file = 'report.sha1'
+
+# 生成报告时产生的文件，不参与哈希计算
+generated_files = ('log.html', digest_file)
+
+_pool = None
+_pool_size = None
+_pool_lock = threading.Lock()
+
+
+def log_digest(log_dir):
+    """
+    计算日志目录内容的哈希值：log.txt 和截图按内容计算，录屏等大文件按文件名和大小计算。
+
+    :param log_dir: 日志目录。
+    :return: 十六进制哈希字符串。
+    """
+    sha1 = hashlib.sha1()
+    for name in sorted(os.listdir(log_dir)):
+        path = os.path.join(log_dir, name)
+        if name in generated_files or not os.path.isfile(path):
+            continue
+        stem, ext = os.path.splitext(name)
+        # 缩略图是生成报告时产生的
+        if stem.endswith('_small'):
+            continue
+        sha1.update(name.encode('utf-8'))
+        if name == 'log.txt' or ext.lower() in ('.jpg', '.jpeg', '.png'):
+            with open(path, 'rb') as file:
+                for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                    sha1.update(chunk)
+        else:
+            sha1.update(str(os.path.getsize(path)).encode('utf-8'))
+    return sha1.hexdigest()
+
+
+def is_report_current(log_dir, log_html, digest):
+    """
+    检查报告是否已经是最新的。
+
+    :param log_dir: 日志目录。
+    :param log_html: 报告文件路径。
+    :param digest: 当前日志内容的哈希值。
+    :return: 报告存在且生成时的日志内容与当前一致时返回 True。
+    """
+    digest_path = os.path.join(log_dir, digest_file)
+    if not os.path.isfile(log_html) or not os.path.isfile(digest_path):
+        return False
+    with open(digest_path, 'r') as file:
+        return file.read().strip() == digest
+
+
+def render_report(air, log_dir, log_html, lang='zh'):
+    """
+    调用 airtest 的报告接口生成 log.html，与 airtest report 命令的行为相同。
+
+    在报告进程池中运行，每个进程只导入一次 airtest。
+
+    :param air: Airtest脚本的路径。
+    :param log_dir: 日志目录。
+    :param log_html: 报告文件路径。
+    :param lang: 报告语言，zh 或 en。
+    """
+    from airtest.report.report import LogToHtml, HTML_TPL, STATIC_DIR
+
+    air = os.path.abspath(air)
+    script_name = os.path.basename(air).replace('.air', '.py')
+    rpt = LogToHtml(air, log_dir, STATIC_DIR, script_name=script_name, lang=lang)
+    rpt.report(HTML_TPL, output_file=log_html)
+
+
+def set_pool_size(max_workers):
+    """
+    设置报告进程的数量，在进程池创建（生成第一份报告）之前调用，shutdown_pool() 之后可以重新设置。
+
+    :param max_workers: 进程数量，为 None 时使用 CPU 核数。
+    """
+    global _pool_size
+    with _pool_lock:
+        _pool_size = max_workers
+
+
+def get_pool(max_workers=None):
+    """
+    获取报告进程池，首次调用时创建。
+
+    :param max_workers: 进程数量，默认为 set_pool_size() 设置的数量或 CPU 核数。
+    :return: ProcessPoolExecutor。
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            max_workers = max_workers or _pool_size
+            # 使用 spawn 启动报告进程（Windows 上的默认方式）。用 fork 时，报告线程创建进程的同时主线程可能正在
+            # 启动 airtest run，子进程会继承 Popen 内部的管道，主线程一直等到报告进程退出
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def shutdown_pool():
+    """
+    关闭报告进程池。
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def build_report(air, log_dir, log_html, lang='zh'):
+    """
+    生成单个日志目录的报告，日志内容没有变化时直接复用已有的报告。
+
+    :param air: Airtest脚本的路径。
+    :param log_dir: 日志目录。
+    :param log_html: 报告文件路径。
+    :param lang: 报告语言，zh 或 en。
+    :return: 成功返回0，失败返回-1。
+    """
+    digest = log_digest(log_dir)
+    if is_report_current(log_dir, log_html, digest):
+        print(f"Report is up to date: {log_html}")
+        return 0
+
+    try:
+        get_pool().submit(render_report, air, log_dir, log_html, lang).result()
+    except Exception:
+        traceback.print_exc()
+        return -1
+
+    with atomic_write(os.path.join(log_dir, digest_file)) as file:
+        file.write(digest)
+    return 0
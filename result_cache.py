@@ -0,0 +1,197 @@
+# -*- encoding=utf-8 -*-
+# Content-addressed cache of passing results keyed on script, APK and device fingerprint
+import os
+import json
+import time
+import hashlib
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from devices.Device import Device
+from atomic_io import atomic_write
+from provision import load_package_names
+
+cache_path = 'result_cache.json'
+
+# 计算脚本摘要时跳过的目录：airtest 默认的日志目录和 Python 缓存
+IGNORED_DIRS = {'log', '__pycache__'}
+
+
+def script_digest(air):
+    """
+    计算 .air 脚本目录的摘要，包括脚本和所有模板图片。
+
+    :param air: Airtest脚本的路径。
+    :return: 十六进制摘要。
+    """
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(air):
+        dirs[:] = sorted(name for name in dirs if name not in IGNORED_DIRS)
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, air).replace('\\', '/').encode('utf-8'))
+            with open(path, 'rb') as file:
+                for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_fingerprint(serial, package_name=None, adb_path=r'adb', adb_client=None):
+    """
+    读取设备指纹。
+
+    :param serial: 设备序列号。
+    :param package_name: 被测应用的包名。
+    :param adb_path: adb 路径。
+    :param adb_client: AdbClient，设置后通过 adb 服务的套接字执行 shell 命令。
+    :return: (ro.build.fingerprint, 已安装的 APK versionCode)，读取失败时返回 None。
+    """
+    try:
+        device = Device(adb_path, serial, adb_client)
+        build, version = device.get_build_fingerprint(package_name)
+        return (build, version) if build else None
+    except Exception:
+        traceback.print_exc()
+        return None
+
+
+def read_fingerprints(serials, packages=None, adb_path=r'adb', adb_client=None, max_workers=None):
+    """
+    并行读取多台设备的指纹。
+
+    :param serials: 设备序列号列表。
+    :param packages: {序列号: 包名} 字典，默认读取 apk_info.json。
+    :param adb_path: adb 路径。
+    :param adb_client: AdbClient，设置后通过 adb 服务的套接字执行 shell 命令。
+    :param max_workers: 同时读取的设备数量，默认为 CPU 核数。
+    :return: {序列号: (ro.build.fingerprint, 已安装的 APK versionCode) 或 None} 字典。
+    """
+    serials = list(serials)
+    if not serials:
+        return {}
+    packages = load_package_names() if packages is None else packages
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1) as pool:
+        fingerprints = pool.map(lambda serial: read_fingerprint(serial, packages.get(serial), adb_path, adb_client),
+                                serials)
+        return dict(zip(serials, fingerprints))
+
+
+class ResultCache:
+    """
+    跨测试批次的结果缓存。
+
+    缓存键是 脚本目录摘要 + 设备序列号 + 设备 ro.build.fingerprint + 已安装的 APK versionCode 的哈希，
+    这些内容都没有变化时，之前成功的结果直接复用，汇总报告链接到原来的报告。
+    """
+
+    def __init__(self, path=None, adb_path=r'adb', adb_client=None, max_workers=None):
+        """
+        :param path: 缓存文件路径，默认为 result_cache.json。
+        :param adb_path: adb 路径。
+        :param adb_client: AdbClient，设置后通过 adb 服务的套接字执行 shell 命令。
+        :param max_workers: 同时读取设备指纹的设备数量，默认为 CPU 核数。
+        """
+        self.path = path or cache_path
+        self.adb_path = adb_path
+        self.adb_client = adb_client
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.lock = threading.Lock()
+        self.entries = self._load()
+        self.digests = {}
+        self.fingerprints = {}
+        self.packages = None
+        self.dirty = False
+
+    def _load(self):
+        """
+        :return: 缓存文件中的条目，文件不存在或损坏时返回空字典。
+        """
+        if not os.path.isfile(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except Exception:
+            traceback.print_exc()
+            return {}
+
+    def prefetch(self, serials):
+        """
+        并行读取多台设备的指纹，每台设备在一次测试批次中只读取一次。
+
+        :param serials: 设备序列号列表。
+        """
+        serials = [serial for serial in serials if serial is not None and serial not in self.fingerprints]
+        if not serials:
+            return
+        if self.packages is None:
+            self.packages = load_package_names()
+        self.fingerprints.update(read_fingerprints(serials, self.packages, self.adb_path, self.adb_client,
+                                                   self.max_workers))
+
+    def key_for(self, air, serial):
+        """
+        计算任务的缓存键。
+
+        :param air: Airtest脚本的路径。
+        :param serial: 设备序列号。
+        :return: 缓存键，设备未知或读取不到设备指纹时返回 None。
+        """
+        if serial is None:
+            return None
+        self.prefetch([serial])
+        fingerprint = self.fingerprints.get(serial)
+        if fingerprint is None:
+            return None
+        if air not in self.digests:
+            try:
+                self.digests[air] = script_digest(air)
+            except OSError:
+                traceback.print_exc()
+                self.digests[air] = None
+        if self.digests[air] is None:
+            return None
+        build, version = fingerprint
+        return hashlib.sha1(f"{self.digests[air]}\n{serial}\n{build}\n{version}".encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        :param key: 缓存键。
+        :return: 缓存条目，包含 report、log_dir、time；没有缓存或原来的报告已被删除时返回 None。
+        """
+        if key is None:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None or not os.path.isfile(os.path.join(entry['log_dir'], 'log.html')):
+            return None
+        return entry
+
+    def put(self, key, report, log_dir):
+        """
+        记录一个成功的结果。
+
+        :param key: 缓存键。
+        :param report: 测试结果。
+        :param log_dir: 任务的日志目录。
+        """
+        if key is None:
+            return
+        with self.lock:
+            self.entries[key] = {'report': report, 'log_dir': log_dir, 'time': time.time()}
+            self.dirty = True
+
+    def save(self):
+        """
+        把缓存原子地写回文件。
+        """
+        with self.lock:
+            if not self.dirty:
+                return
+            try:
+                with atomic_write(self.path) as file:
+                    json.dump(self.entries, file, indent=4, ensure_ascii=False)
+                self.dirty = False
+            except Exception:
+                traceback.print_exc()
@@ -1,51 +1,320 @@
 # -*- encoding=utf-8 -*-
 # Run Airtest in parallel on multi-device
 import os
+import argparse
 import traceback
 import subprocess
 import webbrowser
 import time
 import json
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 from airtest.core.android.adb import ADB
 from jinja2 import Environment, FileSystemLoader
 
-
-def run(devices, air, run_all=False):
+from scheduler import Scheduler, make_jobs
+from worker import WorkerPool
+from report_cache import build_report, shutdown_pool, set_pool_size
+from provision import provision, load_package_names
+from log_tailer import ProgressBoard
+from journal import RunJournal
+from result_cache import ResultCache, read_fingerprint
+from perf_sampler import PerfMonitor, summarize_perf
+from history import index_history, run_results_file
+from shots import ShotStore, shots_dir_name
+from tracing import tracer, trace_file, trace_summary_file
+from dashboard import update_dashboard, summarize_run, row_state, write_jsonp, run_summary_file
+from devices.DeviceRegistry import get_registry
+from devices.ExcelStore import get_store
+from devices.DeviceMonitor import DeviceMonitor
+from device_selection import select_devices
+from sharding import find_scripts, load_durations, save_durations, record_durations, make_shard_jobs
+
+
+def run(devices, air, run_all=False, report_workers=None, max_jobs=None, shard=False, warm=False,
+        provision_apps=False, progress=False, job_timeout=None, idle_timeout=None, watch_devices=False,
+        use_cache=True, retries=0, retry_backoff=5, quarantine_rate=None, perf=False, perf_package=None,
+        perf_interval=1, dedup_shots=False, shot_quality=None, shot_max_size=None, trace=True,
+        coverage=None, coverage_mode='all'):
     """
     运行测试脚本的主函数。
 
     :param devices: 要进行测试的设备列表。
-    :param air: 测试脚本的路径。
+    :param air: 测试脚本的路径，或多个测试脚本路径组成的列表。
     :param run_all: 是否重新开始测试。True 表示从头开始测试，False 表示从data.json保存的进度继续测试。
+    :param report_workers: 同时生成报告的最大数量，默认为 CPU 核数。
+    :param max_jobs: 同时运行的最大测试任务数，默认为 CPU 核数。
+    :param shard: 是否使用分片模式。True 表示每个脚本只在一台空闲设备上运行一次，按历史时长从长到短分配。
+    :param warm: 是否使用常驻工作进程。True 表示每台设备只启动一次 airtest 并保持连接，依次运行脚本。
+    :param provision_apps: 是否在测试前按 apk_info.json 给设备安装 APK，已是最新版本的设备会跳过。
+    :param progress: 是否在控制台定时打印每台设备的实时进度。进度始终写入日志目录下的 progress.json。
+    :param job_timeout: 单个任务的最长运行时间（秒），超时的任务会被终止并记录为 timeout。
+    :param idle_timeout: 任务的 log.txt 超过多少秒没有增长视为卡死，会被终止并记录为 timeout。
+    :param watch_devices: 是否监听设备的连接和断开。新上线的设备会加入设备池，断开设备上的任务会被终止并重新排队。
+    :param use_cache: 是否使用结果缓存。脚本、APK版本和设备系统都没有变化时，直接复用之前成功的结果。
+    :param retries: 失败的任务在本次运行中最多重试的次数，重试任务利用空闲设备立即运行。
+    :param retry_backoff: 第一次重试前等待的时间（秒），之后每次重试翻倍。
+    :param quarantine_rate: 设备的失败率达到多少（0~1）时隔离这台设备，本次运行不再使用，为 None 时不隔离。
+    :param perf: 是否在每个任务运行时采集被测应用的 CPU、内存、帧率和设备温度，写入日志目录下的 perf.csv。
+    :param perf_package: 被测应用的包名，默认使用 apk_info.json 中为每台设备配置的包名。
+    :param perf_interval: 性能数据的采样间隔（秒）。
+    :param dedup_shots: 是否在生成报告前把截图按内容去重，存放到运行目录下的 _shots 目录。
+    :param shot_quality: 截图重新编码的 JPEG 质量，为 None 时保持原文件。
+    :param shot_max_size: 截图长边的最大像素数，为 None 时不缩小。
+    :param trace: 是否记录各阶段的耗时，写入运行目录下的 trace.json（Chrome trace 格式）和 trace.txt。
+    :param coverage: 按设备属性选择设备的维度列表，例如 ['android', 'ram', 'soc']，只在覆盖所有取值的最少设备上运行，
+        优先选择历史通过率高、运行快的设备。为 None 时使用所有设备。
+    :param coverage_mode: 覆盖方式。all 覆盖所有维度取值的组合，pairwise 覆盖任意两个维度的取值组合，each 覆盖每个维度的每个取值。
     """
+    tracer.enabled = trace
+    # 报告进程与报告线程数量相同
+    set_pool_size(report_workers)
+    workers = WorkerPool() if warm else None
+    cache = ResultCache() if use_cache and not shard else None
+    perf_monitor = PerfMonitor(perf_package or load_package_names(), perf_interval) if perf else None
+    monitor = DeviceMonitor(devices).start() if watch_devices else None
     try:
-        # 加载测试进度数据
-        results = load_json_data(air, run_all)
+        scripts = [air] if isinstance(air, str) else list(air)
+
+        if coverage:
+            # 按 device_info.xlsx 中的属性选出覆盖所有取值的最少设备
+            with tracer.span('select_devices'):
+                devices = select_devices(devices, coverage, coverage_mode, scripts, device_info_path)
 
-        # 在多个设备上启动测试任务
-        tasks = run_on_multi_device(devices, air, results, run_all)
+        if provision_apps:
+            # 并行安装 APK，设备上已经是同一个版本时跳过
+            with tracer.span('provision'):
+                provision(devices)
 
-        for task in tasks:
-            # 等待每个测试任务完成
-            status = task['process'].wait()
+        # 加载测试进度数据
+        with tracer.span('load_json_data'):
+            results = load_json_data(', '.join(scripts), run_all)
 
-            # 生成单个设备的测试报告，并更新测试状态
-            results['tests'][task['dev']] = run_one_report(task['air'], task)
-            results['tests'][task['dev']]['status'] = status
+        # 同一次运行的所有任务共用一个截图存放目录，内容相同的截图只保存一份
+        shot_store = ShotStore(os.path.join(results['log_dir_path'], shots_dir_name), shot_quality,
+                               shot_max_size) if dedup_shots else None
 
-            # 将当前的测试结果保存到data.json文件
-            json.dump(results, open('data.json', "w"), indent=4)
+        if shard:
+            # 分片模式：把脚本分配到所有设备上，最长的脚本最先开始
+            durations = load_durations()
+            jobs = skip_finished_jobs(make_shard_jobs(scripts, durations), results, run_all)
+        else:
+            # 生成 (脚本 × 设备) 任务队列
+            jobs = run_on_multi_device(devices, scripts, results, run_all)
+            if cache is not None:
+                # 跳过脚本、APK版本和设备系统都没有变化的已成功任务
+                with tracer.span('cache_prefetch'):
+                    cache.prefetch(devices)
+                with tracer.span('skip_cached_jobs'):
+                    jobs = skip_cached_jobs(jobs, results, cache)
+
+        # 有界并发地执行任务，按完成顺序收集结果并并行生成报告
+        scheduler = Scheduler(
+            devices,
+            start_job=lambda job, dev: start_job(job, dev, results, workers),
+            report_job=lambda job: report_job(job, results, shot_store, cache),
+            on_report=lambda job, status, report: save_job_result(results, job, status, report, cache),
+            max_jobs=max_jobs,
+            report_workers=report_workers,
+            progress=ProgressBoard(
+                json_path=os.path.join(results['log_dir_path'], 'progress.json'),
+                console_interval=10 if progress else None,
+            ),
+            job_timeout=job_timeout,
+            idle_timeout=idle_timeout,
+            monitor=monitor,
+            # 分片模式下新设备直接领取队列中的脚本，否则为新设备加入每个脚本的任务
+            on_device_added=None if shard else (
+                lambda dev: skip_cached_jobs(skip_finished_jobs(make_jobs(scripts, [dev]), results, run_all),
+                                             results, cache)),
+            # 每次状态变化只向 data.jsonl 追加一行，进程被强制结束后也能继续上一次的进度
+            on_state=lambda job, state, status: on_job_state(results, job, state, status, perf_monitor),
+            retries=retries,
+            retry_backoff=retry_backoff,
+            quarantine_rate=quarantine_rate,
+            # 按属性选择设备时，选择之外的设备留给其他测试
+            fixed_devices=bool(coverage),
+        )
+        scheduler.submit(jobs)
+        with tracer.span('schedule', jobs=len(jobs)):
+            scheduler.run()
+
+        # 所有任务结束后把日志合并到data.json
+        with tracer.span('save_json_data'):
+            save_json_data(results)
+
+        if shard:
+            # 记录本次各脚本的运行时长，供下一次分片规划使用
+            record_durations(results, durations)
+            save_durations(durations)
 
         # 生成所有测试的汇总报告
-        run_summary(results)
+        with tracer.span('run_summary'):
+            run_summary(results)
+
+        # 把本次运行各步骤的耗时追加到历史记录中
+        try:
+            with tracer.span('index_history'):
+                index_history()
+        except Exception as e:
+            traceback.print_exc()
         # update_device_run_count(results['tests'])
 
+        if trace:
+            save_trace(results['log_dir_path'])
+
 
     except Exception as e:
         # 如果出现异常，打印堆栈跟踪信息
         traceback.print_exc()
+    finally:
+        if monitor is not None:
+            monitor.stop()
+        if workers is not None:
+            workers.close()
+        if cache is not None:
+            cache.save()
+        if perf_monitor is not None:
+            perf_monitor.close()
+        shutdown_pool()
+        run_journal.close()
+        # 运行结束时统一写回设备信息和设备计数
+        get_store().flush()
+
+
+def on_job_state(results, job, state, status, perf_monitor=None):
+    """
+    任务状态变化时，追加到data.jsonl日志中，并开始或停止采集任务的性能数据。
+
+    :param results: 包含测试进度的字典。
+    :param job: 测试任务。
+    :param state: queued / started / finished。
+    :param status: 任务结束时的退出码。
+    :param perf_monitor: PerfMonitor，为 None 时不采集性能数据。
+    """
+    # 每次状态变化只向 data.jsonl 追加一行，进程被强制结束后也能继续上一次的进度
+    run_journal.append(results, state, job['key'], dev=job['dev'], status=status)
+    # 记录任务排队和运行的时间段，运行中的任务放在所在设备的泳道上
+    if state == 'queued':
+        job['trace_queued'] = tracer.now()
+    elif state == 'started':
+        job['trace_started'] = tracer.now()
+        if 'trace_queued' in job:
+            tracer.add('queued', job['trace_queued'], job['trace_started'], 'queue', job['dev'], key=job['key'],
+                       dev=job['dev'], script=job['air'], attempt=job.get('attempt'))
+    elif state == 'finished' and 'trace_started' in job:
+        tracer.add('test', job['trace_started'], tracer.now(), 'job', job['dev'], key=job['key'], dev=job['dev'],
+                   script=job['air'], attempt=job.get('attempt'), status=status)
+    if perf_monitor is not None:
+        if state == 'started':
+            perf_monitor.start(job)
+        elif state == 'finished':
+            perf_monitor.stop(job)
+
+
+def save_trace(log_dir_path):
+    """
+    把本次运行的耗时记录写入运行目录，并打印耗时分析。
+
+    :param log_dir_path: 运行目录。
+    """
+    try:
+        tracer.save(os.path.join(log_dir_path, trace_file))
+        text = tracer.critical_path()
+        with open(os.path.join(log_dir_path, trace_summary_file), 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(text)
+    except Exception as e:
+        traceback.print_exc()
+    finally:
+        tracer.clear()
+
+
+def record_build(results, dev, cache=None):
+    """
+    记录设备的 ro.build.fingerprint 和被测应用的 versionCode，历史耗时可以按版本对比。每台设备只读取一次。
+
+    :param results: 包含测试进度的字典。
+    :param dev: 设备序列号。
+    :param cache: ResultCache，已经读取过的设备指纹直接使用。
+    """
+    builds = results.setdefault('builds', {})
+    if dev is None or dev in builds:
+        return
+    fingerprint = cache.fingerprints.get(dev) if cache is not None else None
+    if fingerprint is None:
+        with tracer.span('record_build', dev=dev):
+            fingerprint = read_fingerprint(dev, load_package_names().get(dev))
+    if fingerprint is not None:
+        builds[dev] = {'fingerprint': fingerprint[0], 'app_version': fingerprint[1]}
+
+
+def report_job(job, results, shot_store=None, cache=None):
+    """
+    在报告线程中生成任务的报告，同时记录设备的系统版本，所有任务结束后不再逐台读取。
+
+    :param job: 已完成的测试任务。
+    :param results: 包含测试进度的字典。
+    :param shot_store: ShotStore，见 run_one_report。
+    :param cache: ResultCache，已经读取过的设备指纹直接使用。
+    :return: run_one_report 返回的报告信息。
+    """
+    record_build(results, job['dev'], cache)
+    return run_one_report(job['air'], job, shot_store)
+
+
+def save_job_result(results, job, status, report, cache=None):
+    """
+    更新单个任务的测试状态，并追加到data.jsonl日志中。
+
+    :param results: 包含测试进度的字典。
+    :param job: 已完成的测试任务。
+    :param status: airtest run 进程的退出码。
+    :param report: run_one_report 返回的报告信息。
+    :param cache: ResultCache，成功的结果会写入缓存，为 None 时不缓存。
+    """
+    results['tests'][job['key']] = report
+    results['tests'][job['key']]['status'] = status
+    results['tests'][job['key']]['dev'] = job['dev']
+    results['tests'][job['key']]['script'] = job['air']
+    if job.get('attempts'):
+        # 每次运行的设备、状态和日志目录，包括失败后重试的运行
+        results['tests'][job['key']]['attempts'] = job['attempts']
+    if job.get('state'):
+        # 被看门狗终止（timeout）、设备一直没有重新连接（disconnected）或设备被隔离（quarantined）的任务
+        results['tests'][job['key']]['state'] = job['state']
+        if job.get('timeout'):
+            results['tests'][job['key']]['timeout'] = job['timeout']
+    else:
+        results['tests'][job['key']]['state'] = 'success' if status == 0 else 'failed'
+    run_journal.append(results, 'reported', job['key'], report=results['tests'][job['key']])
+    if cache is not None and status == 0 and not job.get('state') and report.get('path'):
+        cache.put(job.get('cache_key'), results['tests'][job['key']], job['path'])
+
+
+def save_json_data(results):
+    """
+    将测试进度原子地保存到data.json文件，并清空data.jsonl日志。
+
+    :param results: 包含测试进度的字典。
+    """
+    try:
+        run_journal.compact(results)
+    except Exception as e:
+        traceback.print_exc()
+
+
+def compact_json_data():
+    """
+    把data.jsonl日志中的进度合并到data.json。
+    """
+    data = run_journal.load()
+    if data is None:
+        print("未找到data.json，无需合并")
+        return
+    save_json_data(data)
 
 
 def load_json_data(air, run_all):
@@ -56,15 +325,9 @@ def load_json_data(air, run_all):
     :param run_all: 是否重新开始测试。True 表示从头开始测试，False 表示从data.json保存的进度继续测试。
     :return: 返回包含测试进度的字典。
     """
-    # 拼接当前工作目录和data.json文件的完整路径
-    json_file = os.path.join(os.getcwd(), 'data.json')
-
-    # 检查是否需要继续上一次的进度
-    if (not run_all) and os.path.isfile(json_file):
-        # 使用with语句打开文件，确保文件正确关闭
-        with open(json_file, 'r') as file:
-            data = json.load(file)
-
+    # 检查是否需要继续上一次的进度：读取data.json快照，再重放data.jsonl日志
+    data = None if run_all else run_journal.load()
+    if data is not None:
         # 更新开始时间
         data['start'] = time.time()
         return data
@@ -78,53 +341,114 @@ def load_json_data(air, run_all):
         }
         # 创建一个时间戳文件夹，用于存放日志
         data['log_dir_path'] = create_time_folder(data['start'])
+        # 写入新的快照并清空上一次的日志
+        save_json_data(data)
         return data
 
 
-def run_on_multi_device(devices, air, results, run_all):
+def run_on_multi_device(devices, scripts, results, run_all):
     """
-    在多台设备上运行Airtest脚本。
+    生成在多台设备上运行Airtest脚本的任务队列。
 
     :param devices: 设备列表。
-    :param air: Airtest脚本的路径。
+    :param scripts: Airtest脚本路径列表。
     :param results: 包含之前测试结果的字典。
     :param run_all: 是否重新开始测试。True 表示重新开始，False 表示继续之前的测试。
     :return: 返回一个包含测试任务的列表。
     """
-    tasks = []
-    for dev in devices:
-        # 检查是否需要跳过当前设备的测试
-        if not run_all and results['tests'].get(dev) and results['tests'][dev].get('status') == 0:
-            print(f"Skip device {dev}")
+    return skip_finished_jobs(make_jobs(scripts, devices), results, run_all)
+
+
+def skip_finished_jobs(jobs, results, run_all):
+    """
+    过滤掉上一次已经成功完成的任务。
+
+    :param jobs: 测试任务列表。
+    :param results: 包含之前测试结果的字典。
+    :param run_all: 是否重新开始测试。True 表示重新开始，False 表示继续之前的测试。
+    :return: 需要运行的测试任务列表。
+    """
+    pending = []
+    for job in jobs:
+        # 检查是否需要跳过当前任务
+        if not run_all and results['tests'].get(job['key']) and results['tests'][job['key']].get('status') == 0:
+            print(f"Skip job {job['key']}")
             continue
+        pending.append(job)
+    return pending
 
-        # 为每个设备创建一个日志目录
-        log_dir = create_device_folder(dev, results['log_dir_path'])
-
-        # 构造Airtest运行命令
-        cmd = [
-            "airtest",
-            "run",
-            air,
-            "--device",
-            f"Android:///{dev}",
-            "--log",
-            log_dir,
-            "--recording"
-        ]
 
-        try:
-            # 使用subprocess启动测试，并将任务添加到任务列表
-            tasks.append({
-                'process': subprocess.Popen(cmd, cwd=os.getcwd()),
-                'dev': dev,
-                'air': air,
-                'path': log_dir,
-            })
-        except Exception as e:
-            # 打印异常信息
-            traceback.print_exc()
-    return tasks
+def skip_cached_jobs(jobs, results, cache):
+    """
+    过滤掉结果缓存中已经成功的任务，汇总报告直接链接到之前的报告。
+
+    :param jobs: 测试任务列表。
+    :param results: 包含测试进度的字典。
+    :param cache: ResultCache，为 None 时不过滤。
+    :return: 需要运行的测试任务列表。
+    """
+    if cache is None:
+        return jobs
+    pending = []
+    for job in jobs:
+        job['cache_key'] = cache.key_for(job['air'], job['dev'])
+        entry = cache.get(job['cache_key'])
+        if entry is None:
+            pending.append(job)
+            continue
+
+        print(f"Skip job {job['key']}: cached result from {entry['log_dir']}")
+        # 报告路径相对于本次的日志目录
+        path = os.path.relpath(entry['log_dir'], results['log_dir_path'])
+        report = dict(entry['report'])
+        # 重试记录和性能数据属于之前的运行，本次运行没有执行这个任务
+        report.pop('attempts', None)
+        report.pop('perf', None)
+        report['path'] = os.path.join(path, 'log.html')
+        report['log_path'] = os.path.join(path, 'log.txt')
+        report['cached'] = True
+        report['cached_from'] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry['time']))
+        results['tests'][job['key']] = report
+        run_journal.append(results, 'reported', job['key'], report=report)
+    return pending
+
+
+def start_job(job, dev, results, workers=None):
+    """
+    在指定设备上启动一个测试任务。
+
+    :param job: 测试任务。
+    :param dev: 运行任务的设备序列号。
+    :param results: 包含测试进度的字典。
+    :param workers: 常驻工作进程池，为 None 时每个任务启动一个 airtest run 进程。
+    :return: airtest run 进程，或工作进程中的任务对象。
+    """
+    # 为每个任务创建一个日志目录，重试的任务使用新的目录，保留之前失败的日志
+    attempt = job.get('attempt', 1)
+    log_dir = create_device_folder(job['key'] if attempt == 1 else f"{job['key']}_{attempt}", results['log_dir_path'])
+    job['dev'] = dev
+    job['path'] = log_dir
+    job['rel_path'] = os.path.relpath(log_dir, results['log_dir_path'])
+
+    # 构造Airtest运行命令
+    cmd = [
+        "airtest",
+        "run",
+        job['air'],
+        "--device",
+        f"Android:///{dev}",
+        "--log",
+        log_dir,
+        "--recording"
+    ]
+
+    with tracer.span('spawn', 'job', dev, key=job['key'], dev=dev, script=job['air'], attempt=attempt):
+        if workers is not None:
+            # 在设备的常驻工作进程中运行，工作进程不可用时回退到 airtest run
+            return workers.start(dev, job['air'], log_dir, cmd)
+
+        # 使用subprocess启动测试
+        return subprocess.Popen(cmd, cwd=os.getcwd())
 
 
 def create_log_dir(device, timestamp):
@@ -136,7 +460,7 @@ def create_log_dir(device, timestamp):
     :return: 创建的日志目录的路径。
     """
     # 基础目录路径
-    base_dir = '.\\result'
+    base_dir = os.path.join('.', 'result')
 
     # 将时间戳转换为时间元组
     time_tuple = time.localtime(timestamp)
@@ -168,7 +492,7 @@ def create_time_folder(timestamp):
     :return: 创建的文件夹的路径。
     """
     # 基础目录
-    base_dir = '.\\result'
+    base_dir = os.path.join('.', 'result')
 
     # 将时间戳转换为时间元组
     time_tuple = time.localtime(timestamp)
@@ -209,12 +533,13 @@ def create_device_folder(device, time_folder_dir):
     return device_folder_dir
 
 
-def run_one_report(air, task_temp):
+def run_one_report(air, task_temp, shot_store=None):
     """
     为单个脚本生成测试报告。
 
     :param task_temp:
     :param air: Airtest脚本的路径。
+    :param shot_store: ShotStore，设置后先把截图按内容去重再生成报告。
     :return: 包含测试报告信息的字典。
     """
     # 为设备创建日志目录
@@ -222,56 +547,159 @@ def run_one_report(air, task_temp):
     dev = task_temp['dev']
     log_txt = os.path.join(log_dir, 'log.txt')
     log_html = os.path.join(log_dir, 'log.html')
+    with tracer.span('report', 'job', key=task_temp.get('key', dev), dev=dev, script=air,
+                     attempt=task_temp.get('attempt')):
+        try:
+            # 如果日志文件存在，生成测试报告
+            if os.path.isfile(log_txt):
+                if shot_store is not None:
+                    try:
+                        shot_store.process(log_dir)
+                    except Exception as e:
+                        # 去重失败时保留原来的截图，不影响报告生成
+                        traceback.print_exc()
+                # 在报告进程池中生成报告，日志没有变化时直接复用已有的报告
+                ret = build_report(air, log_dir, log_html, lang='zh')
+                device_name = get_devices(dev)
+                path = os.path.join('.', task_temp.get('rel_path', dev))
+                report = {
+                    'status': ret,
+                    'device_name': device_name,
+                    'path': os.path.join(path, 'log.html'),
+                    'log_path': os.path.join(path, 'log.txt')
+                }
+                # 任务运行时采集了性能数据的，在汇总报告中显示百分位数和迷你折线图
+                perf = summarize_perf(log_dir)
+                if perf:
+                    report['perf'] = perf
+                return report
+            else:
+                print(f"Report build Failed. File not found in dir {log_txt}")
+        except Exception as e:
+            traceback.print_exc()
+
+        return {'status': -1, 'device': dev, 'path': ''}
+
+
+def report_all(report_workers=None):
+    """
+    根据data.json重新生成所有设备的报告和汇总报告，日志没有变化的报告会直接复用。
+
+    :param report_workers: 同时生成报告的最大数量，默认为 CPU 核数。
+    """
+    if not os.path.isfile('data.json'):
+        print("未找到data.json，无法重新生成报告")
+        return
+
     try:
-        # 如果日志文件存在，生成测试报告
-        if os.path.isfile(log_txt):
-            cmd = [
-                "airtest",
-                "report",
-                air,
-                "--log_root",
-                log_dir,
-                "--outfile",
-                log_html,
-                "--lang",
-                "zh"
-            ]
-            ret = subprocess.call(cmd, shell=True, cwd=os.getcwd())
-            device_name = get_devices(dev)
-            path = f".\\{dev}"
-            return {
-                'status': ret,
-                'device_name': device_name,
-                'path': os.path.join(path, 'log.html'),
-                'log_path': os.path.join(path, 'log.txt')
-            }
-        else:
-            print(f"Report build Failed. File not found in dir {log_txt}")
+        results = load_json_data(None, run_all=False)
+        tasks = []
+        for key, item in results['tests'].items():
+            if not item.get('log_path'):
+                continue
+            rel_path = os.path.dirname(item['log_path'])
+            tasks.append({
+                'key': key,
+                'air': item.get('script', results['script']),
+                'dev': item.get('dev', key),
+                'path': os.path.join(results['log_dir_path'], rel_path),
+                'rel_path': rel_path,
+            })
+
+        set_pool_size(report_workers)
+        with ThreadPoolExecutor(max_workers=report_workers or os.cpu_count()) as pool:
+            reports = pool.map(lambda task: run_one_report(task['air'], task), tasks)
+            for task, report in zip(tasks, reports):
+                # 保留原来的测试状态，只更新报告信息
+                for field in ('state', 'timeout', 'cached', 'cached_from', 'attempts'):
+                    if field in results['tests'][task['key']]:
+                        report[field] = results['tests'][task['key']][field]
+                report['status'] = results['tests'][task['key']]['status']
+                report['dev'] = task['dev']
+                report['script'] = task['air']
+                results['tests'][task['key']] = report
+
+        save_json_data(results)
+        run_summary(results)
     except Exception as e:
         traceback.print_exc()
+    finally:
+        shutdown_pool()
 
-    return {'status': -1, 'device': dev, 'path': ''}
+
+def results_index(data):
+    """
+    生成汇总报告的结果索引，每个任务一行，只包含汇总页面需要的字段。
+
+    :param data: 包含所有测试数据的字典。
+    :return: 结果索引列表。
+    """
+    rows = []
+    for n, (key, item) in enumerate(data['tests'].items(), 1):
+        dev = item.get('dev', item.get('device', key))
+        try:
+            info = get_registry(device_info_path).get(dev) if dev else None
+        except Exception:
+            # 没有设备信息文件时不显示品牌和安卓版本
+            info = None
+        attempts = item.get('attempts', [])
+        state = row_state(item)
+        if state == 'success' and item.get('cached'):
+            state = 'cached'
+        rows.append({
+            'n': n,
+            'key': key,
+            'dev': dev,
+            # 生成报告失败时的结果没有 device_name
+            'name': item.get('device_name') or 'NULL',
+            'brand': str(info['品牌']) if info is not None else None,
+            'android': str(info['安卓版本']) if info is not None else None,
+            'state': state,
+            'title': item.get('timeout') if state == 'timeout' else item.get('cached_from'),
+            'path': item.get('path', ''),
+            'duration': attempts[-1].get('duration') if attempts else None,
+            'attempts': [f"#{attempt['attempt']} {attempt['dev']} {attempt['state']} {attempt['duration']}s "
+                         f"({attempt['rel_path']})" for attempt in attempts],
+            'perf': item.get('perf'),
+        })
+    return rows
 
 
 def run_summary(data):
     """
     生成测试的汇总报告。
 
+    汇总页面只包含标题和成功率，设备列表在页面打开后从 results.js 中加载，分页显示。
+
     :param data: 包含所有测试数据的字典。
     """
     try:
+        rows = results_index(data)
+        run_info = summarize_run(data, rows)
         summary = {
+            'script': data['script'],
             'time': "%.3f" % (time.time() - data['start']),
-            'success': [item['status'] for item in data['tests'].values()].count(0),
-            'count': len(data['tests'])
+            'success': run_info['success'],
+            'count': run_info['count'],
+            'rate': run_info['success'] * 100 / run_info['count'] if run_info['count'] else 0,
+            'start': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(data['start'])),
         }
-        summary.update(data)
-        summary['start'] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(data['start']))
+        write_jsonp(os.path.join(data['log_dir_path'], results_index_file), 'loadResults', rows)
         env = Environment(loader=FileSystemLoader(os.getcwd()), trim_blocks=True)
-        html = env.get_template('report_tpl.html').render(data=summary)
         report_path = os.path.join(data['log_dir_path'], 'report.html')
         with open(report_path, "w", encoding="utf-8") as f:
-            f.write(html)
+            env.get_template('report_tpl.html').stream(
+                data=summary, data_file=results_index_file, page_size=report_page_size).dump(f)
+        # 在运行目录中保存一份测试结果，历史记录按它来对应任务、设备和版本
+        with open(os.path.join(data['log_dir_path'], run_results_file), "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+        # 跨运行的汇总页面按运行摘要增量更新
+        with open(os.path.join(data['log_dir_path'], run_summary_file), "w", encoding="utf-8") as f:
+            json.dump(run_info, f, ensure_ascii=False)
+        try:
+            update_dashboard(os.path.dirname(os.path.normpath(data['log_dir_path'])))
+        except Exception as e:
+            traceback.print_exc()
         webbrowser.open(report_path)
     except Exception as e:
         traceback.print_exc()
@@ -287,15 +715,13 @@ def get_devices(dev):
     print(f"开始查询{dev}")
 
     try:
-        # 使用pandas读取指定工作表的Excel文件
-        df = pd.read_excel(device_info_path)
-
-        # 查找匹配的行
-        matched_row = df[df.iloc[:, 1] == dev]
+        # 从设备信息索引中查询，Excel 只在文件变化时重新读取
+        with tracer.span('get_devices', 'registry', dev=dev):
+            row = get_registry(device_info_path).get(dev)
 
         # 如果找到匹配的行，返回设备型号
-        if not matched_row.empty:
-            return matched_row.iloc[0, 3]  # 假设设备型号在第4列
+        if row is not None:
+            return row['名称']
         else:
             return 'NULL'
     except FileNotFoundError:
@@ -310,74 +736,85 @@ def update_device_run_count(results_tests):
     """
     更新或添加设备运行脚本的次数。
 
-    :param results_tests: 包含测试结果的字典，其中key是设备序列号。
+    修改先保存在写回缓存中，运行结束时统一写入Excel文件。
+
+    :param results_tests: 包含测试结果的字典，其中key是任务标识。
     """
-    try:
-        # 读取Excel文件
-        file_path = './devices/device_count.xlsx'
-        df = pd.read_excel(file_path)
-
-        # 遍历results_tests中的每个设备序列号
-        for dev_serial, data in results_tests.items():
-            if data['status'] == 0:
-                # 检查序列号是否在DataFrame中
-                if dev_serial in df['序列号'].values:
-                    # 如果在，则增加运行次数
-                    df.loc[df['序列号'] == dev_serial, '运行次数'] += 1
-                else:
-                    # 如果不在，则添加新行
-                    new_row = {
-                        '序列号': dev_serial,
-                        '名称': data['device_name'],
-                        '运行次数': 1
-                    }
-                    df = df.append(new_row, ignore_index=True)
-
-        # 将更新后的DataFrame写回Excel文件
-        df.to_excel(file_path, index=False)
-    except FileNotFoundError:
-        print("未找到设备计数文件")
-    except Exception as e:
-        print(f"处理设备计数文件时出错：{e}")
+    file_path = './devices/device_count.xlsx'
+    store = get_store()
+
+    # 遍历results_tests中的每个设备序列号
+    for key, data in results_tests.items():
+        if data['status'] == 0:
+            store.update(file_path, partial(increase_run_count, data.get('dev', key), data.get('device_name')))
+
+
+def increase_run_count(dev_serial, device_name, df):
+    """
+    在设备计数表中把设备的运行次数加一。
+
+    :param dev_serial: 设备序列号。
+    :param device_name: 设备名称。
+    :param df: 设备计数表。
+    :return: 更新后的设备计数表。
+    """
+    # 检查序列号是否在DataFrame中
+    if dev_serial in df['序列号'].values:
+        # 如果在，则增加运行次数
+        df.loc[df['序列号'] == dev_serial, '运行次数'] += 1
+    else:
+        # 如果不在，则添加新行
+        new_row = pd.DataFrame([{
+            '序列号': dev_serial,
+            '名称': device_name,
+            '运行次数': 1
+        }])
+        df = pd.concat([df, new_row], ignore_index=True)
+    return df
 
 
 def save_open_app_time(results, path):
     """
-    更新或添加设备运行脚本的次数
+    更新或添加设备打开应用的时间。
+
+    修改先保存在写回缓存中，运行结束时统一写入Excel文件。
     """
-    try:
-        # 读取Excel文件
-        df = pd.read_excel(path)
-        base_path = results['log_dir_path']
-        # 遍历results_tests中的每个设备序列号
-        for dev_serial, data in results['tests'].items():
-            if data['status'] == 0:
-                # 检查序列号是否在DataFrame中
-                log_path = f"{base_path}\\{dev_serial}\\log.txt"
-                print(log_path)
-                lost_time = read_txt(log_path)
-
-                if dev_serial in df['序列号'].values:
-                    # 如果在，则增加运行次数
-                    df.loc[df['序列号'] == dev_serial, '对比时间'] = lost_time
-                    df.loc[df['序列号'] == dev_serial, '实际时间'] = df.loc[df['序列号'] == dev_serial, '运行时间'] - df.loc[df['序列号'] == dev_serial, '对比时间']
-                else:
-                    # 如果不在，则添加新行
-                    new_row = {
-                        '序列号': dev_serial,
-                        '名称': data['device_name'],
-                        '运行时间': None,
-                        '对比时间': None,
-                        '实际时间': None
-                    }
-                    df = df.append(new_row, ignore_index=True)
-
-        # 将更新后的DataFrame写回Excel文件
-        df.to_excel(path, index=False)
-    except FileNotFoundError:
-        print("未找到设备计数文件")
-    except Exception as e:
-        print(f"处理设备计数文件时出错：{e}")
+    store = get_store()
+    base_path = results['log_dir_path']
+    # 遍历results_tests中的每个设备序列号
+    for key, data in results['tests'].items():
+        if data['status'] == 0:
+            log_path = os.path.join(base_path, data.get('log_path', os.path.join(key, 'log.txt')))
+            print(log_path)
+            lost_time = read_txt(log_path)
+            store.update(path, partial(update_open_app_time, data.get('dev', key), data.get('device_name'), lost_time))
+
+
+def update_open_app_time(dev_serial, device_name, lost_time, df):
+    """
+    在时间表中更新设备的对比时间和实际时间。
+
+    :param dev_serial: 设备序列号。
+    :param device_name: 设备名称。
+    :param lost_time: 从log.txt中读取的对比时间。
+    :param df: 时间表。
+    :return: 更新后的时间表。
+    """
+    # 检查序列号是否在DataFrame中
+    if dev_serial in df['序列号'].values:
+        df.loc[df['序列号'] == dev_serial, '对比时间'] = lost_time
+        df.loc[df['序列号'] == dev_serial, '实际时间'] = df.loc[df['序列号'] == dev_serial, '运行时间'] - df.loc[df['序列号'] == dev_serial, '对比时间']
+    else:
+        # 如果不在，则添加新行
+        new_row = pd.DataFrame([{
+            '序列号': dev_serial,
+            '名称': device_name,
+            '运行时间': None,
+            '对比时间': None,
+            '实际时间': None
+        }])
+        df = pd.concat([df, new_row], ignore_index=True)
+    return df
 
 
 def read_txt(path):
@@ -395,11 +832,66 @@ def read_txt(path):
     return None  # 如果没有找到"data-ret-time"，返回None
 
 
-device_info_path = r'.\devices\device_info.xlsx'
+device_info_path = os.path.join('.', 'devices', 'device_info.xlsx')
+run_journal = RunJournal('data.json')
+
+# 汇总报告的结果索引和每页显示的任务数
+results_index_file = 'results.js'
+report_page_size = 50
+
 
 if __name__ == '__main__':
-    devices_id_list = [tmp[0] for tmp in ADB().devices()]
-    # air_folder = "tutorial.air"
-    # run(devices_id_list, air_folder, run_all=True)
-    air_folder = "test.air"
-    run(devices_id_list, air_folder, run_all=True)
+    parser = argparse.ArgumentParser(description='多设备并行运行Airtest测试')
+    parser.add_argument('scripts', nargs='*', default=['test.air'], help='要运行的Airtest脚本，可以指定多个')
+    parser.add_argument('-j', '--max-jobs', type=int, default=None, help='同时运行的最大任务数，默认为 CPU 核数')
+    parser.add_argument('--report-workers', type=int, default=None, help='同时生成报告的最大数量，默认为 CPU 核数')
+    parser.add_argument('--resume', action='store_true', help='从data.json保存的进度继续测试')
+    parser.add_argument('--shard', action='store_true', help='分片模式：每个脚本只在一台空闲设备上运行一次')
+    parser.add_argument('--warm', action='store_true', help='每台设备使用一个常驻工作进程运行脚本，省去每个脚本的启动开销')
+    parser.add_argument('--report-only', action='store_true', help='不运行测试，根据data.json重新生成报告和汇总报告')
+    parser.add_argument('--provision', action='store_true', help='测试前按apk_info.json并行安装APK，已是最新版本的设备会跳过')
+    parser.add_argument('--progress', action='store_true', help='在控制台定时打印每台设备的实时进度')
+    parser.add_argument('--job-timeout', type=float, default=None, help='单个任务的最长运行时间（秒）')
+    parser.add_argument('--idle-timeout', type=float, default=None, help='log.txt 超过多少秒没有增长时终止任务')
+    parser.add_argument('--watch-devices', action='store_true', help='运行中加入新上线的设备，断开设备上的任务重新排队')
+    parser.add_argument('--compact', action='store_true', help='把data.jsonl中的进度合并到data.json后退出')
+    parser.add_argument('--no-cache', action='store_true', help='不使用结果缓存，重新运行所有任务')
+    parser.add_argument('--retries', type=int, default=0, help='失败的任务在本次运行中最多重试的次数')
+    parser.add_argument('--retry-backoff', type=float, default=5, help='第一次重试前等待的时间（秒），之后每次翻倍')
+    parser.add_argument('--quarantine-rate', type=float, default=None, help='设备失败率达到多少（0~1）时隔离设备')
+    parser.add_argument('--perf', action='store_true', help='运行时采集被测应用的CPU、内存、帧率和设备温度')
+    parser.add_argument('--perf-package', default=None, help='被测应用的包名，默认使用apk_info.json中的包名')
+    parser.add_argument('--perf-interval', type=float, default=1, help='性能数据的采样间隔（秒）')
+    parser.add_argument('--dedup-shots', action='store_true', help='生成报告前把截图按内容去重，存放到运行目录下的_shots目录')
+    parser.add_argument('--shot-quality', type=int, default=None, help='截图重新编码的JPEG质量，需要--dedup-shots')
+    parser.add_argument('--shot-max-size', type=int, default=None, help='截图长边的最大像素数，需要--dedup-shots')
+    parser.add_argument('--cover', default=None,
+                        help='按设备属性选择最少的设备，维度用逗号分隔，例如 android,ram,soc，也可以使用device_info.xlsx的列名')
+    parser.add_argument('--cover-mode', choices=['all', 'pairwise', 'each'], default='all',
+                        help='all：覆盖所有取值组合；pairwise：覆盖任意两个维度的取值组合；each：覆盖每个维度的每个取值')
+    parser.add_argument('--no-trace', action='store_true', help='不记录各阶段的耗时（运行目录下的trace.json和trace.txt）')
+    args = parser.parse_args()
+
+    if args.compact:
+        compact_json_data()
+        raise SystemExit(0)
+
+    if args.report_only:
+        report_all(args.report_workers)
+        raise SystemExit(0)
+
+    # 参数可以是 .air 脚本，也可以是包含多个 .air 脚本的目录
+    scripts = [air for path in args.scripts for air in find_scripts(path)]
+
+    # 设备探测在 run() 之前，先按参数设置是否记录耗时
+    tracer.enabled = not args.no_trace
+    with tracer.span('probe_devices'):
+        devices_id_list = [tmp[0] for tmp in ADB().devices()]
+    run(devices_id_list, scripts, run_all=not args.resume, report_workers=args.report_workers,
+        max_jobs=args.max_jobs, shard=args.shard, warm=args.warm, provision_apps=args.provision,
+        progress=args.progress, job_timeout=args.job_timeout, idle_timeout=args.idle_timeout,
+        watch_devices=args.watch_devices, use_cache=not args.no_cache, retries=args.retries,
+        retry_backoff=args.retry_backoff, quarantine_rate=args.quarantine_rate, perf=args.perf,
+        perf_package=args.perf_package, perf_interval=args.perf_interval, dedup_shots=args.dedup_shots,
+        shot_quality=args.shot_quality, shot_max_size=args.shot_max_size, trace=not args.no_trace,
+        coverage=args.cover.split(',') if args.cover else None, coverage_mode=args.cover_mode)
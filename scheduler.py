@@ -0,0 +1,434 @@
+# -*- encoding=utf-8 -*-
+# Bounded-concurrency job scheduler for running Airtest scripts on a device pool
+import os
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+def script_name(air):
+    """
+    获取脚本的名称，用于生成任务标识和日志目录。
+
+    :param air: Airtest脚本的路径。
+    :return: 脚本目录名，例如 test.air。
+    """
+    return os.path.basename(os.path.normpath(air))
+
+
+def make_jobs(scripts, devices):
+    """
+    为每个 (脚本, 设备) 组合生成一个测试任务。
+
+    只有一个脚本时任务标识就是设备序列号，与之前的data.json保持兼容；
+    多个脚本时任务标识为 "脚本名/设备序列号"。
+
+    :param scripts: Airtest脚本路径列表。
+    :param devices: 设备序列号列表。
+    :return: 测试任务列表。
+    """
+    multi = len(scripts) > 1
+    jobs = []
+    for air in scripts:
+        for dev in devices:
+            jobs.append({
+                'key': f"{script_name(air)}/{dev}" if multi else dev,
+                'air': air,
+                'dev': dev,
+            })
+    return jobs
+
+
+class Scheduler:
+    """
+    有界并发的测试任务调度器。
+
+    同时最多运行 max_jobs 个任务，每台设备同一时间只运行一个任务。
+    任务结束后立即把报告提交到线程池生成，并从队列中取出下一个任务补上空出的位置。
+    """
+
+    def __init__(self, devices, start_job, report_job, on_report, max_jobs=None, report_workers=None,
+                 poll_interval=0.2, progress=None, on_event=None, job_timeout=None, idle_timeout=None,
+                 monitor=None, on_device_added=None, reconnect_timeout=60, on_state=None,
+                 retries=0, retry_backoff=5, quarantine_rate=None, quarantine_min_jobs=3, fixed_devices=False):
+        """
+        :param devices: 设备序列号列表。
+        :param start_job: 启动任务的函数，接收 (job, dev)，返回带有 poll()/kill() 的进程对象。
+        :param report_job: 生成报告的函数，接收 job，返回报告信息字典。
+        :param on_report: 报告生成后的回调，接收 (job, status, report)。
+        :param max_jobs: 同时运行的最大任务数，默认为 CPU 核数。
+        :param report_workers: 同时生成报告的最大数量，默认为 CPU 核数。
+        :param poll_interval: 轮询进程状态的间隔（秒）。
+        :param progress: ProgressBoard，跟踪运行中任务的日志，为 None 时不跟踪。
+        :param on_event: 日志事件的回调，接收 ProgressBoard.poll() 返回的事件。
+        :param job_timeout: 单个任务的最长运行时间（秒），超时后终止任务，为 None 时不限制。
+        :param idle_timeout: 任务的 log.txt 多久没有增长视为卡死（秒），需要设置 progress，为 None 时不检查。
+        :param monitor: DeviceMonitor，运行中加入新上线的设备，并处理断开的设备，为 None 时不监听。
+        :param on_device_added: 新设备上线时的回调，接收设备序列号，返回要为它加入队列的任务列表。
+        :param reconnect_timeout: 队列中只剩断开设备的任务时，等待设备重新连接的时间（秒）。
+        :param on_state: 任务状态变化的回调，接收 (job, state, status)，state 为 queued / started / finished。
+        :param retries: 失败（包括超时）的任务最多重试的次数，重试任务在设备空闲时立即运行。
+        :param retry_backoff: 第一次重试前等待的时间（秒），之后每次重试翻倍。
+        :param quarantine_rate: 设备的失败率达到多少（0~1）时隔离这台设备，本次运行不再使用，为 None 时不隔离。
+        :param quarantine_min_jobs: 设备至少运行过多少个任务后才计算失败率。
+        :param fixed_devices: 是否只使用 devices 中的设备。True 时新上线的设备不加入设备池，断开的设备重新连接后仍然可以使用。
+        """
+        self.devices = list(devices)
+        self.idle_devices = list(devices)
+        self.start_job = start_job
+        self.report_job = report_job
+        self.on_report = on_report
+        self.max_jobs = max_jobs or os.cpu_count() or 1
+        self.report_workers = report_workers or os.cpu_count() or 1
+        self.poll_interval = poll_interval
+        self.progress = progress
+        self.on_event = on_event
+        self.job_timeout = job_timeout
+        self.idle_timeout = idle_timeout
+        self.monitor = monitor
+        self.on_device_added = on_device_added
+        self.reconnect_timeout = reconnect_timeout
+        self.on_state = on_state
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.quarantine_rate = quarantine_rate
+        self.quarantine_min_jobs = quarantine_min_jobs
+        self.fixed_devices = fixed_devices
+        self.offline_devices = {}
+        self.quarantined = set()
+        self.device_stats = {}
+
+        self.queue = deque()
+        self.running = []
+        self.reports = {}
+
+    def submit(self, jobs):
+        """
+        将任务加入等待队列。
+
+        :param jobs: 测试任务列表。
+        """
+        for job in jobs:
+            # 记录任务是否固定在某台设备上，设备断开后未固定的任务可以交给其他设备
+            job.setdefault('pinned', job['dev'] is not None)
+            self.queue.append(job)
+            self._notify(job, 'queued')
+
+    def _notify(self, job, state, status=None):
+        """
+        通知任务状态变化。
+
+        :param job: 测试任务。
+        :param state: queued / started / finished。
+        :param status: 任务结束时的退出码。
+        """
+        if self.on_state is None:
+            return
+        try:
+            self.on_state(job, state, status)
+        except Exception:
+            traceback.print_exc()
+
+    def run(self):
+        """
+        运行调度循环，直到队列中的任务全部执行完毕并生成报告。
+        """
+        with ThreadPoolExecutor(max_workers=self.report_workers) as pool:
+            self._dispatch()
+            while self.queue or self.running or self.reports:
+                self._poll_devices()
+                self._poll_progress()
+                self._check_timeouts()
+                self._collect_finished(pool)
+                self._dispatch()
+
+                if not self.reports:
+                    if self.queue and not self.running:
+                        self._drop_unreachable(pool)
+                    time.sleep(self.poll_interval)
+                    continue
+
+                # 等待报告完成，超时后回到循环继续检查进程
+                done, _ = wait(list(self.reports), timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._finish_report(future)
+
+            # 输出最终的进度
+            self._poll_progress(force=True)
+
+    def _poll_devices(self):
+        """
+        处理设备的上线和断开事件。
+        """
+        if self.monitor is None:
+            return
+        for event, dev in self.monitor.poll():
+            if event == 'add':
+                self._add_device(dev)
+            else:
+                self._remove_device(dev)
+
+    def _add_device(self, dev):
+        """
+        设备上线：加入设备池，新设备可以通过 on_device_added 获得自己的任务。
+
+        :param dev: 设备序列号。
+        """
+        if dev in self.offline_devices:
+            print(f"Device {dev} reconnected")
+            del self.offline_devices[dev]
+        elif dev in self.devices or self.fixed_devices:
+            return
+        else:
+            print(f"New device {dev} joined the pool")
+            self.devices.append(dev)
+            if self.on_device_added is not None:
+                self.submit(self.on_device_added(dev))
+        if dev in self.quarantined:
+            return
+        if dev not in self.idle_devices and all(job['dev'] != dev for job in self.running):
+            self.idle_devices.append(dev)
+
+    def _remove_device(self, dev):
+        """
+        设备断开：从空闲设备中移除，终止在这台设备上运行的任务，任务结束后重新排队。
+
+        :param dev: 设备序列号。
+        """
+        if dev not in self.devices or dev in self.offline_devices:
+            return
+        print(f"Device {dev} disconnected")
+        self.offline_devices[dev] = time.time()
+        if dev in self.idle_devices:
+            self.idle_devices.remove(dev)
+        for job in self.running:
+            if job['dev'] == dev and not job.get('disconnected'):
+                job['disconnected'] = True
+                try:
+                    job['process'].kill()
+                except Exception:
+                    traceback.print_exc()
+
+    def _requeue(self, job):
+        """
+        把因设备断开而终止的任务放回队列最前面，未固定设备的任务可以由其他设备执行。
+
+        :param job: 测试任务。
+        """
+        print(f"Requeue job {job['key']}")
+        for field in ('process', 'disconnected', 'started', 'state', 'timeout'):
+            job.pop(field, None)
+        if not job['pinned']:
+            job['dev'] = None
+        self.queue.appendleft(job)
+        self._notify(job, 'queued')
+
+    def _record_attempt(self, job, status):
+        """
+        记录任务的一次运行结果，并更新设备的失败率，失败率过高的设备会被隔离。
+
+        :param job: 已结束的测试任务。
+        :param status: 退出码。
+        :return: 本次运行是否失败（设备断开不算失败）。
+        """
+        if job.get('disconnected'):
+            state = 'disconnected'
+        else:
+            state = job.get('state') or ('success' if status == 0 else 'failed')
+        job.setdefault('attempts', []).append({
+            'attempt': job['attempt'],
+            'dev': job['dev'],
+            'status': status,
+            'state': state,
+            'duration': round(time.time() - job['started'], 1),
+            'rel_path': job.get('rel_path'),
+        })
+        if state == 'disconnected':
+            return False
+
+        failed = state != 'success'
+        stats = self.device_stats.setdefault(job['dev'], {'runs': 0, 'failures': 0})
+        stats['runs'] += 1
+        stats['failures'] += failed
+        # 不隔离最后一台可用的设备，否则剩下的任务都无法运行
+        others = [dev for dev in self.devices if dev != job['dev'] and dev not in self.quarantined
+                  and dev not in self.offline_devices]
+        if (self.quarantine_rate is not None and job['dev'] not in self.quarantined and others
+                and stats['runs'] >= self.quarantine_min_jobs
+                and stats['failures'] / stats['runs'] >= self.quarantine_rate):
+            print(f"Quarantine device {job['dev']}: {stats['failures']} of {stats['runs']} jobs failed")
+            self.quarantined.add(job['dev'])
+            if job['dev'] in self.idle_devices:
+                self.idle_devices.remove(job['dev'])
+        return failed
+
+    def _retry(self, job):
+        """
+        失败的任务还有重试次数时重新排队，等待退避时间后由空闲设备运行。
+
+        固定设备的任务在原设备上重试，设备已被隔离时不再重试；
+        未固定设备的任务优先交给还没有运行过它的设备。
+
+        :param job: 已结束的测试任务。
+        :return: 是否已重新排队。
+        """
+        failures = sum(attempt['state'] not in ('success', 'disconnected') for attempt in job['attempts'])
+        if failures > self.retries or (job['pinned'] and job['dev'] in self.quarantined):
+            return False
+        delay = self.retry_backoff * 2 ** (failures - 1)
+        print(f"Retry job {job['key']} in {delay}s ({failures}/{self.retries})")
+        job['not_before'] = time.time() + delay
+        self._requeue(job)
+        return True
+
+    def _drop_unreachable(self, pool):
+        """
+        队列里剩下的任务没有可用的设备时，等待断开的设备重新连接，超时后把这些任务记录为失败。
+
+        设备被隔离的任务记录为 quarantined，设备断开的任务记录为 disconnected；
+        正在等待重试退避时间的任务不受影响。已经运行过的任务（例如等待重试时设备被隔离）
+        使用最后一次运行的日志生成报告。
+
+        :param pool: 生成报告的线程池。
+        """
+        now = time.time()
+        if self.monitor is not None and any(now - since < self.reconnect_timeout
+                                            for since in self.offline_devices.values()):
+            return
+
+        usable = [dev for dev in self.devices if dev not in self.offline_devices and dev not in self.quarantined]
+        for job in list(self.queue):
+            if job['dev'] in usable or (job['dev'] is None and usable):
+                continue
+            print(f"Skip job {job['key']}: device {job['dev']} is not available")
+            self.queue.remove(job)
+            job['state'] = 'quarantined' if job['dev'] in self.quarantined else 'disconnected'
+            if job.get('attempts') and job.get('path'):
+                self.reports[pool.submit(self.report_job, job)] = (job, job['attempts'][-1]['status'])
+            else:
+                self.on_report(job, -1, {'status': -1, 'device': job['dev'], 'path': ''})
+
+    def _poll_progress(self, force=False):
+        """
+        读取运行中任务的新增日志，并把事件交给回调处理。
+
+        :param force: 是否忽略读取间隔立即读取。
+        """
+        if self.progress is None:
+            return
+        for event in self.progress.poll(force):
+            if self.on_event is not None:
+                self.on_event(event)
+
+    def _check_timeouts(self):
+        """
+        看门狗：终止运行超时或日志长时间没有增长的任务，任务结束后设备和位置会立即释放。
+        """
+        now = time.time()
+        for job in self.running:
+            if job.get('timeout') or job.get('disconnected'):
+                continue
+            reason = None
+            if self.job_timeout is not None and now - job['started'] > self.job_timeout:
+                reason = f"job ran longer than {self.job_timeout}s"
+            elif self.idle_timeout is not None and self.progress is not None:
+                last_activity = self.progress.last_activity(job['key'])
+                if last_activity is not None and now - last_activity > self.idle_timeout:
+                    reason = f"log.txt has not grown for {self.idle_timeout}s"
+            if reason is None:
+                continue
+
+            print(f"Kill job {job['key']} on {job['dev']}: {reason}")
+            job['state'] = 'timeout'
+            job['timeout'] = reason
+            try:
+                job['process'].kill()
+            except Exception:
+                traceback.print_exc()
+
+    def _next_job(self):
+        """
+        从队列中找出第一个设备空闲的任务。
+
+        没有指定设备的任务（分片模式）由第一台空闲设备领取，
+        因此先空闲下来的设备会继续取走剩余的任务；重试的任务优先交给还没有运行过它的设备。
+        还在重试退避时间内的任务会被跳过。
+
+        :return: (任务, 设备)，没有可运行的任务时返回 (None, None)。
+        """
+        if not self.idle_devices:
+            return None, None
+        now = time.time()
+        for job in self.queue:
+            if job.get('not_before', 0) > now:
+                continue
+            if job['dev'] is None:
+                tried = {attempt['dev'] for attempt in job.get('attempts', [])}
+                untried = [dev for dev in self.idle_devices if dev not in tried]
+                return job, (untried or self.idle_devices)[0]
+            if job['dev'] in self.idle_devices:
+                return job, job['dev']
+        return None, None
+
+    def _dispatch(self):
+        """
+        在并发上限内启动尽可能多的任务。
+        """
+        while len(self.running) < self.max_jobs:
+            job, dev = self._next_job()
+            if job is None:
+                return
+            self.queue.remove(job)
+            job['attempt'] = job.get('attempt', 0) + 1
+            try:
+                job['process'] = self.start_job(job, dev)
+            except Exception:
+                traceback.print_exc()
+                self.on_report(job, -1, {'status': -1, 'device': dev, 'path': ''})
+                continue
+            job['started'] = time.time()
+            self.idle_devices.remove(dev)
+            self.running.append(job)
+            self._notify(job, 'started')
+            if self.progress is not None:
+                self.progress.watch(job)
+
+    def _collect_finished(self, pool):
+        """
+        检查已经退出的测试进程，释放设备并立即提交报告任务。
+
+        :param pool: 生成报告的线程池。
+        """
+        for job in list(self.running):
+            status = job['process'].poll()
+            if status is None:
+                continue
+            self.running.remove(job)
+            self._notify(job, 'finished', status)
+            failed = self._record_attempt(job, status)
+            if self.progress is not None:
+                self.progress.finish(job, status)
+            if job.get('disconnected'):
+                # 设备已经断开，不生成报告，任务重新排队
+                self._requeue(job)
+                continue
+            if job['dev'] not in self.quarantined:
+                self.idle_devices.append(job['dev'])
+            if failed and self._retry(job):
+                continue
+            self.reports[pool.submit(self.report_job, job)] = (job, status)
+
+    def _finish_report(self, future):
+        """
+        处理生成完成的报告。
+
+        :param future: 报告任务对应的 Future。
+        """
+        job, status = self.reports.pop(future)
+        try:
+            report = future.result()
+        except Exception:
+            traceback.print_exc()
+            report = {'status': -1, 'device': job['dev'], 'path': ''}
+        self.on_report(job, status, report)
@@ -0,0 +1,108 @@
+# -*- encoding=utf-8 -*-
+# Duration-aware sharding of .air scripts across the device pool
+import os
+import json
+import traceback
+
+from scheduler import script_name
+from atomic_io import atomic_write
+
+durations_path = 'durations.json'
+
+
+def find_scripts(path):
+    """
+    查找路径下的所有Airtest脚本。
+
+    :param path: .air 脚本目录，或包含多个 .air 脚本的目录。
+    :return: 脚本路径列表。
+    """
+    if path.endswith('.air') or not os.path.isdir(path):
+        return [path]
+    return sorted(os.path.join(path, name) for name in os.listdir(path)
+                  if name.endswith('.air') and os.path.isdir(os.path.join(path, name)))
+
+
+def read_log_duration(log_txt):
+    """
+    根据 log.txt 中各步骤的 start_time/end_time 计算脚本的运行时长。
+
+    :param log_txt: log.txt 文件路径。
+    :return: 运行时长（秒），无法计算时返回 None。
+    """
+    start, end = None, None
+    try:
+        with open(log_txt, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    data = json.loads(line)['data']
+                    if 'start_time' in data and 'end_time' in data:
+                        start = data['start_time'] if start is None else min(start, data['start_time'])
+                        end = data['end_time'] if end is None else max(end, data['end_time'])
+                except Exception:
+                    # 如果行不是有效的JSON，忽略错误并继续
+                    continue
+    except FileNotFoundError:
+        return None
+    if start is None or end is None:
+        return None
+    return end - start
+
+
+def load_durations(path=None):
+    """
+    读取历史记录的脚本运行时长。
+
+    :param path: 时长记录文件路径，默认为 durations.json。
+    :return: {脚本名: 运行时长} 字典。
+    """
+    path = path or durations_path
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except Exception:
+        traceback.print_exc()
+        return {}
+
+
+def save_durations(durations, path=None):
+    """
+    原子地保存脚本运行时长，中途中断时保留上一次的记录。
+
+    :param durations: {脚本名: 运行时长} 字典。
+    :param path: 时长记录文件路径，默认为 durations.json。
+    """
+    with atomic_write(path or durations_path) as file:
+        json.dump(durations, file, indent=4, ensure_ascii=False)
+
+
+def record_durations(results, durations):
+    """
+    从本次运行成功的任务的 log.txt 中更新脚本运行时长。
+
+    :param results: 包含测试结果的字典。
+    :param durations: {脚本名: 运行时长} 字典，会被原地更新。
+    """
+    for item in results['tests'].values():
+        if item.get('status') != 0 or not item.get('script'):
+            continue
+        duration = read_log_duration(os.path.join(results['log_dir_path'], item['log_path']))
+        if duration is not None:
+            durations[script_name(item['script'])] = round(duration, 3)
+
+
+def make_shard_jobs(scripts, durations):
+    """
+    生成分片任务：每个脚本只运行一次，由任意空闲设备执行，按历史时长从长到短排列。
+
+    没有历史记录的脚本按已知最长时长估计，尽早开始，避免拖到最后。
+
+    :param scripts: Airtest脚本路径列表。
+    :param durations: {脚本名: 运行时长} 字典。
+    :return: 测试任务列表。
+    """
+    default = max(durations.values()) if durations else 0
+    ordered = sorted(scripts, key=lambda air: durations.get(script_name(air), default), reverse=True)
+    return [{'key': script_name(air), 'air': air, 'dev': None} for air in ordered]
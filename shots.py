@@ -0,0 +1,214 @@
+# -*- encoding=utf-8 -*-
+# Content-addressed screenshot store shared by all jobs of a run
+import io
+import os
+import sys
+import json
+import hashlib
+import threading
+import traceback
+
+try:
+    from PIL import Image
+except ImportError:
+    # Pillow 是 airtest 的依赖，一般都已安装；没有安装时只去重，不压缩
+    Image = None
+
+from atomic_io import atomic_write
+
+shots_dir_name = '_shots'
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png')
+
+
+class ShotStore:
+    """
+    按内容存放一次运行中的所有截图：内容完全相同的截图只保存一份，
+    log.txt 中的文件名改写为指向 _shots 目录的相对路径，报告生成时直接使用。
+
+    可选地把截图缩小到 max_size 并以 quality 重新编码为 JPEG。
+    """
+
+    def __init__(self, path, quality=None, max_size=None):
+        """
+        :param path: 截图存放目录，一般为 <运行目录>/_shots。
+        :param quality: 重新编码的 JPEG 质量（1~95），为 None 时保持原文件。
+        :param max_size: 截图长边的最大像素数，为 None 时不缩小。
+        """
+        self.path = path
+        self.quality = quality
+        self.max_size = max_size
+        self.lock = threading.Lock()
+
+    @property
+    def reencode(self):
+        """是否需要重新编码截图"""
+        return Image is not None and (self.quality is not None or self.max_size is not None)
+
+    def _encode(self, data, ext):
+        """
+        :param data: 原始图片内容。
+        :param ext: 原始扩展名。
+        :return: 缩小并重新编码后的 JPEG 内容；原图是更小的 JPEG 或编码失败时返回原始内容。
+        """
+        try:
+            image = Image.open(io.BytesIO(data))
+            if self.max_size is not None:
+                image.thumbnail((self.max_size, self.max_size))
+            output = io.BytesIO()
+            image.convert('RGB').save(output, 'JPEG', quality=self.quality or 75, optimize=True)
+            if ext.lower() in ('.jpg', '.jpeg') and output.tell() >= len(data):
+                return data
+            return output.getvalue()
+        except Exception:
+            traceback.print_exc()
+            return data
+
+    def put(self, data, ext):
+        """
+        保存一张截图，内容已经存在时直接返回已有的文件。
+
+        :param data: 图片内容。
+        :param ext: 原始扩展名。
+        :return: 截图在存放目录中的文件名。
+        """
+        name = hashlib.sha1(data).hexdigest() + ('.jpg' if self.reencode else ext.lower())
+        target = os.path.join(self.path, name)
+        with self.lock:
+            if os.path.isfile(target):
+                return name
+            os.makedirs(self.path, exist_ok=True)
+        content = self._encode(data, ext) if self.reencode else data
+        # 多个报告线程同时保存同一张截图时内容相同，替换不会产生问题
+        with atomic_write(target, 'wb') as file:
+            file.write(content)
+        return name
+
+    def process(self, log_dir):
+        """
+        把任务日志目录中被 log.txt 引用的截图移入存放目录，并改写 log.txt 中的引用。
+
+        :param log_dir: 任务的日志目录。
+        :return: (处理的截图数量, 这些截图原来的字节数)。
+        """
+        log_txt = os.path.join(log_dir, 'log.txt')
+        if not os.path.isfile(log_txt):
+            return 0, 0
+        with open(log_txt, 'r', encoding='utf-8') as file:
+            lines = file.readlines()
+
+        names = {name for name in os.listdir(log_dir)
+                 if os.path.splitext(name)[1].lower() in IMAGE_EXTS and os.path.isfile(os.path.join(log_dir, name))}
+        entries = [parse_line(line) for line in lines]
+        referenced = set()
+        for entry in entries:
+            if entry is not None:
+                collect_strings(entry, names, referenced)
+        if not referenced:
+            return 0, 0
+
+        mapping, original = {}, 0
+        prefix = os.path.relpath(self.path, log_dir).replace(os.sep, '/')
+        for name in referenced:
+            path = os.path.join(log_dir, name)
+            with open(path, 'rb') as file:
+                data = file.read()
+            stored = self.put(data, os.path.splitext(name)[1])
+            mapping[name] = f"{prefix}/{stored}"
+            original += len(data)
+
+        # 先写入新的 log.txt，再删除原来的截图，中途中断时报告仍然可以生成
+        with atomic_write(log_txt) as file:
+            for line, entry in zip(lines, entries):
+                if entry is None:
+                    file.write(line)
+                else:
+                    file.write(json.dumps(replace_strings(entry, mapping)) + '\n')
+
+        for name in referenced:
+            stem, ext = os.path.splitext(name)
+            for path in (os.path.join(log_dir, name), os.path.join(log_dir, f"{stem}_small{ext}")):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return len(referenced), original
+
+
+def parse_line(line):
+    """
+    :param line: log.txt 中的一行。
+    :return: 解析后的日志记录，无法解析时返回 None。
+    """
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+def collect_strings(value, names, found):
+    """
+    找出日志记录中引用的截图文件名。
+
+    :param value: 日志记录或其中的值。
+    :param names: 日志目录中的截图文件名集合。
+    :param found: 找到的文件名会加入这个集合。
+    """
+    if isinstance(value, str):
+        if value in names:
+            found.add(value)
+    elif isinstance(value, dict):
+        for item in value.values():
+            collect_strings(item, names, found)
+    elif isinstance(value, list):
+        for item in value:
+            collect_strings(item, names, found)
+
+
+def replace_strings(value, mapping):
+    """
+    :param value: 日志记录或其中的值。
+    :param mapping: {原文件名: 新路径} 字典。
+    :return: 替换了截图路径的日志记录。
+    """
+    if isinstance(value, str):
+        return mapping.get(value, value)
+    if isinstance(value, dict):
+        return {key: replace_strings(item, mapping) for key, item in value.items()}
+    if isinstance(value, list):
+        return [replace_strings(item, mapping) for item in value]
+    return value
+
+
+def process_run(run_dir, quality=None, max_size=None):
+    """
+    对已经存在的运行目录做截图去重和压缩。
+
+    :param run_dir: 运行目录，例如 result/2024_11_27_18_33_44。
+    :param quality: 重新编码的 JPEG 质量，为 None 时保持原文件。
+    :param max_size: 截图长边的最大像素数，为 None 时不缩小。
+    :return: (处理的截图数量, 原始字节数, 存放目录的字节数)。
+    """
+    store = ShotStore(os.path.join(run_dir, shots_dir_name), quality, max_size)
+    count, original = 0, 0
+    for root, dirs, files in os.walk(run_dir):
+        dirs[:] = [name for name in dirs if name != shots_dir_name]
+        if 'log.txt' in files:
+            shots, size = store.process(root)
+            count += shots
+            original += size
+    stored = sum(os.path.getsize(os.path.join(store.path, name)) for name in os.listdir(store.path)) \
+        if os.path.isdir(store.path) else 0
+    return count, original, stored
+
+
+if __name__ == '__main__':
+    # 用法：python shots.py <运行目录> [JPEG质量] [长边像素]
+    if len(sys.argv) < 2:
+        print("usage: python shots.py <run_dir> [quality] [max_size]")
+        raise SystemExit(1)
+    count, original, stored = process_run(
+        sys.argv[1],
+        int(sys.argv[2]) if len(sys.argv) > 2 else None,
+        int(sys.argv[3]) if len(sys.argv) > 3 else None,
+    )
+    print(f"{count} screenshots, {original} bytes -> {stored} bytes")
@@ -16,7 +16,7 @@ if PKG not in device().list_app():
 stop_app(PKG)
 wake()
 start_app(PKG)
-sleep(2)
+# touch 会等待按钮出现，不需要在启动后固定等待
 touch(Template(r"tpl1499240443959.png", record_pos=(0.22, -0.165), resolution=(2560, 1536)))
 
 assert_exists(Template(r"tpl1499240472304.png", record_pos=(0.0, -0.094), resolution=(2560, 1536)), "请下注")
@@ -0,0 +1,225 @@
+# -*- encoding=utf-8 -*-
+# AdbClient against an in-process fake adb server speaking the host protocol
+import time
+import socket
+import threading
+import socketserver
+
+import pytest
+
+from devices.AdbClient import AdbClient, AdbError, parse_devices
+
+
+class FakeAdbServer(socketserver.ThreadingTCPServer):
+    """
+    模拟 adb 服务的 host 协议：请求为 4 位十六进制长度前缀加服务名，应答为 OKAY/FAIL，
+    host 服务的应答和 FAIL 的原因同样带长度前缀，shell 的输出直接写到连接上直到关闭。
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeAdbHandler)
+        self.devices = {'emulator-5554': 'device', 'R58M123': 'offline'}
+        # shell 命令 -> 输出数据块列表
+        self.shell_output = {}
+        self.shell_delay = 0
+        self.track_snapshots = []
+        self.requests = []
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+class FakeAdbHandler(socketserver.BaseRequestHandler):
+
+    def read_request(self):
+        size = self.read_exact(4)
+        if not size:
+            return None
+        return self.read_exact(int(size, 16)).decode('utf-8')
+
+    def read_exact(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                return data
+            data += chunk
+        return data
+
+    def send_okay(self, message=None):
+        self.request.sendall(b'OKAY' + (self.frame(message) if message is not None else b''))
+
+    def send_fail(self, reason):
+        self.request.sendall(b'FAIL' + self.frame(reason))
+
+    @staticmethod
+    def frame(message):
+        payload = message.encode('utf-8')
+        return b'%04x' % len(payload) + payload
+
+    @staticmethod
+    def device_list(devices):
+        return ''.join(f"{serial}\t{state}\n" for serial, state in devices.items())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        try:
+            self.serve_request(server)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def serve_request(self, server):
+        service = self.read_request()
+        server.requests.append(service)
+        if service == 'host:version':
+            self.send_okay('0029')
+        elif service == 'host:devices':
+            self.send_okay(self.device_list(server.devices))
+        elif service == 'host:junk':
+            self.request.sendall(b'WHAT')
+        elif service == 'host:truncated':
+            self.request.sendall(b'OKAY0010abc')
+        elif service == 'host:track-devices':
+            self.request.sendall(b'OKAY')
+            for snapshot in server.track_snapshots:
+                self.request.sendall(self.frame(self.device_list(snapshot)))
+        elif service.startswith('host:transport:'):
+            serial = service[len('host:transport:'):]
+            if server.devices.get(serial) != 'device':
+                self.send_fail(f"device '{serial}' not found")
+                return
+            self.send_okay()
+            command = self.read_request()
+            server.requests.append(command)
+            if not command or not command.startswith('shell:'):
+                self.send_fail(f"unsupported service {command}")
+                return
+            self.send_okay()
+            time.sleep(server.shell_delay)
+            for chunk in server.shell_output.get(command[len('shell:'):], []):
+                self.request.sendall(chunk)
+        else:
+            self.send_fail(f"unknown host service '{service}'")
+
+
+@pytest.fixture
+def adb_server():
+    server = FakeAdbServer()
+    server.thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(adb_server):
+    return AdbClient(port=adb_server.port, timeout=5)
+
+
+def test_query_reads_length_prefixed_reply(client, adb_server):
+    assert client.query('host:version') == '0029'
+    assert adb_server.requests == ['host:version']
+
+
+def test_devices(client):
+    assert client.devices() == [('emulator-5554', 'device'), ('R58M123', 'offline')]
+
+
+def test_fail_raises_with_reason(client):
+    with pytest.raises(AdbError, match="unknown host service 'host:nope'"):
+        client.query('host:nope')
+
+
+def test_unexpected_status(client):
+    with pytest.raises(AdbError, match='unexpected adb response'):
+        client.query('host:junk')
+
+
+def test_connection_closed_mid_message(client):
+    with pytest.raises(AdbError, match='closed the connection'):
+        client.query('host:truncated')
+
+
+def test_request_framing(adb_server):
+    with socket.create_connection(('127.0.0.1', adb_server.port), timeout=5) as sock:
+        AdbClient()._request(sock, 'host:devices')
+        size = int(AdbClient._read_exact(sock, 4), 16)
+        assert AdbClient._read_exact(sock, size).decode('utf-8').startswith('emulator-5554\t')
+    assert adb_server.requests == ['host:devices']
+
+
+def test_transport_to_unknown_device_fails(client):
+    with pytest.raises(AdbError, match="device 'missing' not found"):
+        client.shell('missing', 'echo hi')
+
+
+def test_shell_switches_transport_then_runs_command(client, adb_server):
+    adb_server.shell_output['getprop ro.product.model'] = [b'Pixel 7\n']
+    assert client.shell('emulator-5554', 'getprop ro.product.model') == 'Pixel 7\n'
+    assert adb_server.requests == ['host:transport:emulator-5554', 'shell:getprop ro.product.model']
+
+
+def test_shell_stream_yields_until_close(client, adb_server):
+    chunks = [b'line 1\n', b'line 2\n', '中文\n'.encode('utf-8')]
+    adb_server.shell_output['logcat'] = chunks
+    received = b''.join(client.shell_stream('emulator-5554', 'logcat', chunk_size=4))
+    assert received == b''.join(chunks)
+
+
+def test_shell_timeout_bounds_a_hung_command(client, adb_server):
+    adb_server.shell_output['am start -W'] = [b'Status: ok\n']
+    adb_server.shell_delay = 2
+    start = time.time()
+    with pytest.raises(TimeoutError):
+        client.shell('emulator-5554', 'am start -W', timeout=0.2)
+    assert time.time() - start < 1
+
+
+def test_shell_respects_max_connections(adb_server):
+    client = AdbClient(port=adb_server.port, timeout=5, max_connections=2)
+    adb_server.shell_output['sleep'] = [b'done']
+    adb_server.shell_delay = 0.2
+    threads = [threading.Thread(target=client.shell, args=('emulator-5554', 'sleep')) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert adb_server.peak == 2
+
+
+def test_track_devices_yields_each_snapshot(client, adb_server):
+    adb_server.track_snapshots = [
+        {'emulator-5554': 'device'},
+        {'emulator-5554': 'device', 'R58M123': 'device'},
+        {},
+    ]
+    tracker = client.track_devices()
+    assert next(tracker) == [('emulator-5554', 'device')]
+    assert next(tracker) == [('emulator-5554', 'device'), ('R58M123', 'device')]
+    assert next(tracker) == []
+    tracker.close()
+
+
+def test_track_devices_ends_with_error_when_server_closes(client, adb_server):
+    adb_server.track_snapshots = [{'emulator-5554': 'device'}]
+    tracker = client.track_devices()
+    assert next(tracker) == [('emulator-5554', 'device')]
+    with pytest.raises(AdbError):
+        next(tracker)
+
+
+def test_parse_devices_ignores_blank_and_malformed_lines():
+    assert parse_devices('a\tdevice\n\nnot a device line\nb\tunauthorized \n') == [
+        ('a', 'device'), ('b', 'unauthorized')]
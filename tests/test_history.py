@@ -0,0 +1,52 @@
+# -*- encoding=utf-8 -*-
+# Incremental history indexing: finished runs are skipped without rescanning their logs
+import os
+import json
+
+import history
+
+
+def make_run(root, name, devices):
+    """
+    :return: 运行目录，包含 results.json 和每台设备的 log.txt。
+    """
+    run_dir = root / name
+    tests = {}
+    for dev in devices:
+        (run_dir / dev).mkdir(parents=True)
+        (run_dir / dev / 'log.txt').write_text(
+            json.dumps({'tag': 'function', 'depth': 1, 'time': 2.0,
+                        'data': {'name': 'touch', 'start_time': 1.0, 'end_time': 2.0}}) + '\n', encoding='utf-8')
+        tests[dev] = {'dev': dev, 'script': 'demo.air', 'status': 0, 'log_path': os.path.join('.', dev, 'log.txt')}
+    (run_dir / history.run_results_file).write_text(json.dumps({'script': 'demo.air', 'tests': tests}),
+                                                    encoding='utf-8')
+    return run_dir
+
+
+def test_finished_runs_are_not_rescanned(tmp_path, monkeypatch):
+    root = tmp_path / 'result'
+    csv_path, index_path = str(tmp_path / 'history.csv'), str(tmp_path / 'history.index.json')
+    make_run(root, '2024_01_01_00_00_00', ['A', 'B'])
+    scanned = []
+    find_run_logs = history.find_run_logs
+    monkeypatch.setattr(history, 'find_run_logs', lambda run_dir: scanned.append(run_dir) or find_run_logs(run_dir))
+
+    assert history.index_history(str(root), csv_path, index_path) > 0
+    assert len(scanned) == 1
+
+    make_run(root, '2024_01_02_00_00_00', ['A'])
+    history.index_history(str(root), csv_path, index_path)
+    assert [os.path.basename(run_dir) for run_dir in scanned[1:]] == ['2024_01_02_00_00_00']
+
+    # 继续运行后 results.json 会重新写入，这次运行需要重新扫描
+    results_path = root / '2024_01_01_00_00_00' / history.run_results_file
+    os.utime(results_path, (1, 1))
+    history.index_history(str(root), csv_path, index_path)
+    assert os.path.basename(scanned[-1]) == '2024_01_01_00_00_00'
+    assert len(history.load_history(csv_path)) == 6
+
+
+def test_old_index_format_is_upgraded(tmp_path):
+    index_path = tmp_path / 'history.index.json'
+    index_path.write_text(json.dumps({'result/run/A/log.txt': 1.5}), encoding='utf-8')
+    assert history.load_index(str(index_path)) == {'logs': {'result/run/A/log.txt': 1.5}, 'runs': {}}
@@ -0,0 +1,82 @@
+# -*- encoding=utf-8 -*-
+# Two runs sharing one result cache: the second run links the cached reports into its summary
+import os
+
+import pytest
+
+import run
+from dashboard import summarize_run
+from journal import RunJournal
+from result_cache import ResultCache
+
+DEVICES = ['emulator-5554', 'emulator-5556', 'R58M123', 'R58M456']
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(run, 'run_journal', RunJournal(str(tmp_path / 'data.json'), fsync=False))
+    air = tmp_path / 'demo.air'
+    air.mkdir()
+    (air / 'demo.py').write_text('# demo\n', encoding='utf-8')
+    return tmp_path, str(air)
+
+
+def make_cache(path):
+    """
+    :param path: 缓存文件路径。
+    :return: 不读取真实设备的 ResultCache，所有设备的指纹固定。
+    """
+    cache = ResultCache(str(path))
+    cache.fingerprints = {dev: ('google/sdk/emu:13/TE1A/1:userdebug/test-keys', '42') for dev in DEVICES}
+    return cache
+
+
+def run_once(root, air, cache, index):
+    """
+    模拟一次运行：跳过缓存命中的任务，其余任务成功完成，返回这次运行的测试数据。
+    """
+    log_dir = root / 'result' / f'run_{index}'
+    log_dir.mkdir(parents=True)
+    results = {'start': 0, 'script': air, 'log_dir_path': str(log_dir), 'tests': {}}
+    jobs = run.skip_cached_jobs(run.make_jobs([air], DEVICES), results, cache)
+    for job in jobs:
+        job_dir = log_dir / job['key']
+        job_dir.mkdir()
+        (job_dir / 'log.html').write_text('<html></html>', encoding='utf-8')
+        job['path'] = str(job_dir)
+        job['attempts'] = [{'attempt': 1, 'dev': job['dev'], 'state': 'success', 'duration': 3.5,
+                            'rel_path': job['key']}]
+        report = {'device_name': job['dev'], 'path': os.path.join(job['key'], 'log.html'),
+                  'log_path': os.path.join(job['key'], 'log.txt')}
+        run.save_job_result(results, job, 0, report, cache)
+    return results, jobs
+
+
+def test_cached_results_count_as_success(workspace):
+    root, air = workspace
+    cache = make_cache(root / 'result_cache.json')
+    first, jobs = run_once(root, air, cache, 1)
+    assert len(jobs) == len(DEVICES)
+    assert summarize_run(first, run.results_index(first))['success'] == len(DEVICES)
+
+    # 第二次运行重新读取缓存文件
+    cache.save()
+    second, jobs = run_once(root, air, make_cache(root / 'result_cache.json'), 2)
+    assert jobs == []
+    rows = run.results_index(second)
+    assert {row['state'] for row in rows} == {'cached'}
+    summary = summarize_run(second, rows)
+    assert summary['success'] == summary['count'] == len(DEVICES)
+    assert summary['brands'] == {'NULL': [len(DEVICES), len(DEVICES)]}
+
+
+def test_cached_results_do_not_copy_previous_attempts(workspace):
+    root, air = workspace
+    cache = make_cache(root / 'result_cache.json')
+    run_once(root, air, cache, 1)
+    second, _ = run_once(root, air, cache, 2)
+    for item in second['tests'].values():
+        assert 'attempts' not in item
+    for row in run.results_index(second):
+        assert row['attempts'] == [] and row['duration'] is None
@@ -0,0 +1,180 @@
+# -*- encoding=utf-8 -*-
+# Low-overhead phase tracer exported as Chrome trace / Perfetto JSON
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+from atomic_io import atomic_write
+
+trace_file = 'trace.json'
+trace_summary_file = 'trace.txt'
+
+# 主线程的泳道名
+MAIN_LANE = 'run'
+
+# 这些分类的 span 会互相重叠（例如多个任务同时排队），导出为异步事件，各自显示在单独的轨道上
+ASYNC_CATEGORIES = ('queue',)
+
+
+class Tracer:
+    """
+    记录运行中各阶段的耗时，导出为 Chrome trace 格式（可以用 chrome://tracing 或 ui.perfetto.dev 打开）。
+
+    每个 span 只在结束时向列表追加一条记录，不加锁也不做格式化，对运行几乎没有影响。
+    span 默认放在当前线程的泳道上，也可以指定泳道，例如把同一台设备上的任务放在一起。
+    """
+
+    def __init__(self, max_events=100000):
+        """
+        :param max_events: 最多保存的记录数，超出后丢弃新的记录，避免长时间运行时占用过多内存。
+        """
+        self.enabled = True
+        self.max_events = max_events
+        self.events = []
+        self.dropped = 0
+
+    @staticmethod
+    def now():
+        """
+        :return: 当前时间，用于 add 的开始和结束时间。
+        """
+        return time.perf_counter()
+
+    def add(self, name, start, end, cat='phase', lane=None, **args):
+        """
+        记录一个已经结束的 span。
+
+        :param name: 名称。
+        :param start: 开始时间（Tracer.now）。
+        :param end: 结束时间（Tracer.now）。
+        :param cat: 分类，例如 phase、job、adb。
+        :param lane: 泳道名，为 None 时使用当前线程。
+        :param args: 附加属性，例如 dev、script。
+        """
+        if not self.enabled:
+            return
+        if len(self.events) >= self.max_events:
+            self.dropped += 1
+            return
+        if lane is None:
+            thread = threading.current_thread()
+            lane = MAIN_LANE if thread is threading.main_thread() else thread.name
+        self.events.append((name, cat, start, end, lane, args))
+
+    @contextmanager
+    def span(self, name, cat='phase', lane=None, **args):
+        """
+        记录 with 语句块的耗时。
+
+        :param name: 名称。
+        :param cat: 分类。
+        :param lane: 泳道名，为 None 时使用当前线程。
+        :param args: 附加属性，with 语句块中可以通过返回的字典继续添加。
+        """
+        if not self.enabled:
+            yield args
+            return
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            self.add(name, start, time.perf_counter(), cat, lane, **args)
+
+    def clear(self):
+        """
+        清空记录。
+        """
+        self.events = []
+        self.dropped = 0
+
+    def to_chrome_trace(self):
+        """
+        :return: Chrome trace 格式的字典，每个泳道是一个线程。
+        """
+        events = list(self.events)
+        origin = min((event[2] for event in events), default=0)
+        lanes = {}
+        trace_events = []
+        for index, (name, cat, start, end, lane, args) in enumerate(events):
+            tid = lanes.setdefault(lane, len(lanes) + 1)
+            event = {'name': name, 'cat': cat, 'pid': 1, 'tid': tid, 'ts': round((start - origin) * 1e6, 1),
+                     'args': {key: str(value) for key, value in args.items()}}
+            if cat in ASYNC_CATEGORIES:
+                trace_events.append({**event, 'ph': 'b', 'id': index})
+                trace_events.append({**event, 'ph': 'e', 'id': index, 'ts': round((end - origin) * 1e6, 1),
+                                     'args': {}})
+            else:
+                trace_events.append({**event, 'ph': 'X', 'dur': round((end - start) * 1e6, 1)})
+        trace_events.append({'name': 'process_name', 'ph': 'M', 'pid': 1, 'args': {'name': 'airtest run'}})
+        for lane, tid in lanes.items():
+            trace_events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': lane}})
+            # 主线程排在最前面，其余泳道按出现顺序排列
+            trace_events.append({'name': 'thread_sort_index', 'ph': 'M', 'pid': 1, 'tid': tid,
+                                 'args': {'sort_index': 0 if lane == MAIN_LANE else tid}})
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms',
+                'otherData': {'dropped': self.dropped}}
+
+    def save(self, path):
+        """
+        把记录原子地写入 Chrome trace 文件。
+
+        :param path: 文件路径。
+        """
+        with atomic_write(path) as file:
+            json.dump(self.to_chrome_trace(), file, ensure_ascii=False)
+
+    def critical_path(self, top=8):
+        """
+        生成耗时分析的文本。
+
+        包括主线程上各阶段的耗时、最后结束的任务从排队到生成报告的路径（决定了调度阶段的总时长），
+        以及各类 span 的累计耗时。
+
+        :param top: 累计耗时最多显示的行数。
+        :return: 多行文本。
+        """
+        events = list(self.events)
+        if not events:
+            return ''
+        begin = min(event[2] for event in events)
+        total = max(event[3] for event in events) - begin
+        lines = [f"总耗时 {total:.2f}s"]
+
+        # 主线程上的顶层阶段：不被其他阶段包含的 span
+        phases = sorted((event for event in events if event[4] == MAIN_LANE and event[1] == 'phase'),
+                        key=lambda event: (event[2], -event[3]))
+        lines.append("阶段：")
+        last_end = None
+        for name, cat, start, end, lane, args in phases:
+            if last_end is not None and end <= last_end:
+                continue
+            last_end = end
+            lines.append(f"  {name:<20}{end - start:>10.2f}s {100 * (end - start) / total if total else 0:>6.1f}%")
+
+        # 调度阶段在最后一个任务的报告生成后结束，这个任务的各个环节就是关键路径
+        jobs = [event for event in events if event[1] in ('job', 'queue')]
+        if jobs:
+            key = max(jobs, key=lambda event: event[3])[5].get('key')
+            chain = sorted((event for event in jobs if event[5].get('key') == key), key=lambda event: event[2])
+            lines.append(f"关键路径（最后结束的任务 {key}）：")
+            for name, cat, start, end, lane, args in chain:
+                attrs = ' '.join(f"{k}={args[k]}" for k in ('dev', 'script', 'attempt') if args.get(k) is not None)
+                lines.append(f"  {name:<20}{end - start:>10.2f}s  +{start - begin:.2f}s  {attrs}")
+
+        totals = {}
+        for name, cat, start, end, lane, args in events:
+            item = totals.setdefault((cat, name), [0, 0.0, 0.0])
+            item[0] += 1
+            item[1] += end - start
+            item[2] = max(item[2], end - start)
+        lines.append("累计耗时：")
+        for (cat, name), (count, spent, longest) in sorted(totals.items(), key=lambda item: -item[1][1])[:top]:
+            lines.append(f"  {cat + '/' + name:<20}{spent:>10.2f}s  {count}次  最长{longest:.2f}s")
+        if self.dropped:
+            lines.append(f"超出记录上限，丢弃了{self.dropped}条记录")
+        return '\n'.join(lines)
+
+
+# 进程内共用的 Tracer
+tracer = Tracer()
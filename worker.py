@@ -0,0 +1,294 @@
+# -*- encoding=utf-8 -*-
+# Long-lived Airtest worker processes, one per device
+#
+# 每个工作进程只导入一次 airtest 并保持设备连接，通过标准输入接收要运行的脚本，
+# 按照 airtest run 相同的目录结构写入日志，通过标准输出返回运行结果（每行一个 JSON）。
+import os
+import sys
+import json
+import queue
+import threading
+import traceback
+import subprocess
+
+
+class WorkerJob:
+    """
+    在工作进程中运行的一个测试任务，提供与 subprocess.Popen 相同的 poll()/kill() 接口。
+
+    如果工作进程启动失败，会自动改用 airtest run 子进程运行该任务。
+    """
+
+    def __init__(self, worker, fallback_cmd):
+        self.worker = worker
+        self.fallback_cmd = fallback_cmd
+        self.fallback = None
+        self.killed = False
+
+    def poll(self):
+        """
+        检查任务是否结束。
+
+        :return: 任务的退出码，仍在运行时返回 None。
+        """
+        if self.fallback is not None:
+            return self.fallback.poll()
+
+        if self.killed:
+            # 任务已经被超时或设备断开终止，不能再启动回退进程
+            return -1
+
+        status = self.worker.poll_result()
+        if status is not None:
+            return status
+
+        if self.worker.start_failed:
+            # 工作进程无法启动，回退到 airtest run 子进程
+            print(f"Warm worker for {self.worker.dev} is not available, fallback to airtest run")
+            self.fallback = subprocess.Popen(self.fallback_cmd, cwd=os.getcwd())
+            return None
+
+        if self.worker.process.poll() is not None:
+            # 工作进程在运行脚本时意外退出
+            return -1
+        return None
+
+    def kill(self):
+        """
+        终止任务。工作进程会被一起终止，下一个任务会重新启动工作进程。
+        """
+        self.killed = True
+        if self.fallback is not None:
+            self.fallback.kill()
+        else:
+            self.worker.kill()
+
+
+class WarmWorker:
+    """
+    单台设备的常驻工作进程。
+    """
+
+    def __init__(self, dev):
+        """
+        :param dev: 设备序列号。
+        """
+        self.dev = dev
+        self.ready = False
+        self.failed = False
+        # 工作进程自己启动失败（连接设备失败或在就绪前退出），被 kill() 终止的不算
+        self.start_failed = False
+        self.killed = False
+        self.messages = queue.Queue()
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), f"Android:///{dev}"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=os.getcwd(),
+            text=True,
+            encoding='utf-8',
+            bufsize=1,
+        )
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+
+    def _read(self):
+        """
+        在后台线程中读取工作进程的输出。
+        """
+        for line in self.process.stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if 'ready' in message:
+                self.ready = message['ready']
+                self.failed = not message['ready']
+                self.start_failed = self.failed
+                if self.failed:
+                    print(f"Warm worker for {self.dev} failed to start: {message.get('error')}")
+            else:
+                self.messages.put(message)
+        if not self.ready:
+            self.failed = True
+            self.start_failed = not self.killed
+
+    def alive(self):
+        """
+        :return: 工作进程是否可以继续接收任务。
+        """
+        return not self.failed and self.process.poll() is None
+
+    def run(self, air, log_dir, recording=True):
+        """
+        发送一个要运行的脚本。
+
+        :param air: Airtest脚本的路径。
+        :param log_dir: 日志目录。
+        :param recording: 是否录屏。
+        """
+        request = {'script': air, 'log': log_dir, 'recording': recording}
+        self.process.stdin.write(json.dumps(request) + '\n')
+        self.process.stdin.flush()
+
+    def poll_result(self):
+        """
+        :return: 当前脚本的退出码，仍在运行时返回 None。
+        """
+        try:
+            return self.messages.get_nowait()['status']
+        except queue.Empty:
+            return None
+
+    def kill(self):
+        """
+        终止工作进程。
+        """
+        self.killed = True
+        self.failed = True
+        self.process.kill()
+
+    def close(self):
+        """
+        通知工作进程退出。
+        """
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=10)
+        except Exception:
+            self.process.kill()
+
+
+class WorkerPool:
+    """
+    按设备管理常驻工作进程。
+    """
+
+    def __init__(self):
+        self.workers = {}
+        self.fallback_devices = set()
+
+    def start(self, dev, air, log_dir, fallback_cmd, recording=True):
+        """
+        在设备的工作进程中运行脚本，工作进程不存在时自动启动。
+
+        :param dev: 设备序列号。
+        :param air: Airtest脚本的路径。
+        :param log_dir: 日志目录。
+        :param fallback_cmd: 工作进程不可用时使用的 airtest run 命令。
+        :param recording: 是否录屏。
+        :return: 带有 poll()/kill() 的任务对象。
+        """
+        if dev in self.fallback_devices:
+            return subprocess.Popen(fallback_cmd, cwd=os.getcwd())
+
+        worker = self.workers.get(dev)
+        if worker is not None and not worker.alive():
+            if worker.start_failed:
+                # 工作进程从未成功启动，之后这台设备都使用 airtest run
+                self.fallback_devices.add(dev)
+                return subprocess.Popen(fallback_cmd, cwd=os.getcwd())
+            worker = None
+        if worker is None:
+            worker = self.workers[dev] = WarmWorker(dev)
+
+        worker.run(air, log_dir, recording)
+        return WorkerJob(worker, fallback_cmd)
+
+    def close(self):
+        """
+        关闭所有工作进程。
+        """
+        for worker in self.workers.values():
+            worker.close()
+        self.workers.clear()
+
+
+def run_script(air, log_dir, recording=True):
+    """
+    在当前进程中运行一个 Airtest 脚本，行为与 airtest run 相同。
+
+    :param air: Airtest脚本的路径。
+    :param log_dir: 日志目录。
+    :param recording: 是否录屏。
+    :return: 退出码，成功为0，失败为-1。
+    """
+    from airtest.core.api import G, log
+    from airtest.core.helper import set_logdir
+
+    air = os.path.abspath(air)
+    pyfilepath = os.path.join(air, os.path.basename(air).replace('.air', '.py'))
+    with open(pyfilepath, 'r', encoding='utf-8') as file:
+        code = file.read()
+
+    # 每个脚本使用独立的模板目录和日志文件
+    del G.BASEDIR[:]
+    G.BASEDIR.append(air)
+    set_logdir(log_dir)
+
+    if recording:
+        for dev in G.DEVICE_LIST:
+            try:
+                dev.start_recording()
+            except Exception:
+                traceback.print_exc()
+
+    status = 0
+    scope = {'__name__': '__main__', '__file__': pyfilepath}
+    try:
+        exec(compile(code.encode('utf-8'), pyfilepath, 'exec'), scope)
+    except Exception as err:
+        traceback.print_exc()
+        try:
+            log(err, desc="Final Error", snapshot=True)
+        except Exception:
+            traceback.print_exc()
+        status = -1
+    finally:
+        if recording:
+            for k, dev in enumerate(G.DEVICE_LIST):
+                try:
+                    dev.stop_recording(output=os.path.join(log_dir, "recording_%d.mp4" % k))
+                except Exception:
+                    traceback.print_exc()
+        G.LOGGER.set_logfile(None)
+    return status
+
+
+def main(device_uri):
+    """
+    工作进程入口：连接设备后循环执行标准输入发来的脚本。
+
+    :param device_uri: 设备连接字符串，例如 Android:///serial。
+    """
+    # 协议输出使用原来的标准输出，脚本中的 print 都重定向到标准错误
+    channel = os.fdopen(os.dup(sys.stdout.fileno()), 'w', encoding='utf-8', buffering=1)
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    def send(message):
+        channel.write(json.dumps(message) + '\n')
+        channel.flush()
+
+    try:
+        from airtest.core.api import connect_device
+        connect_device(device_uri)
+    except Exception as e:
+        traceback.print_exc()
+        send({'ready': False, 'error': str(e)})
+        return
+    send({'ready': True})
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        try:
+            status = run_script(request['script'], request['log'], request.get('recording', True))
+        except Exception:
+            traceback.print_exc()
+            status = -1
+        send({'status': status})
+
+
+if __name__ == '__main__':
+    main(sys.argv[1])